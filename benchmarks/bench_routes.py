@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""Benchmark every dashboard API route against a local ERMrest stand-in
+
+Starts benchmarks/fake_ermrest.py in-process, points the API at it
+(through a generated DASHBOARD_CONFIG file), then requests each GET route
+of the Flask app --iterations times through the test client and reports,
+per route, latency percentiles, upstream (ERMrest/authn) calls per
+request and peak Python memory allocated while serving the request.
+
+Route parameters are filled in from SAMPLE_ARGS (and the first DCC id
+returned by /dcc), so new routes are picked up automatically; routes
+with parameters not in SAMPLE_ARGS are reported as skipped.
+
+Requires the API's own dependencies (flask, deriva-py, cfde-deriva),
+but no DERIVA deployment.
+
+Usage: python benchmarks/bench_routes.py [--iterations 20] [--rows 1000] [--latency-ms 5]
+                                         [--config PIN_SNAPTIME=True] [--json results.json]
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_ermrest
+
+# values substituted for route parameters, by parameter name
+SAMPLE_ARGS = {
+    'catalog_id': 1,
+    'variable': 'files',
+    'grouping': 'anatomy',
+    'grouping1': 'anatomy',
+    'grouping2': 'data_type',
+    'maxgroups1': 5,
+    'maxgroups2': 5,
+}
+
+# additional query-string variants of some routes
+VARIANTS = {
+    '/stats/<string:variable>/<string:grouping1>/<string:grouping2>': ['includeDCC=true'],
+}
+
+def write_config(server, config):
+    """Write an API config file pointing at the stand-in server; returns its path"""
+    workdir = tempfile.mkdtemp(prefix='dashboard-bench-')
+    settings = {
+        'DERIVA_SERVERNAME': '127.0.0.1:%d' % server.server_address[1],
+        'DERIVA_SCHEME': 'http',
+        'CACHE_DB': os.path.join(workdir, 'cache.sqlite'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'PROFILE_DIR': os.path.join(workdir, 'profiles'),
+        'ADMISSION_DIR': os.path.join(workdir, 'admission'),
+    }
+    settings.update(config)
+    config_file = os.path.join(workdir, 'dashboard.conf')
+    with open(config_file, 'w') as f:
+        for k, v in settings.items():
+            f.write('%s = %r\n' % (k, v))
+    return config_file
+
+def load_app(server, config):
+    """Import the API configured to use the stand-in server; returns the Flask app"""
+    os.environ['DASHBOARD_CONFIG'] = write_config(server, config)
+    from dashboard.dashboard_api import app
+    return app
+
+def route_paths(app, dcc_id):
+    """Returns ([(rule, path)], [skipped rules]) for every GET route of app"""
+    args = dict(SAMPLE_ARGS, dcc_id=dcc_id)
+    paths = []
+    skipped = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if 'GET' not in rule.methods or rule.endpoint == 'static':
+            continue
+        if not rule.arguments.issubset(args):
+            skipped.append(rule.rule)
+            continue
+        path = rule.build({ k: args[k] for k in rule.arguments }, append_unknown=False)[1]
+        paths.append((rule.rule, path))
+        for query in VARIANTS.get(rule.rule, []):
+            paths.append((rule.rule, path + '?' + query))
+    return paths, skipped
+
+def percentile(values, p):
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+def bench_path(client, catalogs, path, iterations, warmup):
+    for i in range(warmup):
+        client.get(path)
+
+    latencies = []
+    upstream_calls = []
+    peaks = []
+    statuses = set()
+    for i in range(iterations):
+        catalogs.reset()
+        tracemalloc.reset_peak()
+        start_mem = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        res = client.get(path)
+        res.get_data()
+        latencies.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1] - start_mem)
+        upstream_calls.append(catalogs.stats().get('total', 0))
+        statuses.add(res.status_code)
+
+    return {
+        'path': path,
+        'status': sorted(statuses),
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'upstream_calls': statistics.mean(upstream_calls),
+        'peak_kib': max(peaks) / 1024.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20, help="measured requests per route")
+    parser.add_argument('--warmup', type=int, default=1, help="unmeasured requests per route before measuring")
+    parser.add_argument('--route', action='append', default=[], help="only benchmark paths containing this string")
+    parser.add_argument('--config', action='append', default=[], metavar='KEY=VALUE',
+                        help="API setting (Python literal value), e.g. PIN_SNAPTIME=True (repeatable)")
+    parser.add_argument('--json', default=None, help="also write results to this file")
+    fake_ermrest.add_arguments(parser)
+    args = parser.parse_args()
+
+    server, catalogs = fake_ermrest.start_from_args(args)
+    config = { k: ast.literal_eval(v) for k, v in (c.split('=', 1) for c in args.config) }
+    app = load_app(server, config)
+    client = app.test_client()
+
+    dccs = client.get('/dcc').get_json(force=True, silent=True) or []
+    paths, skipped = route_paths(app, dccs[0]['id'] if dccs else 'cfde_dcc:1')
+    if args.route:
+        paths = [(rule, path) for rule, path in paths if any(r in path for r in args.route)]
+
+    tracemalloc.start()
+    results = [bench_path(client, catalogs, path, args.iterations, args.warmup) for rule, path in paths]
+    tracemalloc.stop()
+    server.shutdown()
+
+    print("%-70s %6s %9s %9s %9s %9s %10s" % ('path', 'status', 'p50 ms', 'p90 ms', 'p99 ms', 'upstream', 'peak KiB'))
+    for r in results:
+        print("%-70s %6s %9.1f %9.1f %9.1f %9.1f %10.1f" % (
+            r['path'][:70], ','.join(str(s) for s in r['status']),
+            r['p50_ms'], r['p90_ms'], r['p99_ms'], r['upstream_calls'], r['peak_kib']))
+    for rule in skipped:
+        print("skipped %s (no sample value for its parameters)" % rule)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({ 'args': vars(args), 'results': results, 'skipped': skipped }, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""Local stand-in for the ERMrest and authn services used by the dashboard API
+
+Serves a synthetic CFDE portal catalog (any numeric catalog id) and
+registry catalog ("registry"): catalog and /schema documents, and rows
+for entity, attribute, attributegroup and aggregate queries, shaped by
+the query's projection and sized by --rows / --table-rows.  Queries with
+an equality filter on id, nid or RID return the single matching row.
+
+With --recordings DIR, responses previously recorded in DIR are served
+in preference to synthetic ones; with --record-from URL (e.g.
+https://app-dev.nih-cfde.org) requests are proxied to a real server and
+the responses saved to DIR.
+
+With --error-rate, that fraction of requests fails with 500.
+
+Every request is counted; GET /_stats returns the counts and
+POST /_reset clears them.
+
+Usage: python benchmarks/fake_ermrest.py [--port 8089] [--rows 100] [--latency-ms 20]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SYSTEM_COLUMNS = ['RID', 'RCT', 'RMT', 'RCB', 'RMB']
+VOCABULARIES = [
+    'analysis_type', 'anatomy', 'assay_type', 'compound', 'compression_format', 'data_type', 'disease',
+    'ethnicity', 'file_format', 'gene', 'mime_type', 'ncbi_taxonomy', 'phenotype', 'protein', 'race',
+    'sample_prep_method', 'sex', 'substance', 'subject_granularity', 'subject_role',
+]
+FAVORITES = [
+    'anatomy', 'dcc', 'assay_type', 'disease', 'ncbi_taxonomy', 'data_type', 'file_format', 'gene',
+    'compound', 'analysis_type', 'phenotype', 'protein',
+]
+
+# table name -> (columns, {fkey column: (referenced table, referenced column)})
+PORTAL_TABLES = {
+    'dcc': (['nid', 'id', 'dcc_name', 'dcc_abbreviation', 'dcc_description', 'dcc_url', 'contact_name',
+             'contact_email', 'project'], { 'project': ('project', 'nid') }),
+    'project': (['nid', 'id', 'name', 'abbreviation', 'description'], {}),
+    'project_root': (['project'], { 'project': ('project', 'nid') }),
+    'project_in_project': (['parent_project', 'child_project'], {}),
+    'project_in_project_transitive': (['leader_project', 'member_project'], {}),
+    'core_fact': (['nid', 'project'], {}),
+    'subject': (['nid', 'id', 'core_fact'], { 'core_fact': ('core_fact', 'nid') }),
+    'biosample': (['nid', 'id', 'core_fact'], { 'core_fact': ('core_fact', 'nid') }),
+    'file': (['nid', 'id', 'core_fact', 'size_in_bytes'], { 'core_fact': ('core_fact', 'nid') }),
+    'collection': (['nid', 'id', 'core_fact'], { 'core_fact': ('core_fact', 'nid') }),
+    'biosample_from_subject': (['biosample', 'subject'], { 'biosample': ('biosample', 'nid'), 'subject': ('subject', 'nid') }),
+    'file_describes_subject': (['file', 'subject'], { 'file': ('file', 'nid'), 'subject': ('subject', 'nid') }),
+    'file_describes_biosample': (['file', 'biosample'], { 'file': ('file', 'nid'), 'biosample': ('biosample', 'nid') }),
+    'personal_collection': (['name', 'description'], {}),
+}
+PORTAL_TABLES.update({ v: (['nid', 'id', 'name', 'description'], {}) for v in VOCABULARIES })
+
+REGISTRY_TABLES = {
+    'datapackage': (['id', 'submitting_dcc', 'submission_time', 'review_summary_url', 'status'], {}),
+    'dcc': (['id', 'dcc_name', 'dcc_abbreviation', 'description'], {}),
+    'saved_query': (['user_id', 'name', 'description', 'schema_name', 'table_name', 'encoded_facets',
+                     'last_execution_time'], {}),
+}
+REGISTRY_TABLES.update({ v: (['id', 'name', 'description'], {}) for v in VOCABULARIES if v not in REGISTRY_TABLES })
+REGISTRY_TABLES.update({
+    'favorite_' + v: (['user_id', v], { v: (v, 'id') }) for v in FAVORITES
+})
+
+def _model_doc(tables):
+    tdocs = {}
+    for tname, (columns, fkeys) in tables.items():
+        cols = SYSTEM_COLUMNS + columns
+        tdocs[tname] = {
+            'schema_name': 'CFDE',
+            'table_name': tname,
+            'kind': 'table',
+            'column_definitions': [{ 'name': c, 'type': { 'typename': _column_type(c) }, 'nullok': c != 'RID' } for c in cols],
+            'keys': [{ 'names': [['CFDE', '%s_%s_key' % (tname, c)]], 'unique_columns': [c] }
+                     for c in cols if c in ('RID', 'nid', 'id')],
+            'foreign_keys': [{
+                'names': [['CFDE', '%s_%s_fkey' % (tname, c)]],
+                'foreign_key_columns': [{ 'schema_name': 'CFDE', 'table_name': tname, 'column_name': c }],
+                'referenced_columns': [{ 'schema_name': 'CFDE', 'table_name': rt, 'column_name': rc }],
+            } for c, (rt, rc) in fkeys.items()],
+        }
+    return { 'schemas': { 'CFDE': { 'schema_name': 'CFDE', 'tables': tdocs } } }
+
+def _column_type(cname):
+    if cname in ('nid', 'project', 'core_fact', 'size_in_bytes') or cname.endswith('_project') \
+       or cname in ('biosample', 'subject', 'file'):
+        return 'int8'
+    if cname in ('RCT', 'RMT', 'submission_time', 'last_execution_time'):
+        return 'timestamptz'
+    return 'text'
+
+class Catalogs(object):
+    """Synthetic catalog content and request accounting"""
+    def __init__(self, rows=100, table_rows=None, snaptime='2WG-7RJ8-8F8P', error_rate=0):
+        self.rows = rows
+        self.error_rate = error_rate
+        self.table_rows = table_rows or {}
+        self.snaptime = snaptime
+        self.models = { 'portal': _model_doc(PORTAL_TABLES), 'registry': _model_doc(REGISTRY_TABLES) }
+        self.tables = { 'portal': PORTAL_TABLES, 'registry': REGISTRY_TABLES }
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, kind):
+        with self.lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+            self.counts['total'] = self.counts.get('total', 0) + 1
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def catalog_doc(self, catalog_id):
+        return { 'id': catalog_id, 'snaptime': self.snaptime, 'annotations': {}, 'acls': {} }
+
+    def query(self, kind, catalog, path, limit):
+        """Return synthetic rows for an ERMrest data API path"""
+        tables = self.tables[catalog]
+        segments = path.split('/')
+        projection = None
+        if kind != 'entity':
+            projection = segments[-1]
+            segments = segments[:-1]
+
+        aliases = {}
+        context = None
+        unique_filter = None
+        start = 0
+        for seg in segments:
+            m = re.match(r'^\$(\w+)$', seg)
+            if m:
+                context = aliases.get(m.group(1), context)
+                continue
+            m = re.search(r'CFDE:(\w+)', seg)
+            if m:
+                context = m.group(1)
+                alias = re.match(r'^(\w+):=', seg)
+                if alias:
+                    aliases[alias.group(1)] = context
+                unique_filter = None
+                continue
+            m = re.match(r'^(?:\w+:)?(id|nid|RID)=([^&;]+)$', seg)
+            if m:
+                unique_filter = (m.group(1), urllib.parse.unquote(m.group(2)))
+            m = re.match(r'^(?:\w+:)?RID::gt::([0-9A-F]+)-([0-9A-F]+)$', seg)
+            if m:
+                # keyset paging: rows after the row with this (generated) RID
+                start = int(m.group(1), 16) * 65536 - 65536 + int(m.group(2), 16) + 1
+
+        if kind == 'entity':
+            columns = [(c, None, c) for c in SYSTEM_COLUMNS + list(tables.get(context, ([], {}))[0])]
+        else:
+            columns = []
+            for item in re.split(r'[;,]', projection):
+                name, expr = item.split(':=', 1) if ':=' in item else (None, item)
+                m = re.match(r'^(\w+)\((.*)\)$', expr)
+                fn, arg = (m.group(1), m.group(2)) if m else (None, expr)
+                col = urllib.parse.unquote(arg.split(':')[-1])
+                columns.append((urllib.parse.unquote(name or col), fn, col))
+
+        nrows = 1 if kind == 'aggregate' or unique_filter else self.table_rows.get(context, self.rows)
+        if limit is not None:
+            nrows = min(nrows, start + limit)
+        rows = []
+        for i in range(start, nrows):
+            row = { name: self._value(context, col, fn, i) for name, fn, col in columns }
+            if unique_filter and unique_filter[0] in row:
+                row[unique_filter[0]] = int(unique_filter[1]) if unique_filter[0] == 'nid' else unique_filter[1]
+            rows.append(row)
+        return rows
+
+    def _value(self, table, col, fn, i):
+        seed = zlib.crc32(('%s:%s:%d' % (table, col, i)).encode())
+        if fn in ('cnt', 'cnt_d', 'sum'):
+            return seed % 100000
+        if fn in ('array', 'array_d'):
+            return [self._value(table, col, None, j) for j in range(3)]
+        if fn in ('min', 'max'):
+            return self._value(table, col, None, 0)
+        if col == '*':
+            return None
+        if col == 'RID':
+            return '%X-%04X' % (i // 65536 + 1, i % 65536)
+        if col.startswith('num_') or col.startswith('total_'):
+            return seed % 100000
+        typename = _column_type(col)
+        if typename == 'int8':
+            return i + 1
+        if typename == 'timestamptz':
+            return '2021-%02d-%02dT12:00:00+00:00' % (seed % 12 + 1, seed % 28 + 1)
+        if col == 'id':
+            return 'cfde_%s:%d' % (table, i + 1)
+        if col == 'review_summary_url':
+            return 'https://app.nih-cfde.org/dcc_review.html?catalogId=%d' % (i + 1)
+        if col == 'encoded_facets':
+            return None if i % 2 else 'N4IghgdgJiBcDaBdIA'
+        return '%s %s %d' % (table, col, i + 1)
+
+class Recorder(object):
+    """Recorded responses in a directory, optionally captured by proxying a real server"""
+    def __init__(self, directory, record_from=None):
+        self.directory = directory
+        self.record_from = record_from
+        os.makedirs(directory, exist_ok=True)
+
+    def _file(self, path):
+        return os.path.join(self.directory, hashlib.sha1(path.encode()).hexdigest() + '.json')
+
+    def get(self, path, headers):
+        fname = self._file(path)
+        if os.path.isfile(fname):
+            with open(fname) as f:
+                return json.load(f)['body']
+        if self.record_from is None:
+            return None
+        req = urllib.request.Request(self.record_from + path,
+                                     headers={ k: v for k, v in headers.items() if k.lower() in ('cookie', 'authorization') })
+        with urllib.request.urlopen(req) as resp:
+            body = json.loads(resp.read())
+        with open(fname, 'w') as f:
+            json.dump({ 'path': path, 'body': body }, f)
+        return body
+
+def make_handler(catalogs, latency_ms=0, jitter_ms=0, session=None, recorder=None):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # headers and body are written separately; don't let Nagle delay the body
+        disable_nagle_algorithm = True
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status, doc):
+            body = json.dumps(doc).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # the client gave up (e.g. the API's request deadline passed)
+                pass
+
+        def do_POST(self):
+            if self.path == '/_reset':
+                catalogs.reset()
+                return self._send(200, {})
+            self._send(405, { 'error': 'method not allowed' })
+
+        def do_GET(self):
+            if self.path == '/_stats':
+                return self._send(200, catalogs.stats())
+
+            if latency_ms or jitter_ms:
+                time.sleep(max(latency_ms + random.uniform(-jitter_ms, jitter_ms), 0) / 1000.0)
+
+            if recorder is not None:
+                body = recorder.get(self.path, dict(self.headers))
+                if body is not None:
+                    catalogs.count('recorded')
+                    return self._send(200, body)
+
+            if catalogs.error_rate and random.random() < catalogs.error_rate:
+                catalogs.count('error')
+                return self._send(500, { 'error': 'injected failure' })
+
+            url = urllib.parse.urlsplit(self.path)
+            if url.path == '/authn/session':
+                catalogs.count('authn')
+                return self._send(200, session) if session else self._send(404, { 'error': 'no session' })
+
+            m = re.match(r'^/ermrest/catalog/(\w+)(?:@[-\w]+)?(/.*)?$', url.path)
+            if m is None:
+                return self._send(404, { 'error': 'not found' })
+            catalog_id, rest = m.group(1), m.group(2) or '/'
+            catalog = 'registry' if catalog_id == 'registry' else 'portal' if catalog_id.isdigit() else None
+            if catalog is None:
+                return self._send(404, { 'error': 'The requested catalog %s could not be found.' % catalog_id })
+
+            if rest == '/':
+                catalogs.count('catalog')
+                return self._send(200, catalogs.catalog_doc(catalog_id))
+            if rest == '/schema':
+                catalogs.count('schema')
+                return self._send(200, catalogs.models[catalog])
+
+            m = re.match(r'^/(entity|attribute|attributegroup|aggregate)/(.*)$', rest)
+            if m is None:
+                return self._send(404, { 'error': 'not found' })
+            kind, path = m.group(1), re.sub(r'@(sort|after|before)\([^)]*\)', '', m.group(2))
+            limit = urllib.parse.parse_qs(url.query).get('limit')
+            catalogs.count(kind)
+            self._send(200, catalogs.query(kind, catalog, path, int(limit[0]) if limit else None))
+
+    return Handler
+
+def start(port=0, rows=100, table_rows=None, latency_ms=0, jitter_ms=0, session=None, recordings=None, record_from=None,
+          error_rate=0):
+    """Start the server on a background thread; returns (server, catalogs)"""
+    catalogs = Catalogs(rows, table_rows, error_rate=error_rate)
+    recorder = Recorder(recordings, record_from) if recordings else None
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(catalogs, latency_ms, jitter_ms, session, recorder))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-ermrest', daemon=True).start()
+    return server, catalogs
+
+def add_arguments(parser):
+    parser.add_argument('--rows', type=int, default=100, help="rows per table (and groups per grouped query)")
+    parser.add_argument('--table-rows', action='append', default=[], metavar='TABLE=N',
+                        help="rows for a specific table, e.g. gene=50000 (repeatable)")
+    parser.add_argument('--latency-ms', type=float, default=0, help="latency added to every upstream response")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="uniform +/- jitter on the added latency")
+    parser.add_argument('--user', default=None, help="webauthn client id to report as logged in (default: anonymous)")
+    parser.add_argument('--error-rate', type=float, default=0, help="fraction of requests answered with 500")
+    parser.add_argument('--recordings', default=None, help="directory of recorded responses to serve")
+    parser.add_argument('--record-from', default=None, help="real server URL to proxy and record from")
+
+def start_from_args(args, port=0):
+    session = { 'client': { 'id': args.user }, 'attributes': [{ 'id': args.user }] } if args.user else None
+    table_rows = { k: int(v) for k, v in (t.split('=', 1) for t in args.table_rows) }
+    return start(port, args.rows, table_rows, args.latency_ms, args.jitter_ms, session, args.recordings, args.record_from,
+                 args.error_rate)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8089)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, catalogs = start_from_args(args, args.port)
+    print("fake ERMrest/authn server listening on http://127.0.0.1:%d" % server.server_address[1])
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Measure the import-time cost of the dashboard API module
+
+This is what every mod_wsgi worker pays again after each recycle
+(maximum-requests). Each run imports the module in a fresh interpreter
+under `python -X importtime`; the report shows the median total and the
+modules with the highest cumulative import time.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_times(module):
+    """Return {module name: (self us, cumulative us)} for one fresh import of module"""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                          cwd=REPO_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError("import of %s failed:\n%s" % (module, proc.stderr))
+
+    res = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        res[name.strip()] = (int(self_us), int(cumulative_us))
+    return res
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5, help="number of fresh imports to measure")
+    parser.add_argument('--top', type=int, default=15, help="number of slowest modules to list")
+    parser.add_argument('--module', default='dashboard.dashboard_api', help="module to import")
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for i in range(args.runs)]
+    totals = [run[args.module][1] for run in runs]
+    print("%s: median %.1f ms, min %.1f ms, max %.1f ms over %d runs" % (
+        args.module, statistics.median(totals) / 1000, min(totals) / 1000, max(totals) / 1000, args.runs))
+
+    names = set.intersection(*[set(run) for run in runs])
+    cumulative = { name: statistics.median([run[name][1] for run in runs]) for name in names }
+    print("\n%12s  module" % "cumulative")
+    for name in sorted(cumulative, key=cumulative.get, reverse=True)[:args.top]:
+        print("%9.1f ms  %s" % (cumulative[name] / 1000, name))
+
+if __name__ == '__main__':
+    main()
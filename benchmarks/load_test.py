@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""Load test replaying dashboard page loads against a multi-process API
+
+Reproduces the production layout of --processes single-threaded API
+workers (mod_wsgi's 4 processes x 1 thread) sharing one listening
+socket, all pointed at a local ERMrest stand-in
+(benchmarks/fake_ermrest.py).  --users virtual users then start
+together, and each performs --page-loads page loads.  A page load
+requests every path of the scenario (by default PAGE_LOAD, the
+dashboard landing page's mix) with up to --parallel requests in flight,
+as a browser would.
+
+Reports throughput, latency percentiles (overall and by path), response
+statuses, and upstream amplification: ERMrest/authn calls received by
+the stand-in per client request.
+
+Usage: python benchmarks/load_test.py [--users 200] [--processes 4] [--latency-ms 20]
+                                      [--path /dcc --path /dcc_info] [--config PIN_SNAPTIME=True]
+"""
+import argparse
+import ast
+import http.client
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_ermrest
+from bench_routes import percentile, write_config
+
+# requests made by the dashboard landing page
+PAGE_LOAD = [
+    '/dcc_info',
+    '/dcc',
+    '/stats/files/dcc/data_type',
+    '/stats/subjects/dcc/anatomy',
+    '/stats/samples/anatomy/assay_type?includeDCC=true',
+    '/stats/files/anatomy/5/data_type/5',
+    '/user/favorites',
+    '/user/saved_queries',
+]
+
+def worker(fd):
+    """Serve the API, single-threaded, on an inherited listening socket"""
+    from werkzeug.serving import make_server
+    from dashboard.dashboard_api import app
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    make_server('127.0.0.1', 0, app, threaded=False, fd=fd).serve_forever()
+
+def start_workers(processes, config_file):
+    """Start API worker processes sharing one socket; returns (port, [process])"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(1024)
+    env = dict(os.environ, DASHBOARD_CONFIG=config_file)
+    procs = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker-fd', str(sock.fileno())],
+                         pass_fds=[sock.fileno()], env=env, cwd=REPO_DIR)
+        for i in range(processes)
+    ]
+    port = sock.getsockname()[1]
+    sock.close()
+    return port, procs
+
+def fetch(port, method, path, timeout=300):
+    """Returns (status, seconds) for one request on a new connection"""
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request(method, path)
+        res = conn.getresponse()
+        res.read()
+        status = res.status
+    except (OSError, http.client.HTTPException):
+        status = 'error'
+    finally:
+        conn.close()
+    return status, time.perf_counter() - start
+
+def wait_ready(port, procs, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if any(p.poll() is not None for p in procs):
+            raise RuntimeError("an API worker exited during startup")
+        if fetch(port, 'GET', '/health', timeout=5)[0] == 200:
+            return
+        time.sleep(0.2)
+    raise RuntimeError("API workers not ready after %d seconds" % timeout)
+
+def run(port, paths, users, page_loads, parallel):
+    """Run the scenario; returns ([(path, status, seconds)], elapsed seconds)"""
+    results = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(users)
+
+    def user():
+        start_barrier.wait()
+        with ThreadPoolExecutor(parallel) as pool:
+            for i in range(page_loads):
+                for path, (status, secs) in zip(paths, pool.map(lambda p: fetch(port, 'GET', p), paths)):
+                    with lock:
+                        results.append((path, status, secs))
+
+    threads = [threading.Thread(target=user) for i in range(users)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - start
+
+def summarize(results, elapsed, upstream, page_loads):
+    latencies = [secs for path, status, secs in results]
+    statuses = {}
+    for path, status, secs in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    by_path = {}
+    for path, status, secs in results:
+        by_path.setdefault(path, []).append(secs)
+    return {
+        'requests': len(results),
+        'page_loads': page_loads,
+        'elapsed_s': elapsed,
+        'requests_per_s': len(results) / elapsed,
+        'page_loads_per_s': page_loads / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': max(latencies) * 1000,
+        'statuses': statuses,
+        'upstream_calls': upstream,
+        'amplification': upstream.get('total', 0) / float(len(results)),
+        'paths': {
+            path: {
+                'p50_ms': percentile(secs, 50) * 1000,
+                'p99_ms': percentile(secs, 99) * 1000,
+                'max_ms': max(secs) * 1000,
+            } for path, secs in by_path.items()
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200, help="concurrent virtual users")
+    parser.add_argument('--page-loads', type=int, default=1, help="page loads per user")
+    parser.add_argument('--parallel', type=int, default=6, help="concurrent requests per page load (browser connection limit)")
+    parser.add_argument('--processes', type=int, default=4, help="single-threaded API worker processes")
+    parser.add_argument('--path', action='append', default=[], help="scenario path (repeatable; default: PAGE_LOAD)")
+    parser.add_argument('--no-warmup', action='store_true', help="don't load the page once before measuring")
+    parser.add_argument('--config', action='append', default=[], metavar='KEY=VALUE',
+                        help="API setting (Python literal value), e.g. PIN_SNAPTIME=True (repeatable)")
+    parser.add_argument('--json', default=None, help="also write results to this file")
+    parser.add_argument('--worker-fd', type=int, default=None, help=argparse.SUPPRESS)
+    fake_ermrest.add_arguments(parser)
+    parser.set_defaults(user='https://auth.globus.org/load-test-user')
+    args = parser.parse_args()
+
+    if args.worker_fd is not None:
+        return worker(args.worker_fd)
+
+    server, catalogs = fake_ermrest.start_from_args(args)
+    config = { k: ast.literal_eval(v) for k, v in (c.split('=', 1) for c in args.config) }
+    port, procs = start_workers(args.processes, write_config(server, config))
+    try:
+        wait_ready(port, procs)
+        paths = args.path or PAGE_LOAD
+        if not args.no_warmup:
+            # once per worker, so each has loaded the catalog models
+            run(port, paths, args.processes, 1, 1)
+        catalogs.reset()
+        results, elapsed = run(port, paths, args.users, args.page_loads, args.parallel)
+        summary = summarize(results, elapsed, catalogs.stats(), args.users * args.page_loads)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait()
+        server.shutdown()
+
+    print("%d users x %d page loads (%d requests) on %d processes in %.1f s" % (
+        args.users, args.page_loads, summary['requests'], args.processes, elapsed))
+    print("throughput: %.1f requests/s, %.2f page loads/s" % (summary['requests_per_s'], summary['page_loads_per_s']))
+    print("latency: p50 %.0f ms, p90 %.0f ms, p99 %.0f ms, max %.0f ms" % (
+        summary['p50_ms'], summary['p90_ms'], summary['p99_ms'], summary['max_ms']))
+    print("statuses: %s" % ', '.join('%s x%d' % item for item in sorted(summary['statuses'].items())))
+    print("upstream amplification: %.1f calls per request (%s)" % (
+        summary['amplification'], ', '.join('%s %d' % item for item in sorted(summary['upstream_calls'].items()))))
+    print("\n%-55s %9s %9s %9s" % ('path', 'p50 ms', 'p99 ms', 'max ms'))
+    for path in paths:
+        p = summary['paths'][path]
+        print("%-55s %9.0f %9.0f %9.0f" % (path[:55], p['p50_ms'], p['p99_ms'], p['max_ms']))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({ 'args': vars(args), 'summary': summary }, f, indent=2)
+
+if __name__ == '__main__':
+    main()
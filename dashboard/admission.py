@@ -0,0 +1,91 @@
+#
+# Admission control for the dashboard API.
+#
+# Expensive routes are assigned to named budgets, each allowing a number of concurrent
+# requests plus a bounded queue of waiting requests, across all API processes on a host.
+# Budgets are enforced with advisory locks (flock) on per-slot files in a shared directory,
+# so a slot held by a process that dies is released by the kernel.
+#
+import os
+import re
+import time
+
+class Rejected(Exception):
+    """The request was not admitted; reason is 'shed' (queue full) or 'timeout' (waited too long)"""
+    def __init__(self, budget, reason):
+        super(Rejected, self).__init__("%s: %s" % (budget, reason))
+        self.budget = budget
+        self.reason = reason
+
+class Slot(object):
+    """A held slot; release() gives it back"""
+    def __init__(self, f):
+        self._file = f
+
+    def release(self):
+        if self._file is not None:
+            import fcntl
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+class Admission(object):
+    """Per-budget concurrency limits with bounded queues, shared by all processes using directory
+
+    budgets maps a budget name to (max concurrent requests, max queued
+    requests); routes is a list of (regular expression, budget name),
+    matched in order against request paths.
+
+    """
+    def __init__(self, directory, budgets, routes, queue_timeout=10.0, poll_interval=0.05):
+        self.directory = directory
+        self.budgets = budgets
+        self.routes = [(re.compile(pattern), name) for pattern, name in routes]
+        self.queue_timeout = queue_timeout
+        self.poll_interval = poll_interval
+        unknown = set(name for pattern, name in routes) - set(budgets)
+        if unknown:
+            raise ValueError("admission routes refer to undefined budgets: %s" % ', '.join(sorted(unknown)))
+        if budgets:
+            os.makedirs(directory, exist_ok=True)
+
+    def budget_for(self, path):
+        """Return the name of the budget governing path, or None"""
+        for pattern, name in self.routes:
+            if pattern.search(path):
+                return name
+        return None
+
+    def _try_slot(self, budget, kind, count):
+        import fcntl
+        for i in range(count):
+            f = open(os.path.join(self.directory, '%s.%s%d' % (budget, kind, i)), 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue
+            return Slot(f)
+        return None
+
+    def acquire(self, budget):
+        """Wait for a slot in budget; returns (Slot, seconds queued) or raises Rejected"""
+        concurrency, queue = self.budgets[budget]
+        slot = self._try_slot(budget, 'run', concurrency)
+        if slot is not None:
+            return slot, 0.0
+
+        queued = self._try_slot(budget, 'queue', queue)
+        if queued is None:
+            raise Rejected(budget, 'shed')
+        start = time.monotonic()
+        try:
+            while True:
+                time.sleep(self.poll_interval)
+                slot = self._try_slot(budget, 'run', concurrency)
+                if slot is not None:
+                    return slot, time.monotonic() - start
+                if time.monotonic() - start >= self.queue_timeout:
+                    raise Rejected(budget, 'timeout')
+        finally:
+            queued.release()
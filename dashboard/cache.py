@@ -0,0 +1,367 @@
+#
+# Cross-process result cache, job store and catalog snaptimes for the dashboard API.
+#
+# Rendered responses, asynchronous jobs and the catalogs' latest snaptimes are kept in a
+# sqlite database so that all
+# mod_wsgi daemon processes on a host (and processes started after a worker recycle)
+# share them.
+#
+import abc
+import os
+import threading
+import time
+from dashboard.telemetry import pid_alive
+
+class _Store(abc.ABC):
+    # a table in a sqlite database shared by all API processes on a host
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+
+    @abc.abstractmethod
+    def _create(self, conn):
+        # create the subclass's tables (and indexes) if they don't exist
+        pass
+
+    def _connection(self):
+        # sqlite connections must not be shared across fork(), so open one per process
+        if self._conn is None or self._pid != os.getpid():
+            dirname = os.path.dirname(self.path)
+            if dirname:
+                # cached responses may hold callers' data, so only the API's user may read them
+                os.makedirs(dirname, mode=0o700, exist_ok=True)
+            import sqlite3
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._create(conn)
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+
+class ResultCache(_Store):
+    """Store of rendered API responses keyed by an opaque string
+
+    Results that cannot change (e.g., queries pinned to a catalog
+    snaptime) are kept without expiry, the oldest being discarded
+    once there are more than max_entries.  The last good response to
+    a URL, kept to serve when it can't be computed (see
+    put_last_good()), is kept apart, for at most stale_max_age
+    seconds and stale_max_entries entries, so that it doesn't
+    displace those results.
+
+    Hits and misses are counted in memory and written at most every
+    COUNT_FLUSH_INTERVAL seconds, and the tables trimmed every
+    TRIM_EVERY writes, so that lookups don't each take sqlite's write
+    lock.
+
+    A purge that should also discard what each process derived from
+    the purged results is published with invalidate(); every process
+    reads the invalidations published since it last looked with
+    invalidations().
+
+    """
+    TABLES = ('results', 'last_good')
+    COUNT_FLUSH_INTERVAL = 10
+    TRIM_EVERY = 100
+
+    def __init__(self, path, max_entries=10000, stale_max_entries=1000, stale_max_age=86400):
+        super(ResultCache, self).__init__(path)
+        self.max_entries = max_entries
+        self.stale_max_entries = stale_max_entries
+        self.stale_max_age = stale_max_age
+        self._lock = threading.Lock()
+        # (catalog id, route) -> [hits, misses] and key -> hits, not yet written
+        self._lookups = {}
+        self._hits = {}
+        self._flushed = time.time()
+        self._writes = 0
+
+    def _create(self, conn):
+        for table in self.TABLES:
+            conn.execute('CREATE TABLE IF NOT EXISTS %s ('
+                         ' key TEXT PRIMARY KEY,'
+                         ' catalog_id TEXT,'
+                         ' route TEXT,'
+                         ' mimetype TEXT,'
+                         ' body BLOB,'
+                         ' created REAL,'
+                         ' hits INTEGER NOT NULL DEFAULT 0)' % table)
+        conn.execute('CREATE TABLE IF NOT EXISTS lookups ('
+                     ' catalog_id TEXT,'
+                     ' route TEXT,'
+                     ' hits INTEGER NOT NULL DEFAULT 0,'
+                     ' misses INTEGER NOT NULL DEFAULT 0,'
+                     ' UNIQUE (catalog_id, route))')
+        conn.execute('CREATE TABLE IF NOT EXISTS invalidations ('
+                     ' seq INTEGER PRIMARY KEY AUTOINCREMENT,'
+                     ' catalog_id TEXT,'
+                     ' created REAL)')
+
+    def get(self, key, catalog_id=None, route=None):
+        """Return (body, mimetype) for key, or None if not cached
+
+        If route is given, the hit or miss is counted for catalog_id
+        and route (see summary()).
+
+        """
+        row = self._connection().execute('SELECT body, mimetype FROM results WHERE key = ?', (key,)).fetchone()
+        with self._lock:
+            if route is not None:
+                counts = self._lookups.setdefault((catalog_id, route), [0, 0])
+                counts[0 if row is not None else 1] += 1
+            if row is not None:
+                self._hits[key] = self._hits.get(key, 0) + 1
+        if time.time() - self._flushed >= self.COUNT_FLUSH_INTERVAL:
+            self.flush_counts()
+        if row is None:
+            return None
+        return bytes(row[0]), row[1]
+
+    def put(self, key, catalog_id, route, body, mimetype):
+        self._put('results', key, catalog_id, route, body, mimetype)
+
+    def get_last_good(self, key):
+        """Return (body, mimetype) of the last good response stored for key, or None"""
+        row = self._connection().execute('SELECT body, mimetype FROM last_good WHERE key = ? AND created > ?',
+                                         (key, time.time() - self.stale_max_age)).fetchone()
+        return None if row is None else (bytes(row[0]), row[1])
+
+    def put_last_good(self, key, catalog_id, route, body, mimetype):
+        """Keep body as the last good response for key"""
+        self._put('last_good', key, catalog_id, route, body, mimetype)
+
+    def _put(self, table, key, catalog_id, route, body, mimetype):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO %s (key, catalog_id, route, mimetype, body, created)'
+                     ' VALUES (?, ?, ?, ?, ?, ?)' % table,
+                     (key, catalog_id, route, mimetype, body, time.time()))
+        with self._lock:
+            self._writes += 1
+            trim = self._writes % self.TRIM_EVERY == 0
+        if trim:
+            self.trim()
+
+    def trim(self):
+        """Discard the oldest entries beyond the limits, and expired last good responses"""
+        conn = self._connection()
+        conn.execute('DELETE FROM last_good WHERE created <= ?', (time.time() - self.stale_max_age,))
+        for table, limit in (('results', self.max_entries), ('last_good', self.stale_max_entries)):
+            count = conn.execute('SELECT count(*) FROM %s' % table).fetchone()[0]
+            if count > limit:
+                conn.execute('DELETE FROM %s WHERE key IN'
+                             ' (SELECT key FROM %s ORDER BY created, rowid LIMIT ?)' % (table, table),
+                             (count - limit,))
+
+    def flush_counts(self):
+        """Write the hits and misses counted in this process since the last flush"""
+        with self._lock:
+            lookups, self._lookups = self._lookups, {}
+            hits, self._hits = self._hits, {}
+            self._flushed = time.time()
+        if not lookups and not hits:
+            return
+        conn = self._connection()
+        for (catalog_id, route), (nhits, nmisses) in lookups.items():
+            conn.execute('INSERT INTO lookups (catalog_id, route, hits, misses) VALUES (?, ?, ?, ?)'
+                         ' ON CONFLICT (catalog_id, route) DO UPDATE SET hits = hits + excluded.hits,'
+                         ' misses = misses + excluded.misses',
+                         (catalog_id, route, nhits, nmisses))
+        for key, n in hits.items():
+            conn.execute('UPDATE results SET hits = hits + ? WHERE key = ?', (n, key))
+
+    def close(self):
+        if self._conn is not None and self._pid == os.getpid():
+            self.flush_counts()
+        super(ResultCache, self).close()
+
+    def _where(self, catalog_id, route, dcc_id):
+        # SQL condition (and its parameters) selecting entries for catalog_id, route and
+        # DCC (whose id appears in the entry's /dcc/{dccId}/... path), each if not None
+        clauses = ['1']
+        params = []
+        if catalog_id is not None:
+            clauses.append('catalog_id = ?')
+            params.append(catalog_id)
+        if route is not None:
+            clauses.append('route = ?')
+            params.append(route)
+        if dcc_id is not None:
+            escaped = dcc_id.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            clauses.append("(key LIKE ? ESCAPE '\\' OR key LIKE ? ESCAPE '\\')")
+            params.extend(['% /dcc/' + escaped + '/%', '% /dcc/' + escaped + '?%'])
+        return ' AND '.join(clauses), params
+
+    def entries(self, catalog_id=None, route=None, dcc_id=None, limit=100):
+        """Return the newest limit entries (without their bodies, last good responses included) as dicts"""
+        self.flush_counts()
+        where, params = self._where(catalog_id, route, dcc_id)
+        cursor = self._connection().execute(
+            'SELECT * FROM (' + ' UNION ALL '.join(
+                "SELECT key, catalog_id, route, mimetype, length(body) AS bytes, created, hits, '%s' AS kind"
+                " FROM %s WHERE %s" % (table, table, where) for table in self.TABLES) +
+            ') ORDER BY created DESC LIMIT ?', params * len(self.TABLES) + [limit])
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def summary(self, catalog_id=None, route=None):
+        """Return, per catalog id and route, the number and size of entries, hits and misses"""
+        self.flush_counts()
+        conn = self._connection()
+        where, params = self._where(catalog_id, route, None)
+        res = {}
+        for table in self.TABLES:
+            for cat, rte, count, size in conn.execute(
+                    'SELECT catalog_id, route, count(*), sum(length(body)) FROM %s'
+                    ' WHERE %s GROUP BY catalog_id, route' % (table, where), params):
+                entry = res.setdefault((cat, rte), { 'catalog_id': cat, 'route': rte, 'entries': 0, 'bytes': 0,
+                                                     'hits': 0, 'misses': 0 })
+                entry['entries'] += count
+                entry['bytes'] += size or 0
+        for cat, rte, hits, misses in conn.execute(
+                'SELECT catalog_id, route, hits, misses FROM lookups WHERE ' + where, params):
+            entry = res.setdefault((cat, rte), { 'catalog_id': cat, 'route': rte, 'entries': 0, 'bytes': 0 })
+            entry['hits'] = hits
+            entry['misses'] = misses
+        for entry in res.values():
+            lookups = entry['hits'] + entry['misses']
+            entry['hit_ratio'] = entry['hits'] / float(lookups) if lookups else None
+        return sorted(res.values(), key=lambda e: (str(e['catalog_id']), str(e['route'])))
+
+    def purge(self, catalog_id=None, route=None, dcc_id=None):
+        """Delete the entries (and last good responses) for catalog_id, route and DCC (each if not None); returns the number deleted"""
+        where, params = self._where(catalog_id, route, dcc_id)
+        conn = self._connection()
+        return sum(conn.execute('DELETE FROM %s WHERE %s' % (table, where), params).rowcount
+                   for table in self.TABLES)
+
+    def invalidate(self, catalog_id=None):
+        """Publish an invalidation of catalog_id (None for all catalogs) to all processes; returns its sequence number"""
+        conn = self._connection()
+        now = time.time()
+        # keep a day's worth, for processes that were idle meanwhile
+        conn.execute('DELETE FROM invalidations WHERE created < ?', (now - 86400,))
+        return conn.execute('INSERT INTO invalidations (catalog_id, created) VALUES (?, ?)',
+                            (catalog_id, now)).lastrowid
+
+    def invalidations(self, after):
+        """Return [(sequence number, catalog id)] of the invalidations published after sequence number after"""
+        return self._connection().execute('SELECT seq, catalog_id FROM invalidations WHERE seq > ? ORDER BY seq',
+                                          (after,)).fetchall()
+
+    def last_invalidation(self):
+        """Return the sequence number of the latest invalidation published (0 if none)"""
+        return self._connection().execute('SELECT coalesce(max(seq), 0) FROM invalidations').fetchone()[0]
+
+class JobStore(_Store):
+    """Asynchronous jobs and their results
+
+    A job is created 'pending' for a request key and identity, marked
+    'running' by the process that executes it, and 'done' with the
+    response's status, mimetype and body.  Jobs are discarded max_age
+    seconds after they were created.
+
+    """
+    def __init__(self, path, max_age=86400):
+        super(JobStore, self).__init__(path)
+        self.max_age = max_age
+
+    def _create(self, conn):
+        conn.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                     ' id TEXT PRIMARY KEY,'
+                     ' key TEXT,'
+                     ' identity TEXT,'
+                     ' status TEXT,'
+                     ' pid INTEGER,'
+                     ' created REAL,'
+                     ' started REAL,'
+                     ' finished REAL,'
+                     ' status_code INTEGER,'
+                     ' mimetype TEXT,'
+                     ' body BLOB)')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, identity)')
+
+    def create(self, job_id, key, identity):
+        conn = self._connection()
+        now = time.time()
+        conn.execute('DELETE FROM jobs WHERE created < ?', (now - self.max_age,))
+        conn.execute('INSERT INTO jobs (id, key, identity, status, pid, created) VALUES (?, ?, ?, ?, ?, ?)',
+                     (job_id, key, identity, 'pending', os.getpid(), now))
+
+    def find_unfinished(self, key, identity):
+        """Return the id of a pending or running job for key and identity, or None"""
+        rows = self._connection().execute(
+            "SELECT id, pid FROM jobs WHERE key = ? AND identity = ? AND status IN ('pending', 'running')"
+            " ORDER BY created DESC", (key, identity)).fetchall()
+        for job_id, pid in rows:
+            if pid_alive(pid):
+                return job_id
+        return None
+
+    def start(self, job_id):
+        self._connection().execute("UPDATE jobs SET status = 'running', started = ? WHERE id = ?",
+                                   (time.time(), job_id))
+
+    def finish(self, job_id, status, status_code, mimetype, body):
+        self._connection().execute('UPDATE jobs SET status = ?, finished = ?, status_code = ?, mimetype = ?, body = ?'
+                                   ' WHERE id = ?',
+                                   (status, time.time(), status_code, mimetype, body, job_id))
+
+    def get(self, job_id):
+        """Return the job as a dict, or None
+
+        An unfinished job whose process has exited (e.g., a worker
+        recycle) is marked as failed.
+
+        """
+        cursor = self._connection().execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        job = dict(zip([d[0] for d in cursor.description], row))
+        if job['status'] in ('pending', 'running') and not pid_alive(job['pid']):
+            self.finish(job_id, 'failed', 500, 'text/plain', b"API process running the job exited")
+            return self.get(job_id)
+        if job['body'] is not None:
+            job['body'] = bytes(job['body'])
+        return job
+
+class SnaptimeStore(_Store):
+    """Latest known snaptime of each catalog, and when it was checked
+
+    claim() lets one process per interval check a catalog with
+    ERMrest; the others read its answer with get_all().
+
+    """
+    def _create(self, conn):
+        conn.execute('CREATE TABLE IF NOT EXISTS snaptimes ('
+                     ' catalog_id TEXT PRIMARY KEY,'
+                     ' snaptime TEXT,'
+                     ' checked REAL NOT NULL DEFAULT 0,'
+                     ' claimed REAL NOT NULL DEFAULT 0)')
+
+    def get_all(self):
+        """Return a dict of catalog id -> (snaptime, time checked) for the catalogs checked so far"""
+        rows = self._connection().execute('SELECT catalog_id, snaptime, checked FROM snaptimes'
+                                          ' WHERE snaptime IS NOT NULL').fetchall()
+        return { catalog_id: (snaptime, checked) for catalog_id, snaptime, checked in rows }
+
+    def claim(self, catalog_id, interval):
+        """Return True if the caller should check catalog_id now, i.e. no process checked or claimed it in the last interval seconds"""
+        conn = self._connection()
+        now = time.time()
+        conn.execute('INSERT OR IGNORE INTO snaptimes (catalog_id) VALUES (?)', (catalog_id,))
+        cursor = conn.execute('UPDATE snaptimes SET claimed = ? WHERE catalog_id = ? AND checked <= ? AND claimed <= ?',
+                              (now, catalog_id, now - interval, now - interval))
+        return cursor.rowcount == 1
+
+    def put(self, catalog_id, snaptime, checked):
+        self._connection().execute('INSERT INTO snaptimes (catalog_id, snaptime, checked) VALUES (?, ?, ?)'
+                                   ' ON CONFLICT (catalog_id) DO UPDATE SET snaptime = excluded.snaptime,'
+                                   ' checked = excluded.checked',
+                                   (catalog_id, snaptime, checked))
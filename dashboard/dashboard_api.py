@@ -1,21 +1,33 @@
 import json
 import os
 import re
+import sys
+import gc
+import math
 import atexit
+import time
 import datetime
+import hashlib
+import hmac
+import uuid
+import threading
 import urllib.parse
-import requests
+import contextvars
+import collections
+import copy
+import itertools
+import concurrent.futures
 from requests.exceptions import HTTPError
-from flask import Flask, request, make_response, wrappers
-from cfde_deriva.dashboard_queries import StatsQuery2, DashboardQueryHelper
-from deriva.core import DEFAULT_HEADERS, DEFAULT_SESSION_CONFIG, ErmrestCatalog
+from flask import Flask, request, make_response, wrappers, g, has_request_context, stream_with_context
+from deriva.core import DEFAULT_HEADERS, DEFAULT_SESSION_CONFIG, ErmrestCatalog, ErmrestSnapshot
 from deriva.core.utils import core_utils
 from deriva.core.datapath import Min, Max, Cnt, CntD, Avg, Sum, Bin, DataPathException
-from cfde_deriva.metrics import get_datapackage_measurements
+from dashboard import upstream, cache, profiling, admission, snaptimes
+from dashboard.telemetry import metrics
 
 app = Flask(__name__)
 app.config.from_object('dashboard.dashboard_config')
-CONFIG_FILE = os.path.join(os.path.expanduser('~'), 'dashboard.conf')
+CONFIG_FILE = os.environ.get('DASHBOARD_CONFIG', os.path.join(os.path.expanduser('~'), 'dashboard.conf'))
 if os.path.isfile(CONFIG_FILE):
     app.config.from_pyfile(CONFIG_FILE)
 SHOW_NULLS = app.config["SHOW_NULLS"]
@@ -23,12 +35,81 @@ PASS_HEADERS = app.config["PASS_HEADERS"]
 HOSTNAME = app.config["DERIVA_SERVERNAME"]
 DEFAULT_CATALOG_ID = app.config["DERIVA_DEFAULT_CATALOGID"]
 webauthn_token = None if "DEV_TOKEN" not in app.config else app.config["DEV_TOKEN"]
+PIN_SNAPTIME = app.config["PIN_SNAPTIME"]
 helpers = {}
+snapshot_helpers = collections.OrderedDict()
+catalogs = {}
+result_cache = cache.ResultCache(app.config["CACHE_DB"], app.config["CACHE_MAX_ENTRIES"],
+                                 app.config["STALE_MAX_ENTRIES"], app.config["STALE_MAX_AGE"]) if app.config["CACHE_DB"] else None
+# sequence number of the last invalidation (see ResultCache.invalidate()) applied by this process
+invalidation_seq = result_cache.last_invalidation() if result_cache is not None else 0
+preloaded = {}
+# (catalog id, snaptime, scope, entity, measure, frozenset(groupings)) -> (groupings, counts,
+# labels, estimated bytes), least recently used first; see _stats_cube()
+stats_cubes = collections.OrderedDict()
+stats_cubes_bytes = 0
+stats_cubes_lock = threading.Lock()
+# (registry snaptime or None, time built, catalog id -> datapackage row); see _datapackage_index()
+datapackage_index = (None, 0.0, {})
+datapackage_index_lock = threading.Lock()
+# catalog id -> (snaptime, time checked); see _timeseries_snaptime()
+timeseries_snaptimes = {}
+# held while precompute_fair_metrics() runs
+fair_precompute_lock = threading.Lock()
+metrics.configure(app.config["METRICS_DIR"], app.config["METRICS_FLUSH_INTERVAL"])
+if app.config["SLOW_QUERY_LOG"]:
+    upstream.configure_slow_query_log(app.config["SLOW_QUERY_LOG"],
+                                      app.config["SLOW_QUERY_THRESHOLD_MS"],
+                                      app.config["SLOW_QUERY_LOG_MAX_BYTES"],
+                                      app.config["SLOW_QUERY_LOG_BACKUPS"])
+admission_control = admission.Admission(app.config["ADMISSION_DIR"], app.config["ADMISSION_BUDGETS"],
+                                        app.config["ADMISSION_ROUTES"], app.config["ADMISSION_QUEUE_TIMEOUT"])
+if app.config["CIRCUIT_BREAKER"]:
+    upstream.configure_circuit_breakers(app.config["CIRCUIT_WINDOW"],
+                                        app.config["CIRCUIT_MIN_CALLS"],
+                                        app.config["CIRCUIT_FAILURE_RATE"],
+                                        app.config["CIRCUIT_SLOW_CALL_MS"],
+                                        app.config["CIRCUIT_OPEN_SECONDS"])
+route_deadlines = [(re.compile(pattern), seconds) for pattern, seconds in app.config["ROUTE_DEADLINES"]]
+job_store = cache.JobStore(app.config["CACHE_DB"], app.config["ASYNC_JOB_MAX_AGE"]) \
+    if app.config["CACHE_DB"] and app.config["ASYNC_JOBS"] else None
+async_job_routes = [re.compile(pattern) for pattern in app.config["ASYNC_JOB_ROUTES"]]
+timeseries_routes = [re.compile(pattern) for pattern in app.config["TIMESERIES_ROUTES"]]
+public_catalog_ids = set(str(c) for c in app.config["PUBLIC_CATALOG_IDS"])
+identity_scoped_routes = [re.compile(pattern) for pattern in app.config["IDENTITY_SCOPED_ROUTES"]]
+# name -> (pid, ThreadPoolExecutor)
+executors = {}
+executors_lock = threading.Lock()
+jobs_queued = 0
+warmup_status = { 'ready': not app.config["WARMUP"], 'started': None, 'finished': None, 'errors': [] }
+# held while warm_up() runs
+warmup_lock = threading.Lock()
 
 @atexit.register
 def cleanup_helpers():
-    for helper in helpers.values():
+    for helper in list(helpers.values()) + list(snapshot_helpers.values()):
         helper.catalog._close_session()
+    for catalog, builder in catalogs.values():
+        catalog._close_session()
+    if result_cache is not None:
+        result_cache.close()
+    if job_store is not None:
+        job_store.close()
+    if snaptime_poller is not None:
+        snaptime_poller.stop()
+    if snaptime_store is not None:
+        snaptime_store.close()
+    metrics.flush(force=True)
+
+# cfde_deriva backs only the catalog, stats and FAIR route groups; each group imports the
+# module it needs on first use rather than at module load, which every worker recycle pays for.
+def _dashboard_queries():
+    import cfde_deriva.dashboard_queries
+    return cfde_deriva.dashboard_queries
+
+def _cfde_metrics():
+    import cfde_deriva.metrics
+    return cfde_deriva.metrics
 
 def _error_response(err, code):
     res = make_response(err, code)
@@ -41,16 +122,279 @@ def _catalog_not_found_response(catalog_id):
 def _dcc_not_found_response(dcc_id):
     return _error_response("DCC '" + dcc_id + "' not found", 404)
 
+# Serve the last good response to this URL, marked as stale, if there is one; otherwise None.
+def _stale_response():
+    if not _serve_stale():
+        return None
+    cached = result_cache.get_last_good(_last_good_cache_key())
+    if cached is None:
+        return None
+    res = make_response(cached[0], 200)
+    res.mimetype = cached[1]
+    res.headers['Warning'] = '110 - "Response is Stale"'
+    res.headers['X-CFDE-Stale'] = 'true'
+    res.headers['Cache-Control'] = 'no-store'
+    g.stale_response = True
+    return res
+
 @app.errorhandler(DataPathException)
 def handle_datapath_exception(error):
-    return _error_response(str(error),
-                           error.reason.response.status_code if isinstance(error.reason, HTTPError) else 500)
+    code = error.reason.response.status_code if isinstance(error.reason, HTTPError) else 500
+    if code >= 500:
+        stale = _stale_response()
+        if stale is not None:
+            return stale
+    return _error_response(str(error), code)
+
+# e.g., a catalog's snaptime lookup (catalog.get('/')) failing
+@app.errorhandler(HTTPError)
+def handle_http_error(error):
+    code = error.response.status_code if error.response is not None else 500
+    if code >= 500:
+        stale = _stale_response()
+        if stale is not None:
+            return stale
+    return _error_response(str(error), code)
+
+@app.errorhandler(upstream.DeadlineExceeded)
+def handle_deadline_exceeded(error):
+    stale = _stale_response()
+    if stale is not None:
+        return stale
+    return _error_response("Request deadline exceeded: " + str(error), 504)
+
+@app.errorhandler(upstream.CircuitOpen)
+def handle_circuit_open(error):
+    res = _stale_response()
+    if res is None:
+        res = _error_response("Service temporarily unavailable: " + str(error), 503)
+        res.headers['Retry-After'] = str(int(math.ceil(error.retry_after)))
+    res.headers['X-CFDE-Circuit-Open'] = error.upstream
+    return res
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    if request.environ.get('dashboard.subrequest'):
+        # e.g. a point of a time series: bounded by the deadline of the request that made it
+        deadline = request.environ.get('dashboard.deadline')
+    elif request.environ.get('dashboard.async_job'):
+        deadline = app.config["ASYNC_JOB_DEADLINE"]
+    else:
+        deadline = app.config["REQUEST_DEADLINE"]
+        for pattern, seconds in route_deadlines:
+            if pattern.search(request.path):
+                deadline = seconds
+                break
+    upstream.set_deadline(deadline)
+
+# Asynchronous jobs: a request with async=true for a route in ASYNC_JOB_ROUTES is answered at once
+# with 202 and a job id.  The request itself (without async=true) is then run on a background thread
+# of this process, and its response stored in CACHE_DB for retrieval from /jobs/<id>.  Requests made
+# while an identical job is unfinished share that job.
+@app.before_request
+def start_async_job():
+    global jobs_queued
+    if request.args.get('async', '').lower() != 'true' or request.method != 'GET':
+        return
+    if job_store is None or not any(pattern.search(request.path) for pattern in async_job_routes):
+        # not eligible, so just run it
+        return
+
+    query = urllib.parse.urlencode([(k, v) for k, v in request.args.items(multi=True) if k != 'async'])
+    key = request.path + ('?' + query if query else '')
+    identity = _cache_scope(str(request.args.get("catalogId", DEFAULT_CATALOG_ID)))
+    job_id = job_store.find_unfinished(key, identity)
+    if job_id is None:
+        with executors_lock:
+            if jobs_queued >= app.config["ASYNC_JOB_MAX_QUEUED"]:
+                res = _error_response("Too many jobs queued, please retry later", 503)
+                res.headers['Retry-After'] = str(app.config["ADMISSION_RETRY_AFTER"])
+                return res
+            jobs_queued += 1
+        job_id = uuid.uuid4().hex
+        job_store.create(job_id, key, identity)
+        headers = [(k, v) for k, v in request.headers.items() if k.lower() not in ('content-length', 'x-cfde-profile')]
+        _executor('job', app.config["ASYNC_JOB_THREADS"]).submit(
+            _run_job, job_id, request.path, query, headers, request.host_url.rstrip('/') + request.script_root)
+    return _job_response(job_store.get(job_id))
+
+def _run_job(job_id, path, query, headers, base_url):
+    global jobs_queued
+    try:
+        job_store.start(job_id)
+        # use_cookies=False, so the caller's Cookie header (webauthn session) is passed through
+        res = app.test_client(use_cookies=False).get(path, query_string=query, headers=headers, base_url=base_url,
+                                    environ_overrides={ 'dashboard.async_job': job_id })
+        job_store.finish(job_id, 'done', res.status_code, res.mimetype, res.get_data())
+    except Exception as e:
+        job_store.finish(job_id, 'failed', 500, 'text/plain', str(e).encode())
+    finally:
+        with executors_lock:
+            jobs_queued -= 1
+
+# Status document for an unfinished or failed job (202 or 500), or the job's stored response.
+def _job_response(job):
+    if job['status'] == 'done':
+        res = make_response(job['body'], job['status_code'])
+        res.mimetype = job['mimetype']
+    else:
+        href = request.script_root + '/jobs/' + job['id']
+        doc = { 'job_id': job['id'], 'status': job['status'], 'href': href }
+        for k in ('created', 'started', 'finished'):
+            doc[k] = datetime.datetime.fromtimestamp(job[k]).isoformat() if job[k] else None
+        if job['status'] == 'failed':
+            doc['error'] = job['body'].decode(errors='replace')
+            res = make_response(json.dumps(doc), 500)
+        else:
+            res = make_response(json.dumps(doc), 202)
+            res.headers['Location'] = href
+            res.headers['Retry-After'] = str(app.config["ASYNC_JOB_POLL_INTERVAL"])
+        res.mimetype = 'application/json'
+    res.headers['X-CFDE-Job-Status'] = job['status']
+    res.headers['Cache-Control'] = 'no-store'
+    return res
+
+# Admission control: requests for routes with a concurrency budget (see ADMISSION_BUDGETS) wait
+# for a slot, or are turned away with 503 when the budget's queue is full, so that heavy queries
+# cannot monopolize the API processes or the ERMrest backend while cheap routes keep flowing.
+@app.before_request
+def admit_request():
+    budget = admission_control.budget_for(request.path)
+    if budget is None or budget == request.environ.get('dashboard.admission_budget'):
+        # a subrequest in the budget of the request that made it runs in that request's slot
+        return
+    try:
+        g.admission_slot, wait = admission_control.acquire(budget)
+        g.admission_budget = budget
+    except admission.Rejected as e:
+        metrics.inc('dashboard_admission_total', { 'budget': budget, 'result': e.reason })
+        res = _error_response("Server busy, please retry later", 503)
+        res.headers['Retry-After'] = str(app.config["ADMISSION_RETRY_AFTER"])
+        return res
+    if wait:
+        g.admission_wait = wait
+        metrics.observe('dashboard_admission_wait_seconds', { 'budget': budget }, wait)
+    metrics.inc('dashboard_admission_total', { 'budget': budget, 'result': 'queued' if wait else 'admitted' })
+
+@app.teardown_request
+def release_admission(exc):
+    if 'admission_slot' in g:
+        g.admission_slot.release()
+
+# Profiling: an administrator can have a single request run under cProfile by sending
+# "X-CFDE-Profile: inline" (the response body is replaced by the profile breakdown) or
+# "X-CFDE-Profile: store" (the profile is written to PROFILE_DIR and its id returned in
+# the X-CFDE-Profile-Id header).
+@app.before_request
+def start_profiler():
+    mode = request.headers.get('X-CFDE-Profile')
+    if not app.config["PROFILING"] or mode not in ('inline', 'store') or not _is_admin():
+        return
+    g.profile_mode = mode
+    g.profile_start = time.perf_counter()
+    import cProfile
+    g.profiler = cProfile.Profile()
+    g.profiler.enable()
+
+@app.after_request
+def finish_profiler(response):
+    if 'profiler' not in g:
+        return response
+    g.profiler.disable()
+    summary = profiling.breakdown(g.profiler, time.perf_counter() - g.profile_start)
+    summary['path'] = request.full_path
+    summary['status'] = response.status_code
+
+    if g.profile_mode == 'inline':
+        res = make_response(json.dumps(summary), 200)
+        res.mimetype = 'application/json'
+        res.headers['Cache-Control'] = 'no-store'
+        return res
+
+    profile_id = "%s-%d" % (datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f'), os.getpid())
+    profiling.store(g.profiler, summary, app.config["PROFILE_DIR"], profile_id)
+    response.headers['X-CFDE-Profile-Id'] = profile_id
+    return response
+
+# Report where the request's time went (Server-Timing) and record request metrics.
+@app.after_request
+def add_upstream_headers(response):
+    response.headers['X-CFDE-Upstream-Memo-Hits'] = str(upstream.memo_hits())
+
+    timing = []
+    for name, (calls, seconds) in sorted(upstream.timings().items()):
+        timing.append('%s;dur=%.1f;desc="%d calls"' % (name, seconds * 1000, calls))
+    if 'admission_wait' in g:
+        timing.append('queue;dur=%.1f' % (g.admission_wait * 1000,))
+    if 'request_start' in g:
+        elapsed = time.perf_counter() - g.request_start
+        timing.append('total;dur=%.1f' % (elapsed * 1000,))
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        metrics.inc('dashboard_requests_total', { 'route': route, 'status': str(response.status_code) })
+        metrics.observe('dashboard_request_duration_seconds', { 'route': route }, elapsed)
+    if timing:
+        response.headers['Server-Timing'] = ', '.join(timing)
+
+    metrics.flush()
+    return response
+
+# Responses computed against a pinned catalog snaptime never change: cache them and, when the
+# client asked for the snaptime explicitly (i.e., the URL identifies the snapshot), let
+# browsers and the CDN keep them forever.  A stale response was not computed against it.
+@app.after_request
+def add_snapshot_headers(response):
+    snaptime = g.get('snaptime')
+    if snaptime is None or g.get('stale_response'):
+        return response
+
+    response.headers['X-CFDE-Snaptime'] = snaptime
+    if response.status_code != 200:
+        return response
+
+    if result_cache is not None and not g.get('snapshot_cache_hit') and not response.is_streamed:
+        result_cache.put(g.snapshot_cache_key, g.snapshot_catalog_id, request.endpoint,
+                         response.get_data(), response.mimetype)
+    if request.args.get("snaptime"):
+        scope = "public" if _cache_scope(g.snapshot_catalog_id) == "public" or _identity_key() == "anonymous" else "private"
+        response.headers['Cache-Control'] = scope + ", max-age=31536000, immutable"
+    return response
+
+# Keep the last successful response to each URL (per identity) to serve if a later request for it
+# runs out of time or finds its upstream unavailable.
+@app.after_request
+def store_last_good_response(response):
+    if not _serve_stale():
+        return response
+    if response.status_code != 200 or response.is_streamed or 'profiler' in g \
+       or g.get('stale_response') or g.get('snapshot_cache_hit'):
+        return response
+    if request.method != 'GET' or request.endpoint in (None, 'prometheus_metrics', 'health', 'job_status') \
+       or request.endpoint.startswith('admin_'):
+        return response
+    result_cache.put_last_good(_last_good_cache_key(), g.get('catalog_id'), request.endpoint,
+                               response.get_data(), response.mimetype)
+    return response
+
+# Whether last good responses are kept for, and served to, this request (SERVE_STALE); never for
+# IDENTITY_SCOPED_ROUTES, whose responses are the caller's own data.
+def _serve_stale():
+    return result_cache is not None and app.config["SERVE_STALE"] \
+        and not any(pattern.search(request.path) for pattern in identity_scoped_routes)
+
+def _last_good_cache_key():
+    return "last-good %s %s" % (_cache_scope(g.get('catalog_id')), request.full_path)
 
 def _get_scheme():
+    if app.config["DERIVA_SCHEME"]:
+        return app.config["DERIVA_SCHEME"]
     return "http" if HOSTNAME == "localhost" else "https"
 
 # Retrieve DashboardQueryHelper for the specified catalogid, using default catalogid if None.
 #
+# If the request has a snaptime parameter (or PIN_SNAPTIME is set) the returned helper is pinned
+# to that catalog snapshot, and a cached response is returned instead if one exists.
+#
 def _get_helper(catalog_id):
     if catalog_id is None:
         catalog_id = DEFAULT_CATALOG_ID
@@ -58,13 +402,74 @@ def _get_helper(catalog_id):
     if isinstance(catalog_id, int):
         catalog_id = str(catalog_id)
 
+    if not has_request_context():
+        return _get_catalog_helper(catalog_id)
+
+    g.catalog_id = catalog_id
+    snaptime = request.args.get("snaptime")
+    if snaptime:
+        # the unpinned helper isn't needed (e.g., for the catalogs of a time series)
+        try:
+            _decode_ermrest_snaptime(snaptime)
+        except (KeyError, OverflowError):
+            return _error_response("Invalid snaptime '" + snaptime + "'", 400)
+    else:
+        helper = _get_catalog_helper(catalog_id)
+        if isinstance(helper, wrappers.Response) or not PIN_SNAPTIME:
+            return helper
+        snaptime = _current_snaptime(helper)
+
+    g.snaptime = snaptime
+    g.snapshot_catalog_id = catalog_id
+    g.snapshot_cache_key = _snapshot_cache_key(catalog_id, snaptime)
+    if result_cache is not None:
+        cached = result_cache.get(g.snapshot_cache_key, catalog_id, request.endpoint)
+        if cached is not None:
+            g.snapshot_cache_hit = True
+            metrics.inc('dashboard_cache_requests_total', { 'cache': 'snapshot', 'result': 'hit' })
+            return app.response_class(cached[0], mimetype=cached[1])
+        metrics.inc('dashboard_cache_requests_total', { 'cache': 'snapshot', 'result': 'miss' })
+
+    return _get_catalog_helper(catalog_id, snaptime)
+
+# Key for a response computed against catalog_id@snaptime. Catalog content visible to the
+# caller may depend on their identity (headers are passed through), so unless the result is
+# public that is part of the key.
+def _snapshot_cache_key(catalog_id, snaptime):
+    args = urllib.parse.urlencode(sorted(request.args.items(multi=True)))
+    return "%s@%s %s %s?%s" % (catalog_id, snaptime, _cache_scope(catalog_id), request.path, args)
+
+# Partition under which this request's results are cached: "public" (shared by all callers) if
+# they come from catalog_id, a catalog every caller sees in full (see PUBLIC_CATALOG_IDS), or
+# from a catalog read anonymously, and the route is not identity-scoped; otherwise the caller's
+# identity key.
+def _cache_scope(catalog_id):
+    if catalog_id is not None and (catalog_id in public_catalog_ids or not PASS_HEADERS) \
+       and not any(pattern.search(request.path) for pattern in identity_scoped_routes):
+        return "public"
+    return _identity_key()
+
+# Identifies the caller's credentials: the bearer token or webauthn session cookie they send (other
+# cookies, e.g. load balancer affinity, don't affect what ERMrest lets them see)
+def _identity_key():
+    creds = [c for c in (request.headers.get('Authorization'), request.cookies.get('webauthn')) if c]
+    if not creds:
+        return "anonymous"
+    return hashlib.sha256("\n".join(creds).encode('utf-8')).hexdigest()
+
+def _get_catalog_helper(catalog_id, snaptime=None):
+    if snaptime is not None:
+        return _get_snapshot_helper(catalog_id, snaptime)
+
     if catalog_id not in helpers:
         err = None
         try:
-            helpers[catalog_id] = DashboardQueryHelper(HOSTNAME,
-                                                       catalog_id,
-                                                       scheme=_get_scheme(),
-                                                       caching=False)
+            helper = _dashboard_queries().DashboardQueryHelper(HOSTNAME,
+                                                               catalog_id,
+                                                               scheme=_get_scheme(),
+                                                               caching=False)
+            upstream.instrument_catalog(helper.catalog, 'catalog')
+            helpers[catalog_id] = helper
         # invalid catalog id
         except HTTPError as e:
             err = e
@@ -80,6 +485,61 @@ def _get_helper(catalog_id):
 
     return helpers[catalog_id]
 
+# Snapshot binding that reuses an already fetched catalog model for its path builder
+class _ModelSnapshot(ErmrestSnapshot):
+    def __init__(self, model, *args, **kwargs):
+        super(_ModelSnapshot, self).__init__(*args, **kwargs)
+        self._model = model
+
+    def getCatalogModel(self):
+        return self._model
+
+# Retrieve a DashboardQueryHelper bound to catalog_id@snaptime: a copy of the catalog's unpinned
+# helper whose catalog and path builder read the snapshot, sharing the unpinned helper's model.
+def _get_snapshot_helper(catalog_id, snaptime):
+    key = catalog_id + "@" + snaptime
+    if key in snapshot_helpers:
+        snapshot_helpers.move_to_end(key)
+        return snapshot_helpers[key]
+
+    base = _get_catalog_helper(catalog_id)
+    if isinstance(base, wrappers.Response):
+        return base
+
+    catalog = _ModelSnapshot(base.builder._wrapped_model, _get_scheme(), HOSTNAME, catalog_id, snaptime,
+                             caching=False)
+    upstream.instrument_catalog(catalog, 'catalog')
+    helper = copy.copy(base)
+    helper.catalog = catalog
+    helper.builder = catalog.getPathBuilder()
+    snapshot_helpers[key] = helper
+    while len(snapshot_helpers) > app.config["SNAPSHOT_HELPERS_MAX"]:
+        snapshot_helpers.popitem(last=False)[1].catalog._close_session()
+    return helper
+
+# Retrieve (ErmrestCatalog, path builder) for the specified catalogid, e.g. "registry".
+# In dev mode (DEV_TOKEN set) the catalog carries the dev token as its credential, unless an
+# anonymous binding is asked for.
+#
+def _get_catalog(catalog_id, anonymous=False):
+    key = catalog_id + " anonymous" if anonymous and webauthn_token else catalog_id
+    if key not in catalogs:
+        session_config = DEFAULT_SESSION_CONFIG.copy()
+        session_config["allow_retry_on_all_methods"] = True
+        credentials = core_utils.format_credential(token=webauthn_token) if webauthn_token and not anonymous else None
+        catalog = ErmrestCatalog(
+            _get_scheme(),
+            HOSTNAME,
+            catalog_id,
+            caching=False,
+            credentials=credentials,
+            session_config=session_config
+        )
+        upstream.instrument_catalog(catalog, 'registry' if catalog_id == 'registry' else 'catalog')
+        catalogs[key] = (catalog, catalog.getPathBuilder())
+
+    return catalogs[key]
+
 def pass_headers():
     return dict(request.headers) if PASS_HEADERS else DEFAULT_HEADERS
 
@@ -128,6 +588,10 @@ def _id_to_dcc_nid(helper, dcc_id):
     return None
 
 def _all_dccs(helper):
+    pre = _preloaded(helper)
+    if pre is not None:
+        return [dict(zip(DCC_FIELDS, dcc)) for dcc in pre.dccs]
+
     path = helper.builder.CFDE.dcc.path
 
     res = path.attributes(
@@ -144,6 +608,20 @@ def _all_dccs(helper):
     ).fetch(headers=pass_headers())
     return res
 
+# ERMrest snaptime encoding, for _decode_ermrest_snaptime()
+SNAPTIME_EPOCH = datetime.datetime.fromisoformat('1970-01-01 00:00:00')
+SNAPTIME_MICROSECOND = datetime.timedelta(microseconds=1)
+SNAPTIME_SYMBOLS = {
+    '0123456789ABCDEFGHJKMNPQRSTVWXYZ'[i]: i
+    for i in range(32)
+}
+# these are considered equivalent for transcription
+SNAPTIME_SYMBOLS.update({
+    'O': 0,
+    'I': 1,
+    'L': 1,
+})
+
 def _decode_ermrest_snaptime(s):
     """Decode ERMrest's native snaptime to a timestamp
 
@@ -158,32 +636,18 @@ def _decode_ermrest_snaptime(s):
     time.
 
     """
-    epoch = datetime.datetime.fromisoformat('1970-01-01 00:00:00')
-    one_second = datetime.timedelta(seconds=1)
-
-    symbol_to_val = {
-        '0123456789ABCDEFGHJKMNPQRSTVWXYZ'[i]: i
-        for i in range(32)
-    }
-    # these are considered equivalent for transcription
-    symbol_to_val.update({
-        'O': 0,
-        'I': 1,
-        'L': 1,
-    })
-
     s = s.replace('-', '')    # strip zero-info hyphens
 
     # decode 5 bits per symbol
     accum = 0
     for x in s:
-        accum = (accum << 5) + symbol_to_val[x]
+        accum = (accum << 5) + SNAPTIME_SYMBOLS[x]
 
     # drop final pad bit
     accum = accum >> 1
 
     # interpret as microseconds since epoch
-    ts = epoch + one_second * (accum / 1000000)
+    ts = SNAPTIME_EPOCH + SNAPTIME_MICROSECOND * accum
     return ts
 
 def _ermrest_catalog_snaptime(helper):
@@ -197,9 +661,15 @@ def _ermrest_catalog_snaptime(helper):
     content as a whole
 
     """
-    resp = helper.catalog.get('/').json()
-    snaptime = resp['snaptime']
-    return _decode_ermrest_snaptime(snaptime)
+    return _decode_ermrest_snaptime(_current_snaptime(helper))
+
+# The catalog's current snaptime, as last seen by the snaptime poller if it is running
+def _current_snaptime(helper):
+    if snaptime_poller is not None:
+        snaptime = snaptime_poller.snaptime(helper.catalog.catalog_id)
+        if snaptime is not None:
+            return snaptime
+    return helper.catalog.get('/').json()['snaptime']
 
 # -------------------------------------------------------------------------
 # API methods for https://github.com/nih-cfde/api/blob/master/api_spec.yml
@@ -227,6 +697,52 @@ def dcc_list():
 
     return json.dumps(dcc_list)
 
+# Fields of the /dcc_info response (CatalogGeneralInfo) -> the _get_dcc_entity_counts() count
+# it needs, if any
+CATALOG_INFO_FIELDS = collections.OrderedDict([
+    ('catalog_id', None),
+    ('subject_count', 'subject'),
+    ('biosample_count', 'biosample'),
+    ('file_count', 'file'),
+    ('project_count', 'project'),
+    ('anatomy_count', 'anatomies'),
+    ('assay_count', 'assay_types'),
+    ('disease_count', 'disease'),
+    ('gene_count', 'gene'),
+    ('compound_count', 'compound'),
+])
+
+# Fields of the /dcc/{dccId} response (DCCGeneralInfo) -> the _get_dcc_entity_counts() count it
+# needs, 'datapackage' for the registry's datapackage, or None for the DCC's own record
+DCC_INFO_FIELDS = collections.OrderedDict([
+    ('id', None),
+    ('abbreviation', None),
+    ('complete_name', None),
+    ('description', None),
+    ('principal_investigators', None),
+    ('url', None),
+    ('project_count', 'project'),
+    ('toplevel_project_count', 'project'),
+    ('subject_count', 'subject'),
+    ('biosample_count', 'biosample'),
+    ('file_count', 'file'),
+    ('last_updated', 'datapackage'),
+    ('nid', None),
+    ('datapackage_RID', 'datapackage'),
+])
+
+# Returns the response fields selected by the request's fields parameter (e.g. fields=id,url),
+# in the order of all_fields, or all of them if it is absent; and an error message if it names
+# a field not in all_fields.
+def _requested_fields(all_fields):
+    fields = request.args.get("fields")
+    if fields is None:
+        return list(all_fields), None
+    names = set(f.strip() for f in fields.split(',') if f.strip())
+    if not names or not names.issubset(all_fields):
+        return None, "Illegal fields requested - must be one or more of " + ",".join(all_fields.keys())
+    return [f for f in all_fields if f in names], None
+
 # /dcc_info
 # Returns summary info for all DCCs in the archive, similar to /dcc/{dccId} for
 # a single DCC.
@@ -240,31 +756,18 @@ def all_dcc_info():
     if catalog_id is None:
         catalog_id = DEFAULT_CATALOG_ID
 
-    num_subjects = 0
-    num_biosamples = 0
-    num_files = 0
-    num_projects = 0
+    fields, err = _requested_fields(CATALOG_INFO_FIELDS)
+    if err is not None:
+        return _error_response(err, 400)
 
-    # subject, file, biosample, and project counts
-    counts = _get_dcc_entity_counts(helper, None, { 'subject': True, 'file': True, 'biosample': True, 'project': True, 'anatomies': True, 'assay_types': True, 'disease' : True, 'gene' : True, 'compound' : True })
-    # all DCCs
-    dccs = _all_dccs(helper)
+    # only the counts the requested fields need
+    needed = { CATALOG_INFO_FIELDS[f]: True for f in fields if CATALOG_INFO_FIELDS[f] is not None }
+    counts = _get_dcc_entity_counts(helper, None, needed) if needed else {}
 
-    # last_updated = max([ dcc.['last_updated'] for dcc in dccs ])
-
-    return json.dumps({
-        'catalog_id': catalog_id,
-        'subject_count': counts['subject_count'],
-        'biosample_count': counts['biosample_count'],
-        'file_count': counts['file_count'],
-        'project_count': counts['project_count'],
-        'anatomy_count': counts['anatomy_count'],
-        'assay_count': counts['assay_count'],
-        'disease_count': counts['disease_count'],
-        'gene_count': counts['gene_count'],
-        'compound_count': counts['compound_count']
-        #'last_updated': last_updated,
-    })
+    # last_updated = max([ dcc.['last_updated'] for dcc in _all_dccs(helper) ])
+
+    res = dict(counts, catalog_id=catalog_id)
+    return json.dumps({ f: res[f] for f in fields })
 
 # /dcc/{dccId}
 # Returns general information about the specified DCC, such as the Principal Investigator(s) and description.
@@ -301,30 +804,29 @@ def dcc_info(dcc_id):
         return _dcc_not_found_response(dcc_id)
 
     # DCC found
+    fields, err = _requested_fields(DCC_INFO_FIELDS)
+    if err is not None:
+        return _error_response(err, 400)
+    needed = set(DCC_INFO_FIELDS[f] for f in fields)
 
-    # subject, file, and biosample counts
-    counts = _get_dcc_entity_counts(helper, dcc['nid'], { 'subject': True, 'file': True, 'biosample': True, 'project': True })
-
-    # interrogate registry for datapackage RID
-    session_config = DEFAULT_SESSION_CONFIG.copy()
-    session_config["allow_retry_on_all_methods"] = True
-    r_catalog = ErmrestCatalog(_get_scheme(), HOSTNAME, 'registry', caching=False, session_config=session_config)
-    r_builder = r_catalog.getPathBuilder()
-    r_schema = r_catalog.getCatalogModel().schemas['CFDE']
-
-    # TODO - use a more direct approach, if possible:
-    dp_path = r_builder.CFDE.datapackage
-    dp_path = dp_path.filter(dp_path.review_summary_url.regexp('catalogId=%s$' % (catalog_id,)))
-    res = dp_path.entities().fetch(headers=pass_headers())
+    # subject, file, biosample and project counts, as far as the requested fields need them
+    counts = {}
+    needed_counts = { c: True for c in needed - {None, 'datapackage'} }
+    if needed_counts:
+        counts = _get_dcc_entity_counts(helper, dcc['nid'], needed_counts)
 
     dp_rid = None
     last_updated = None    
         
-    if res:
-        dp_rid = res[0]['RID']
-        last_updated = res[0]['submission_time']
-
-    return json.dumps({
+    # interrogate registry for datapackage RID
+    if 'datapackage' in needed:
+        dp = _find_datapackage(catalog_id, pass_headers())
+        if dp is not None:
+            dp_rid = dp['RID']
+            last_updated = dp['submission_time']
+
+    res = dict(counts)
+    res.update({
         'id': dcc['id'],
         'abbreviation': dcc['dcc_abbreviation'],
         'complete_name': dcc['dcc_name'],
@@ -332,15 +834,53 @@ def dcc_info(dcc_id):
         # TODO - current schema has primary contact, but no explicit info on PIs
         'principal_investigators': [],
         'url': dcc['dcc_url'],
-        'project_count': counts['project_count'],
-        'toplevel_project_count': counts['toplevel_project_count'],
-        'subject_count': counts['subject_count'],
-        'biosample_count': counts['biosample_count'],
-        'file_count': counts['file_count'],
         'last_updated': last_updated,
         'nid': dcc['nid'],
         'datapackage_RID': dp_rid,
     })
+    return json.dumps({ f: res[f] for f in fields })
+
+# Returns the registry's datapackage row (with RID, id and submission_time) for catalog_id, or None.
+#
+# The datapackages the registry shows anonymously are indexed by catalog id (parsed from their
+# review_summary_url, ".../catalogId=N") with one fetch per registry snaptime, which is known
+# without an upstream call while the snaptime poller runs. A catalog missing from the index (e.g.,
+# a datapackage visible only to its submitters) is looked up with the caller's headers.
+def _find_datapackage(catalog_id, headers):
+    row = _datapackage_index().get(str(catalog_id))
+    if row is not None:
+        return row
+
+    r_catalog, r_builder = _get_catalog('registry')
+    dp_path = r_builder.CFDE.datapackage
+    dp_path = dp_path.filter(dp_path.review_summary_url.regexp('catalogId=%s$' % (catalog_id,)))
+    res = dp_path.entities().fetch(headers=headers)
+    return res[0] if res else None
+
+# Returns the index of anonymously visible datapackages (catalog id -> row); see
+# _find_datapackage().  It is rebuilt when the poller sees the registry change or, when the poller
+# doesn't know the registry's snaptime, once it is DATAPACKAGE_INDEX_MAX_AGE seconds old.
+def _datapackage_index():
+    global datapackage_index
+    snaptime = snaptime_poller.snaptime('registry') if snaptime_poller is not None else None
+    if not _datapackage_index_current(snaptime):
+        with datapackage_index_lock:
+            if not _datapackage_index_current(snaptime):
+                registry, r_builder = _get_catalog('registry', anonymous=True)
+                dp = r_builder.CFDE.datapackage
+                index = {}
+                for row in dp.attributes(dp.RID, dp.id, dp.submission_time, dp.review_summary_url).fetch():
+                    m = re.search(r'catalogId=([0-9]+)$', row['review_summary_url'] or '')
+                    if m:
+                        index.setdefault(m.group(1), row)
+                datapackage_index = (snaptime, time.time(), index)
+    return datapackage_index[2]
+
+def _datapackage_index_current(snaptime):
+    built_snaptime, built, index = datapackage_index
+    if snaptime is not None:
+        return built_snaptime == snaptime
+    return time.time() - built < app.config["DATAPACKAGE_INDEX_MAX_AGE"]
 
 # /dcc/{dccId}/projects
 # Returns a listing of (top-level) projects associated with the specified DCC.
@@ -358,19 +898,21 @@ def dcc_projects(dcc_id):
         return _dcc_not_found_response(dcc_id)
 
     # DCC found
-    projects = helper.list_projects(parent_project_nid=dcc_proj_nid)
-    res = []
-    for proj in projects:
-        # TODO - nothing in project appears to be non-nullable
-        name = None
-        for field in ('name', 'abbreviation', 'description', 'id'):
-            if proj[field] is not None:
-                name = proj[field]
-                break
-        res.append(name)
+    pre = _preloaded(helper)
+    if pre is not None:
+        return json.dumps(list(pre.project_children.get(dcc_proj_nid, ())))
 
+    projects = helper.list_projects(parent_project_nid=dcc_proj_nid)
+    res = [_project_display_name(proj) for proj in projects]
     return json.dumps(res)
 
+def _project_display_name(proj):
+    # TODO - nothing in project appears to be non-nullable
+    for field in ('name', 'abbreviation', 'description', 'id'):
+        if proj[field] is not None:
+            return proj[field]
+    return None
+
 # /dcc/{dccId}/filecount
 # Returns the number of files associated with a particular DCC broken down by data type.
 @app.route('/dcc/<string:dcc_id>/filecount', methods=['GET'])
@@ -387,28 +929,43 @@ def dcc_filecount(dcc_id):
         return _dcc_not_found_response(dcc_id)
 
     # DCC found
-    fcounts = list(StatsQuery2(helper).entity('file').dimension('data_type').dimension('dcc').fetch_flattened(headers=pass_headers()))
+    fcounts, labels = _stats_cube(helper, 'file', ['data_type', 'dcc'], 'num_files')
     res = {}
 
-    for fc in fcounts:
-        if fc['dcc'] is None:
-            pass
-        elif fc['dcc']['nid'] == dcc_nid:
+    for (data_type, nid), count in fcounts.items():
+        if nid == dcc_nid:
             key = None
-            if fc['data_type'] is None:
+            if data_type is None:
                 key = 'Not Specified'
             else:
-                key = fc['data_type']['name']
+                key = labels['data_type'][data_type]
 
             if key in res:
-                res[key] += fc['num_files']
+                res[key] += count
             else:
-                res[key] = fc['num_files']
+                res[key] = count
 
     return json.dumps(res)
 
+# _get_dcc_entity_counts() result key -> the count that selects it
+ENTITY_COUNT_SELECTIONS = {
+    'project_count': 'project', 'toplevel_project_count': 'project',
+    'subject_count': 'subject', 'subject_with_biosample_count': 'subject_with_biosample',
+    'subject_with_file_count': 'subject_with_file', 'biosample_count': 'biosample',
+    'biosample_with_subject_count': 'biosample_with_subject', 'biosample_with_file_count': 'biosample_with_file',
+    'file_count': 'file', 'file_with_subject_count': 'file_with_subject',
+    'file_with_biosample_count': 'file_with_biosample', 'anatomy_count': 'anatomies',
+    'assay_count': 'assay_types', 'disease_count': 'disease', 'gene_count': 'gene',
+    'compound_count': 'compound',
+}
+
 # don't filter by DCC if dcc_nid is None
 def _get_dcc_entity_counts(helper, dcc_nid, counts):
+    pre = _preloaded(helper)
+    if pre is not None and dcc_nid in pre.counts:
+        return { key: value for key, value in pre.counts[dcc_nid].items()
+                 if (counts is None) or (ENTITY_COUNT_SELECTIONS[key] in counts) }
+
     res = {}
 
     # get path to all subprojects of DCC
@@ -461,101 +1018,133 @@ def _get_dcc_entity_counts(helper, dcc_nid, counts):
         file_path = proj_path.link(cf, on=(proj_path.pipt.member_project == cf.project)).link(f)
         return file_path
 
+    # aggregate queries to run: result key -> (path with aggregates, its alias)
+    queries = {}
+
     # project counts - all and only children of top-level DCC project node
     if (counts is None) or ('project' in counts):
         pp = get_proj_path()
-        qr = pp.aggregates(CntD(pp.pipt.member_project).alias('num_projects')).fetch(headers=pass_headers())
-        res['project_count'] = qr[0]['num_projects'] - 1
+        queries['project_count'] = (pp.aggregates(CntD(pp.pipt.member_project).alias('num_projects')), 'num_projects')
 
         sp = get_subproj_path()
-        qr = sp.aggregates(CntD(sp.pip.child_project).alias('num_projects')).fetch(headers=pass_headers())
-        res['toplevel_project_count'] = qr[0]['num_projects']
+        queries['toplevel_project_count'] = (sp.aggregates(CntD(sp.pip.child_project).alias('num_projects')), 'num_projects')
 
     # subject count
     if (counts is None) or ('subject' in counts):
         sp = get_subj_path()
-        qr = sp.aggregates(CntD(sp.s.nid).alias('num_subjects')).fetch(headers=pass_headers())
-        res['subject_count'] = qr[0]['num_subjects']
+        queries['subject_count'] = (sp.aggregates(CntD(sp.s.nid).alias('num_subjects')), 'num_subjects')
 
     # subjects linked to biosamples
     if (counts is None) or ('subject_with_biosample' in counts):
         bs = helper.builder.CFDE.biosample_from_subject
         sp = get_subj_path().link(bs)
-        qr = sp.aggregates(CntD(sp.s.nid).alias('num_subjects_with_biosamples')).fetch(headers=pass_headers())
-        res['subject_with_biosample_count'] = qr[0]['num_subjects_with_biosamples']
+        queries['subject_with_biosample_count'] = (sp.aggregates(CntD(sp.s.nid).alias('num_subjects_with_biosamples')),
+                                                   'num_subjects_with_biosamples')
 
     # subjects linked to files
     if (counts is None) or ('subject_with_file' in counts):
         fs = helper.builder.CFDE.file_describes_subject
         sp = get_subj_path().link(fs)
-        qr = sp.aggregates(CntD(sp.s.nid).alias('num_subjects_with_files')).fetch(headers=pass_headers())
-        res['subject_with_file_count'] = qr[0]['num_subjects_with_files']
+        queries['subject_with_file_count'] = (sp.aggregates(CntD(sp.s.nid).alias('num_subjects_with_files')),
+                                              'num_subjects_with_files')
 
     # biosample count
     if (counts is None) or ('biosample' in counts):
         bp = get_biosample_path()
-        qr = bp.aggregates(CntD(bp.b.nid).alias('num_biosamples')).fetch(headers=pass_headers())
-        res['biosample_count'] = qr[0]['num_biosamples']
+        queries['biosample_count'] = (bp.aggregates(CntD(bp.b.nid).alias('num_biosamples')), 'num_biosamples')
 
     # biosamples linked to subjects
     if (counts is None) or ('biosample_with_subject' in counts):
         bp = get_biosample_path().link(bs)
-        qr = bp.aggregates(CntD(bp.b.nid).alias('num_biosamples_with_subjects')).fetch(headers=pass_headers())
-        res['biosample_with_subject_count'] = qr[0]['num_biosamples_with_subjects']
+        queries['biosample_with_subject_count'] = (bp.aggregates(CntD(bp.b.nid).alias('num_biosamples_with_subjects')),
+                                                   'num_biosamples_with_subjects')
 
     # biosamples about which files were produced
     if (counts is None) or ('biosample_with_file' in counts):
         fb = helper.builder.CFDE.file_describes_biosample
         bp = get_biosample_path().link(fb)
-        qr = bp.aggregates(CntD(bp.b.nid).alias('num_biosamples_with_files')).fetch(headers=pass_headers())
-        res['biosample_with_file_count'] = qr[0]['num_biosamples_with_files']
+        queries['biosample_with_file_count'] = (bp.aggregates(CntD(bp.b.nid).alias('num_biosamples_with_files')),
+                                                'num_biosamples_with_files')
 
     # file count
     if (counts is None) or ('file' in counts):
         fp = get_file_path()
-        qr = fp.aggregates(CntD(fp.f.nid).alias('num_files')).fetch(headers=pass_headers())
-        res['file_count'] = qr[0]['num_files']
+        queries['file_count'] = (fp.aggregates(CntD(fp.f.nid).alias('num_files')), 'num_files')
 
     # files describing subjects
     if (counts is None) or ('file_with_subject' in counts):
         fs = helper.builder.CFDE.file_describes_subject
         sp = get_file_path().link(fs)
-        qr = sp.aggregates(CntD(sp.f.nid).alias('num_files_with_subjects')).fetch(headers=pass_headers())
-        res['file_with_subject_count'] = qr[0]['num_files_with_subjects']
+        queries['file_with_subject_count'] = (sp.aggregates(CntD(sp.f.nid).alias('num_files_with_subjects')),
+                                              'num_files_with_subjects')
 
     # files describing biosamples
     if (counts is None) or ('file_with_biosample' in counts):
         fb = helper.builder.CFDE.file_describes_biosample
         sp = get_file_path().link(fb)
-        qr = sp.aggregates(CntD(sp.f.nid).alias('num_files_with_biosamples')).fetch(headers=pass_headers())
-        res['file_with_biosample_count'] = qr[0]['num_files_with_biosamples']
-
-    if (counts is None) or ('anatomies' in counts):
-        an = helper.builder.CFDE.anatomy.alias("anatomy_alias")
-        qr = an.entities().fetch(headers=pass_headers())
-        res['anatomy_count'] = len(qr)
-
-    if (counts is None) or ('assay_types' in counts):
-        at = helper.builder.CFDE.assay_type.alias("assay_types_alias")
-        qr = at.entities().fetch(headers=pass_headers())
-        res['assay_count'] = len(qr)
-
-    if (counts is None) or ('disease' in counts):
-        di = helper.builder.CFDE.disease.alias("disease_alias")
-        qr = di.entities().fetch(headers=pass_headers())
-        res['disease_count'] = len(qr)
-
-    if (counts is None) or ('gene' in counts):
-        ge = helper.builder.CFDE.gene.alias("gene_alias")
-        qr = ge.entities().fetch(headers=pass_headers())
-        res['gene_count'] = len(qr)
-
-    if (counts is None) or ('compound' in counts):
-        co = helper.builder.CFDE.compound.alias("compound_alias")
-        qr = co.entities().fetch(headers=pass_headers())
-        res['compound_count'] = len(qr)
+        queries['file_with_biosample_count'] = (sp.aggregates(CntD(sp.f.nid).alias('num_files_with_biosamples')),
+                                                'num_files_with_biosamples')
+
+    # vocabulary term counts, from the preloaded vocabularies if any
+    for count, table, key in [('anatomies', 'anatomy', 'anatomy_count'),
+                              ('assay_types', 'assay_type', 'assay_count'),
+                              ('disease', 'disease', 'disease_count'),
+                              ('gene', 'gene', 'gene_count'),
+                              ('compound', 'compound', 'compound_count')]:
+        if (counts is None) or (count in counts):
+            if pre is not None and table in pre.vocabularies:
+                res[key] = len(pre.vocabularies[table])
+            else:
+                vt = helper.builder.CFDE.tables[table].alias(table + "_alias")
+                queries[key] = (vt.aggregates(Cnt(vt.nid).alias('num_terms')), 'num_terms')
+
+    fetched = _fetch_all({ key: path for key, (path, alias) in queries.items() })
+    for key, (path, alias) in queries.items():
+        res[key] = fetched[key][0][alias]
+    if 'project_count' in res:
+        # the DCC's own project is not counted
+        res['project_count'] -= 1
+
     return res
 
+# Return this process's thread pool of the given name, starting it if necessary.
+def _executor(name, threads):
+    with executors_lock:
+        pid, executor = executors.get(name, (None, None))
+        if executor is None or pid != os.getpid():
+            # threads don't survive fork(), so each process starts its own pool
+            executor = concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix=name)
+            executors[name] = (os.getpid(), executor)
+        return executor
+
+# Fetch several independent datapath results ({key: path}), in parallel on the subquery executor
+# if SUBQUERY_THREADS is set; returns {key: result}.  Subqueries still waiting to run when the
+# request deadline passes are cancelled and DeadlineExceeded is raised.
+def _fetch_all(paths):
+    headers = pass_headers()
+    if not app.config["SUBQUERY_THREADS"] or len(paths) < 2:
+        return { key: path.fetch(headers=headers) for key, path in paths.items() }
+
+    # each subquery runs in a copy of this context, so it shares the request's deadline and
+    # upstream memo (flask.g)
+    executor = _executor('subquery', app.config["SUBQUERY_THREADS"])
+    futures = { executor.submit(contextvars.copy_context().run, path.fetch, headers=headers): key
+                for key, path in paths.items() }
+    done, pending = concurrent.futures.wait(futures, timeout=upstream.remaining(),
+                                            return_when=concurrent.futures.FIRST_EXCEPTION)
+    if pending and not any(f.exception() for f in done):
+        # wait() only returns early on an exception, so this is the deadline; running
+        # subqueries will time out themselves
+        for f in pending:
+            f.cancel()
+        raise upstream.DeadlineExceeded("request deadline exceeded with %d subqueries outstanding" % len(pending))
+    for f in done:
+        if f.exception() is not None:
+            for p in pending:
+                p.cancel()
+            raise f.exception()
+    return { key: f.result() for f, key in futures.items() }
+
 # /dcc/{dccId}/linkcount
 # Returns the number of linked entities for various combinations.
 @app.route('/dcc/<string:dcc_id>/linkcount', methods=['GET'])
@@ -608,6 +1197,137 @@ SQ2_DIMENSION_MAP = {
     'subject_role':  { 'att': 'name' },
 }
 
+# Reads the results of StatsQuery2 sh, which groups by groupings, keeping only each row's
+# dimension keys and measure.  Returns (counts, labels): counts maps tuples of dimension nids
+# (None where the dimension is not specified), in _nids_order(), to the summed measure (None
+# counted as 0); labels maps each grouping to a dict of nid -> label (its SQ2_DIMENSION_MAP
+# attribute).
+#
+# StatsQuery2 rows embed the full dimension records, e.g.
+#
+# {'num_files': 789,
+#  'total_size_in_bytes': 970063224,
+#  'dcc': {'nid': 1,
+#          'id': 'cfde_registry_dcc:sparc',
+#          'dcc_name': 'Stimulating Peripheral Activity to Relieve Conditions',
+#          'dcc_abbreviation': 'SPARC',
+#          'dcc_description': 'To transform our understanding of nerve-organ interactions
+#             by providing access to high-value datasets, maps, and computational studies
+#             with the intent of advancing bioelectronic medicine towards treatments that
+#             change lives. The SPARC program is supported by the NIH Common Fund to
+#             accelerate development of therapeutic devices and identification of neural
+#             targets for bioelectronic medicine—modulating electrical activity in nerves
+#             to help treat diseases and conditions, such as hypertension and gastrointestinal
+#             disorders, by precisely adjusting organ function.'},
+#  'assay_type': None}
+#
+# so each record is reduced to its nid as it is read, and its label kept once per nid.
+def _compact_stats(sh, groupings, measure):
+    counts = {}
+    labels = { grouping: {} for grouping in groupings }
+    atts = [SQ2_DIMENSION_MAP[grouping]['att'] for grouping in groupings]
+
+    for ct in sh.fetch_flattened(headers=pass_headers()):
+        key = []
+        for grouping, att in zip(groupings, atts):
+            dim = ct[grouping]
+            if dim is not None:
+                nid = dim['nid']
+                if nid not in labels[grouping]:
+                    labels[grouping][nid] = dim[att]
+                dim = nid
+            key.append(dim)
+        key = tuple(key)
+        counts[key] = counts.get(key, 0) + (ct[measure] or 0)
+
+    return dict(sorted(counts.items(), key=_nids_order)), labels
+
+# Sort key for the (nids, count) items of _compact_stats() counts: by nid in each dimension, not
+# specified first, so that results don't depend on the order of StatsQuery2 rows or on which
+# grouping order filled a cached cube
+def _nids_order(item):
+    return tuple((nid is not None, nid or 0) for nid in item[0])
+
+# Returns _compact_stats() of StatsQuery2 on entity grouped by groupings, for this request's
+# catalog snaptime and cache scope.  Recently used results are kept in memory, up to
+# STATS_CUBE_CACHE_MAX of them and STATS_CUBE_CACHE_BYTES in all, and serve any request for the
+# same groupings in any order (e.g., a drill-down filtering on a dimension the page grouped by).
+# They are only kept when the snaptime is known without asking ERMrest (pinned, or polled).
+def _stats_cube(helper, entity, groupings, measure):
+    global stats_cubes_bytes
+    key = None
+    if app.config["STATS_CUBE_CACHE_MAX"] and has_request_context():
+        catalog_id = helper.catalog.catalog_id
+        snaptime = g.get('snaptime')
+        if snaptime is None and snaptime_poller is not None:
+            snaptime = snaptime_poller.snaptime(catalog_id)
+        if snaptime is not None:
+            key = (catalog_id, snaptime, _cache_scope(catalog_id), entity, measure, frozenset(groupings))
+    if key is not None:
+        with stats_cubes_lock:
+            cached = stats_cubes.get(key)
+            if cached is not None:
+                stats_cubes.move_to_end(key)
+        if cached is not None:
+            return _reorder_stats(cached[0], cached[1], cached[2], groupings)
+
+    sh = _dashboard_queries().StatsQuery2(helper).entity(entity)
+    for grouping in groupings:
+        sh = sh.dimension(grouping)
+    counts, labels = _compact_stats(sh, groupings, measure)
+
+    size = _stats_size(counts, labels)
+    if key is not None and size <= app.config["STATS_CUBE_CACHE_BYTES"]:
+        with stats_cubes_lock:
+            if key not in stats_cubes:
+                stats_cubes[key] = (tuple(groupings), counts, labels, size)
+                stats_cubes_bytes += size
+            while len(stats_cubes) > app.config["STATS_CUBE_CACHE_MAX"] \
+                  or stats_cubes_bytes > app.config["STATS_CUBE_CACHE_BYTES"]:
+                stats_cubes_bytes -= stats_cubes.popitem(last=False)[1][3]
+    return counts, labels
+
+# Returns (counts, labels) of a cube over cube_groupings with its keys in the order of groupings
+def _reorder_stats(cube_groupings, counts, labels, groupings):
+    if tuple(groupings) == cube_groupings:
+        return counts, labels
+    positions = [cube_groupings.index(grouping) for grouping in groupings]
+    counts = [(tuple(nids[i] for i in positions), count) for nids, count in counts.items()]
+    return dict(sorted(counts, key=_nids_order)), labels
+
+# Estimated memory used by _compact_stats() counts and labels, in bytes
+def _stats_size(counts, labels):
+    size = sys.getsizeof(counts) + sum(sys.getsizeof(nids) + 32 for nids in counts)
+    for names in labels.values():
+        size += sys.getsizeof(names) + sum(sys.getsizeof(name) + 32 for name in names.values())
+    return size
+
+# Returns the filters of a /stats request, { grouping: label }, from its query parameters named
+# after SQ2_DIMENSION_MAP groupings (e.g. anatomy=brain, dcc=4DN, or data_type=Not Specified for
+# facts lacking one), and an error message if a filter is given more than once.
+def _stats_filters():
+    filters = {}
+    for grouping in SQ2_DIMENSION_MAP:
+        values = request.args.getlist(grouping)
+        if len(values) > 1:
+            return None, "Only one value may be given for filter '%s'" % grouping
+        if values:
+            filters[grouping] = values[0]
+    return filters, None
+
+# Restricts _compact_stats() counts over groupings to the rows whose dimensions have the labels
+# given by filters, then keeps only the first n dimensions of each key, summing the counts of
+# rows that become equal.  Each filtered dimension is fixed to one value, so no fact is counted
+# twice.
+def _filter_stats(counts, labels, groupings, filters, n):
+    checks = [(groupings.index(grouping), labels[grouping], value) for grouping, value in filters.items()]
+    res = {}
+    for nids, count in counts.items():
+        if all(('Not Specified' if nids[i] is None else names[nids[i]]) == value for i, names, value in checks):
+            key = nids[:n]
+            res[key] = res.get(key, 0) + count
+    return res
+
 # /dcc/{dccId}/stats/{variable}/{grouping}
 # Returns statistics for the requested variable grouped by the specified aggregation.
 @app.route('/dcc/<string:dcc_id>/stats/<string:variable>/<string:grouping>', methods=['GET'])
@@ -636,96 +1356,62 @@ def dcc_grouped_stats(dcc_id,variable,grouping):
         return _dcc_not_found_response(dcc_id)
 
     em = SQ2_ENTITY_MAP[variable]
-    dm = SQ2_DIMENSION_MAP[grouping]
 
-    counts = list(StatsQuery2(helper).entity(em['entity']).dimension(grouping).dimension('dcc').fetch_flattened(headers=pass_headers()))
+    counts, labels = _stats_cube(helper, em['entity'], [grouping, 'dcc'], em['att'])
     res = {}
 
-    for ct in counts:
-        if ct['dcc'] is None:
-            pass
-        elif ct['dcc']['nid'] == dcc_nid:
+    for (dim, nid), count in counts.items():
+        if nid == dcc_nid:
             key = None
-            if ct[grouping] is None:
+            if dim is None:
                 key = 'Not Specified'
             else:
-                key = ct[grouping][dm['att']]
+                key = labels[grouping][dim]
 
             if key in res:
-                res[key] += ct[em['att']]
+                res[key] += count
             else:
-                res[key] = ct[em['att']]
+                res[key] = count
 
     # return type is DCCGrouping
     return json.dumps(res)
 
 # TODO - allow grouping2 to be None
-def _grouped_stats_aux(helper,variable,grouping1,grouping2,add_dcc):
+# filters ({ grouping: label }, see _stats_filters()) restrict the facts counted; dimensions
+# filtered on but not grouped by are added to the query, then summed over.
+def _grouped_stats_aux(helper,variable,grouping1,grouping2,add_dcc,filters=None):
     em = SQ2_ENTITY_MAP[variable]
-    dm1 = SQ2_DIMENSION_MAP[grouping1]
-    dm2 = None if grouping2 is None else SQ2_DIMENSION_MAP[grouping2]
     grouping3 = None
-    dm3 = None
 
     if add_dcc and grouping1 != 'dcc':
         grouping3 = 'dcc'
-        dm3 = SQ2_DIMENSION_MAP[grouping3]
-
-    # need to map project_nid to project_abbreviation if grouping=dcc
-    nid_to_abbrev = {}
-    if (grouping1 == "dcc") or ((grouping2 is not None) and grouping2 == "dcc") or (grouping3 == "dcc"):
-        dccs = _all_dccs(helper)
-        for dcc in dccs:
-            nid_to_abbrev[dcc['project_nid']] = dcc['dcc_abbreviation']
 
-    sh = StatsQuery2(helper).entity(em['entity']).dimension(grouping1)
+    groupings = [grouping1]
     if grouping2 is not None:
-        sh = sh.dimension(grouping2)
+        groupings.append(grouping2)
 
-    if dm3 is not None and ((grouping2 is None) or (grouping2 != 'dcc')):
-        sh = sh.dimension(grouping3)
-    
-    counts = list(sh.fetch_flattened(headers=pass_headers()))
+    if grouping3 is not None and ((grouping2 is None) or (grouping2 != 'dcc')):
+        groupings.append(grouping3)
+
+    filters = filters or {}
+    query_groupings = groupings + sorted(set(filters) - set(groupings))
+    counts, labels = _stats_cube(helper, em['entity'], query_groupings, em['att'])
+    if filters:
+        counts = _filter_stats(counts, labels, query_groupings, filters, len(groupings))
     dim_counts = {}
     res = []
 
-    # StatsQuery2 output looks like this:
-    #
-    # {'num_files': 789,
-    #  'total_size_in_bytes': 970063224,
-    #  'dcc': {'nid': 1,
-    #          'id': 'cfde_registry_dcc:sparc',
-    #          'dcc_name': 'Stimulating Peripheral Activity to Relieve Conditions',
-    #          'dcc_abbreviation': 'SPARC',
-    #          'dcc_description': 'To transform our understanding of nerve-organ interactions
-    #             by providing access to high-value datasets, maps, and computational studies
-    #             with the intent of advancing bioelectronic medicine towards treatments that
-    #             change lives. The SPARC program is supported by the NIH Common Fund to
-    #             accelerate development of therapeutic devices and identification of neural
-    #             targets for bioelectronic medicine—modulating electrical activity in nerves
-    #             to help treat diseases and conditions, such as hypertension and gastrointestinal
-    #             disorders, by precisely adjusting organ function.'},
-    #  'assay_type': None}
-    #
-    for ct in counts:
-        dim1 = ct[grouping1]
-        if dim1 is not None:
-            dim1 = dim1[dm1['att']]
-        
-        dim2 = None if grouping2 is None else ct[grouping2]
-        if dim2 is not None:
-            dim2 = dim2[dm2['att']]
+    for nids, ctval in counts.items():
+        dims = [None if nid is None else labels[grouping][nid] for grouping, nid in zip(groupings, nids)]
+        dim1 = dims[0]
+        dim2 = None if grouping2 is None else dims[1]
 
-        # TODO - here
-            
         dim3 = None
-        if dm3 is not None:
+        if grouping3 is not None:
             if grouping2 is not None and grouping2 == 'dcc':
                 dim3 = dim2
             else:
-                dim3 = ct[grouping3]
-                if dim3 is not None:
-                    dim3 = dim3[dm3['att']]
+                dim3 = dims[-1]
                 
         if dim1 is None:
             dim1 = 'Not Specified'
@@ -744,11 +1430,6 @@ def _grouped_stats_aux(helper,variable,grouping1,grouping2,add_dcc):
                 dim_counts[key][grouping3] = dim3
             res.append(dim_counts[key])
 
-        # replace None with 0
-        ctval = 0
-        if ct[em['att']] is not None:
-            ctval  = ct[em['att']]
-
         if dim2 in dim_counts[key]:
             dim_counts[key][dim2] += ctval
         else:
@@ -779,8 +1460,12 @@ def single_grouped_stats_by_dcc(variable,grouping1):
     if err is not None:
         return _error_response(err, 404)
 
+    filters, err = _stats_filters()
+    if err is not None:
+        return _error_response(err, 400)
+
     # return type is DCCGroupedStatistics, which is a list of DCCGrouping
-    res = _grouped_stats_aux(helper, variable, grouping1, None, include_dcc)
+    res = _grouped_stats_aux(helper, variable, grouping1, None, include_dcc, filters)
     return json.dumps(res)
 
 # /stats/{variable}/{grouping1}/{grouping2}
@@ -808,8 +1493,12 @@ def multi_grouped_stats_by_dcc(variable,grouping1,grouping2):
     if err is not None:
         return _error_response(err, 404)
 
+    filters, err = _stats_filters()
+    if err is not None:
+        return _error_response(err, 400)
+
     # return type is DCCGroupedStatistics, which is a list of DCCGrouping
-    res = _grouped_stats_aux(helper, variable, grouping1, grouping2, include_dcc)
+    res = _grouped_stats_aux(helper, variable, grouping1, grouping2, include_dcc, filters)
     return json.dumps(res)
 
 # merge attributes within groups using a global limit on the number of attributes
@@ -959,8 +1648,12 @@ def grouped_stats_other(variable,grouping1,maxgroups1,grouping2,maxgroups2):
     if err is not None:
         return _error_response(err, 404)
 
+    filters, err = _stats_filters()
+    if err is not None:
+        return _error_response(err, 400)
+
     # returns list of DCCGrouping
-    res = _grouped_stats_aux(helper, variable, grouping1, grouping2, False)
+    res = _grouped_stats_aux(helper, variable, grouping1, grouping2, False, filters)
 
     # merge groups2 (i.e., merge counts within each DCCGrouping)
     if maxgroups2 is not None:
@@ -976,80 +1669,317 @@ def grouped_stats_other(variable,grouping1,maxgroups1,grouping2,maxgroups2):
     # return type is DCCGroupedStatistics, which is a list of DCCGrouping
     return json.dumps(res)
 
-def _get_user_id():
+# Column names of the rows of _export_stats_rows(): the groupings, then the variable's attribute.
+def _export_stats_columns(variable, grouping1, grouping2):
+    groupings = [grouping1] + ([grouping2] if grouping2 is not None else [])
+    if 'dcc' not in groupings:
+        groupings.append('dcc')
+    return groupings + [SQ2_ENTITY_MAP[variable]['att']]
+
+# Yields one flat row (a list of values, see _export_stats_columns()) per StatsQuery2 result of
+# variable grouped by grouping1, grouping2 (if not None) and DCC, in the order StatsQuery2 returns
+# them.  Rows are not merged, so the same group may appear more than once.
+def _export_stats_rows(helper, variable, grouping1, grouping2):
+    em = SQ2_ENTITY_MAP[variable]
+    groupings = _export_stats_columns(variable, grouping1, grouping2)[:-1]
+
+    sh = _dashboard_queries().StatsQuery2(helper).entity(em['entity'])
+    for grouping in groupings:
+        sh = sh.dimension(grouping)
+
+    for ct in sh.fetch_flattened(headers=pass_headers()):
+        row = []
+        for grouping in groupings:
+            dim = ct[grouping]
+            row.append('Not Specified' if dim is None else dim[SQ2_DIMENSION_MAP[grouping]['att']])
+        # replace None with 0
+        row.append(0 if ct[em['att']] is None else ct[em['att']])
+        yield row
+
+# for csv.writer: returns each formatted line instead of writing it
+class _CSVLine(object):
+    def write(self, line):
+        return line
+
+# /export/stats/{variable}/{grouping1}[/{grouping2}]
+# Streams statistics for the requested variable grouped by the specified aggregation(s) and DCC as
+# flat rows, in NDJSON (default) or CSV (format=csv), without building the result in memory.
+@app.route('/export/stats/<string:variable>/<string:grouping1>', methods=['GET'])
+@app.route('/export/stats/<string:variable>/<string:grouping1>/<string:grouping2>', methods=['GET'])
+def export_grouped_stats(variable, grouping1, grouping2=None):
+    catalog_id = request.args.get("catalogId", type=int)
+    fmt = request.args.get("format", "ndjson")
+    helper = _get_helper(catalog_id)
+    if isinstance(helper, wrappers.Response):
+        return helper
+
+    err = None
+
+    if variable not in SQ2_ENTITY_MAP:
+        err = "Illegal variable/entity requested - must be one of " + ",".join(SQ2_ENTITY_MAP.keys())
+    if grouping1 not in SQ2_DIMENSION_MAP:
+        err = "Illegal grouping requested - must be one of " + ",".join(SQ2_DIMENSION_MAP.keys())
+    if grouping2 is not None and grouping2 not in SQ2_DIMENSION_MAP:
+        err = "Illegal grouping requested - must be one of " + ",".join(SQ2_DIMENSION_MAP.keys())
+    if grouping1 == grouping2:
+        err = "grouping1 and grouping2 cannot be the same dimension."
+
+    # input error
+    if err is not None:
+        return _error_response(err, 404)
+    if fmt not in ('ndjson', 'csv'):
+        return _error_response("Illegal format requested - must be one of ndjson,csv", 400)
+
+    columns = _export_stats_columns(variable, grouping1, grouping2)
+    rows = _export_stats_rows(helper, variable, grouping1, grouping2)
+    # run the query (up to its first row) before the response is started, so that upstream
+    # errors get an error status instead of a truncated download
+    first = next(rows, None)
+    if first is not None:
+        rows = itertools.chain([first], rows)
+
+    if fmt == 'csv':
+        import csv
+        def generate():
+            writer = csv.writer(_CSVLine())
+            yield writer.writerow(columns)
+            for row in rows:
+                yield writer.writerow(row)
+        mimetype = 'text/csv'
+    else:
+        def generate():
+            for row in rows:
+                yield json.dumps(dict(zip(columns, row))) + '\n'
+        mimetype = 'application/x-ndjson'
+
+    res = app.response_class(stream_with_context(generate()), mimetype=mimetype)
+    filename = '-'.join(['stats', variable, grouping1] + ([grouping2] if grouping2 else [])) + '.' + fmt
+    res.headers['Content-Disposition'] = 'attachment; filename="%s"' % (filename,)
+    return res
+
+# /timeseries/{path}?catalogIds=1,2,5-9
+# Returns the result of GET /{path} (e.g. "stats/files/dcc" or "dcc_info", with this request's other
+# query parameters) for each of the catalogs, so that counts can be charted across releases. Each
+# catalog's request is pinned to its current snaptime, so results for catalogs that have not
+# changed since they were last requested come from the snapshot cache.
+@app.route('/timeseries/<path:path>', methods=['GET'])
+def timeseries(path):
+    path = '/' + path
+    if not any(pattern.search(path) for pattern in timeseries_routes):
+        return _error_response("No time series available for '" + path + "'", 404)
+
+    max_catalogs = app.config["TIMESERIES_MAX_CATALOGS"]
+    catalog_ids = _parse_catalog_ids(request.args.get("catalogIds", ""), max_catalogs)
+    if catalog_ids is None:
+        return _error_response("catalogIds must be a list of up to %d catalog ids or ranges, e.g. 1,2,5-9"
+                               % max_catalogs, 400)
+
+    query = [(k, v) for k, v in request.args.items(multi=True) if k not in ('catalogIds', 'catalogId', 'snaptime', 'async')]
+    headers = [(k, v) for k, v in request.headers.items() if k.lower() not in ('content-length', 'x-cfde-profile')]
+    base_url = request.host_url.rstrip('/') + request.script_root
+    left = upstream.remaining()
+    deadline = None if left is None else time.monotonic() + left
+
+    budget = g.get('admission_budget')
+
+    executor = _executor('timeseries', app.config["TIMESERIES_THREADS"])
+    futures = [executor.submit(_timeseries_point, catalog_id, path, query, headers, base_url, deadline, budget)
+               for catalog_id in catalog_ids]
+    done, pending = concurrent.futures.wait(futures, timeout=left)
+    points = []
+    for catalog_id, future in zip(catalog_ids, futures):
+        if future in done:
+            points.append(future.result())
+        else:
+            # the subrequest, if it has started, times out itself
+            future.cancel()
+            points.append({ 'catalogId': int(catalog_id), 'snaptime': None, 'timestamp': None,
+                            'status': 504, 'error': "request deadline exceeded" })
+    return json.dumps(points)
+
+# Returns catalog ids (strings, in order, without duplicates) from a list like "1,2,5-9", or None
+# if it is invalid or names more than max_catalogs catalogs
+def _parse_catalog_ids(spec, max_catalogs):
+    res = []
+    for part in spec.split(','):
+        m = re.match(r'^\s*([0-9]+)\s*(?:-\s*([0-9]+)\s*)?$', part)
+        if m is None:
+            return None
+        lo = int(m.group(1))
+        hi = lo if m.group(2) is None else int(m.group(2))
+        if hi < lo or len(res) + hi - lo + 1 > max_catalogs:
+            return None
+        res.extend(str(c) for c in range(lo, hi + 1) if str(c) not in res)
+    return res
+
+# One point of a time series: the result of GET path for catalog_id at its current snaptime.
+# Runs on the timeseries executor, as a subrequest that must finish by deadline (a time.monotonic()
+# value, or None).  It is admitted against its own path's budget, unless that is budget, the one
+# the time series request itself was admitted to.
+def _timeseries_point(catalog_id, path, query, headers, base_url, deadline, budget):
+    point = { 'catalogId': int(catalog_id), 'snaptime': None, 'timestamp': None }
+    left = None if deadline is None else deadline - time.monotonic()
+    if left is not None and left <= 0:
+        return dict(point, status=504, error="request deadline exceeded")
+
+    with app.app_context():
+        upstream.set_deadline(left)
+        try:
+            snaptime = _timeseries_snaptime(catalog_id, dict(headers) if PASS_HEADERS else DEFAULT_HEADERS)
+        except HTTPError as e:
+            return dict(point, status=e.response.status_code, error=str(e))
+        except Exception as e:
+            return dict(point, status=502, error=str(e))
+    point['snaptime'] = snaptime
+    point['timestamp'] = _decode_ermrest_snaptime(snaptime).isoformat()
+
+    res = app.test_client(use_cookies=False).get(
+        path, query_string=query + [('catalogId', catalog_id), ('snaptime', snaptime)], headers=headers,
+        base_url=base_url, environ_overrides={ 'dashboard.subrequest': True, 'dashboard.deadline': left,
+                                              'dashboard.admission_budget': budget })
+    point['status'] = res.status_code
+    if res.status_code == 200:
+        point['result'] = res.get_json(force=True, silent=True)
+    else:
+        point['error'] = res.headers.get('X-CFDE-Error') or res.get_data(as_text=True)
+    return point
+
+# Returns catalog_id's current snaptime for a time series point.  Catalogs of past releases are
+# not watched by the snaptime poller (nor is a helper, with its catalog model, kept for them), so
+# unless the poller knows the catalog already its snaptime is read with a plain GET of the catalog,
+# and reused for TIMESERIES_SNAPTIME_MAX_AGE seconds.
+def _timeseries_snaptime(catalog_id, headers):
+    if snaptime_poller is not None:
+        snaptime = snaptime_poller.snaptime(catalog_id, watch=False)
+        if snaptime is not None:
+            return snaptime
+    known = timeseries_snaptimes.get(catalog_id)
+    if known is not None and time.time() - known[1] < app.config["TIMESERIES_SNAPTIME_MAX_AGE"]:
+        return known[0]
+
+    url = "%s://%s/ermrest/catalog/%s" % (_get_scheme(), HOSTNAME, catalog_id)
+    r = upstream.get('catalog', url, headers=headers)
+    r.raise_for_status()
+    snaptime = r.json()['snaptime']
+    timeseries_snaptimes[catalog_id] = (snaptime, time.time())
+    return snaptime
+
+# Returns the caller's webauthn session (as JSON), or None if they are not logged in.
+def _get_session():
     url = _get_scheme() + "://" + HOSTNAME + "/authn/session"
-    id = None
-    r = requests.get(url=url, headers=pass_headers())
+    r = upstream.get('authn', url, headers=pass_headers())
     if r:
         if r.status_code != 404 and r.json():
-            data = r.json()
-            try:
-                id = data["client"]["id"]
-            except KeyError:
-                pass
+            return r.json()
+    return None
+
+def _get_user_id():
+    id = None
+    data = _get_session()
+    if data:
+        try:
+            id = data["client"]["id"]
+        except KeyError:
+            pass
     return id
 
+# Whether the caller's client id, or one of their attributes (e.g., groups), is in ADMIN_IDENTITIES.
+def _is_admin():
+    admins = app.config["ADMIN_IDENTITIES"]
+    if not admins:
+        return False
+    data = _get_session()
+    if not data:
+        return False
+    ids = [data.get("client", {}).get("id")] + [attr.get("id") for attr in data.get("attributes", [])]
+    return any(id in admins for id in ids if id)
+
+# Keyset pagination for the user list routes: rows are returned in RID order; ?limit=N returns at
+# most N of them, with a Link header to the next page if there are more, and ?after=<RID> starts
+# after that row.  The JSON array is streamed while rows are fetched from ERMrest, at most
+# USER_LIST_PAGE_SIZE at a time, so memory use does not grow with the number of rows; the first
+# page is fetched before the response starts.
+def _paged_json_response(table, path, headers, render):
+    limit = request.args.get("limit", type=int)
+    if "limit" in request.args and (limit is None or limit < 1):
+        return _error_response("Invalid limit '" + request.args["limit"] + "'", 400)
+    after = request.args.get("after")
+    page_size = app.config["USER_LIST_PAGE_SIZE"]
+
+    def fetch_page(after, n):
+        page = path.filter(table.RID > after) if after else path
+        with upstream.unmemoized():
+            return page.entities().sort(table.RID).fetch(limit=n, headers=headers)
+
+    next_after = None
+    if limit is not None:
+        # fetch one row beyond the limit to find out whether there is a next page
+        rows = list(fetch_page(after, limit + 1))
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_after = rows[-1]['RID']
+    else:
+        # the first page is fetched before the response is started, so that upstream errors
+        # get an error status (or a stale response); only later pages are fetched while streaming
+        first = fetch_page(after, page_size)
+        def all_rows():
+            page = first
+            while True:
+                for row in page:
+                    yield row
+                if len(page) < page_size:
+                    return
+                page = fetch_page(page[len(page) - 1]['RID'], page_size)
+        rows = all_rows()
+
+    def generate():
+        yield '['
+        for i, row in enumerate(rows):
+            yield (',' if i else '') + json.dumps(render(row))
+        yield ']'
+
+    res = app.response_class(stream_with_context(generate()), mimetype='application/json')
+    if next_after is not None:
+        next_url = request.script_root + request.path + '?' + urllib.parse.urlencode(
+            [(k, v) for k, v in request.args.items(multi=True) if k != 'after'] + [('after', next_after)])
+        res.headers['Link'] = '<%s>; rel="next"' % (next_url,)
+    return res
+
 # /user/saved_queries
 # Returns a list of saved queries for the logged in user
 # User auth maintained by headers being passed through. See pass_headers()
 @app.route('/user/saved_queries', methods=['GET'])
 def saved_queries():
     user_id = _get_user_id()
-    scheme = "http" if HOSTNAME == "localhost" else "https"
     dev_mode = True if webauthn_token else False
-    
-    if dev_mode:
-        registry_catalog = ErmrestCatalog(
-            scheme,
-            HOSTNAME,
-            "registry",
-            caching=False,
-            credentials=core_utils.format_credential(token=webauthn_token)
-        )
-    else:
-        registry_catalog = ErmrestCatalog(
-            scheme,
-            HOSTNAME,
-            "registry",
-            caching=False
-        )
+    registry_catalog, registry_builder = _get_catalog("registry")
 
-    registry_builder = registry_catalog.getPathBuilder()
     saved_query = registry_builder.CFDE.saved_query
     if not dev_mode:
         path = saved_query.filter(saved_query.user_id == user_id)
     else:
         path = saved_query
 
-    # if running in a dev workspace (dev_mode == True), not using pass_headers call
-    if dev_mode:
-        rows = path.entities().fetch()
-    else:
-        # sending headers because we're not instantiating the ermrest catalog with a user credential
-        rows = path.entities().fetch(headers=pass_headers())
-   
     nonempty_query_url_string = "/chaise/recordset/#1/{}:{}/*::facets::{}?savedQueryRid={}"
     empty_query_url_string = "/chaise/recordset/#1/{}:{}?savedQueryRid={}"
 
-    saved_queries = []
-
-    for row in rows:
+    def render(row):
         if row['encoded_facets']: 
            query = nonempty_query_url_string.format(row["schema_name"], row["table_name"], row["encoded_facets"], row["RID"])
         else:
            query = empty_query_url_string.format(row["schema_name"], row["table_name"], row["RID"])
 
-        data = { "name" : row["name"],
+        return { "name" : row["name"],
                  "table_name" : row["table_name"], 
                  "description" : row["description"], 
                  "query" : query,
                  "last_execution_ts" : row["last_execution_time"],
                  "creation_ts" : row["RCT"] 
         }
-        saved_queries.append(data)
-
-    return json.dumps(saved_queries)
 
+    # if running in a dev workspace (dev_mode == True), not using pass_headers call;
+    # otherwise sending headers because we're not instantiating the ermrest catalog with a user credential
+    return _paged_json_response(saved_query, path, DEFAULT_HEADERS if dev_mode else pass_headers(), render)
 
 def _fetch_favorite(path, url_string, dev_mode, include_abbreviation=False):
 
@@ -1073,46 +2003,25 @@ def personal_collection():
     dev_mode = True if webauthn_token else False
 
     user_id = _get_user_id()
-    scheme = "http" if HOSTNAME == "localhost" else "https"
-    
-    if dev_mode:
-        catalog = ErmrestCatalog(
-            scheme,
-            HOSTNAME,
-            DEFAULT_CATALOG_ID,
-            caching=False,
-            credentials=core_utils.format_credential(token=webauthn_token)
-        )
-    else:
-        catalog = ErmrestCatalog(
-            scheme,
-            HOSTNAME,
-            DEFAULT_CATALOG_ID,
-            caching=False
-        )
+    catalog, builder = _get_catalog(DEFAULT_CATALOG_ID)
 
-    builder = catalog.getPathBuilder()
-    path = builder.CFDE.personal_collection
+    table = builder.CFDE.personal_collection
+    path = table
 
-    if dev_mode:
-        rows = path.entities().fetch()
-    else:
-        # sending headers because we're not instantiating the ermrest catalog with a user credential
+    if not dev_mode:
         path = path.filter(path.RCB == user_id)
-        rows = path.entities().fetch(headers=pass_headers())
-    
+
     personal_collection_url = "/chaise/record/#1/CFDE:personal_collection/RID={}"
 
-    personal_collections = []
-    for row in rows:
-        data = { "name" : row["name"],
+    def render(row):
+        return { "name" : row["name"],
                  "description" : row["description"], 
                  "creation_ts" : row["RCT"],
                  "query" : personal_collection_url.format(row["RID"])
         }
-        personal_collections.append(data)
 
-    return json.dumps(personal_collections)
+    # sending headers (outside dev mode) because we're not instantiating the ermrest catalog with a user credential
+    return _paged_json_response(table, path, DEFAULT_HEADERS if dev_mode else pass_headers(), render)
 
 # /user/favorites
 # User auth maintained by headers being passed through. See pass_headers()
@@ -1122,26 +2031,9 @@ def favorites():
     dev_mode = True if webauthn_token else False
 
     user_id = _get_user_id()
-    scheme = "http" if HOSTNAME == "localhost" else "https"
-    
-    if dev_mode:
-        registry_catalog = ErmrestCatalog(
-            scheme,
-            HOSTNAME,
-            "registry",
-            caching=False,
-            credentials=core_utils.format_credential(token=webauthn_token)
-        )
-    else:
-        registry_catalog = ErmrestCatalog(
-            scheme,
-            HOSTNAME,
-            "registry",
-            caching=False
-        )
+    registry_catalog, registry_builder = _get_catalog("registry")
 
     # build path (query) for favorite anatomies
-    registry_builder = registry_catalog.getPathBuilder()
 
     # This repetitive bit of code could be cleaned up
     url_string = "/chaise/record/#1/CFDE:anatomy/id={}"
@@ -1249,48 +2141,50 @@ def favorites():
 # The metric score is calculated as fair_count / total_count
 @app.route('/fair/<int:catalog_id>', methods=['GET'])
 def fair_metrics(catalog_id):
-    
-    session_config = DEFAULT_SESSION_CONFIG.copy()
-    session_config["allow_retry_on_all_methods"] = True
-    scheme = "http" if HOSTNAME == "localhost" else "https"
-    
+    return json.dumps(_fair_metrics(catalog_id))
+
+# /fair?catalogId=1&catalogId=2...
+# Returns the FAIR metrics of several catalogs, as an object mapping each catalog id to its list
+# of metrics (as returned by /fair/{catalogId}).
+@app.route('/fair', methods=['GET'])
+def multi_fair_metrics():
+    catalog_ids = request.args.getlist("catalogId")
+    if not catalog_ids:
+        return _error_response("At least one catalogId is required", 400)
+    for catalog_id in catalog_ids:
+        if not catalog_id.isdigit():
+            return _error_response("Invalid catalogId '" + catalog_id + "'", 400)
+    if len(catalog_ids) > app.config["FAIR_MAX_CATALOGS"]:
+        return _error_response("At most %d catalogIds may be requested" % app.config["FAIR_MAX_CATALOGS"], 400)
+    return json.dumps({ catalog_id: _fair_metrics(int(catalog_id)) for catalog_id in catalog_ids })
+
+# FAIR metrics of catalog_id's datapackage. Measurements never change once a datapackage has been
+# submitted, so they are kept in CACHE_DB by submission id: shared by all callers for
+# datapackages the registry shows anonymously, otherwise per caller identity.
+def _fair_metrics(catalog_id):
     dev_mode = True if webauthn_token else False
+    registry_catalog, r_builder = _get_catalog("registry")
 
-    if dev_mode:
-        registry_catalog = ErmrestCatalog(
-            scheme,
-            HOSTNAME,
-            "registry",
-            caching=False,
-            credentials=core_utils.format_credential(token=webauthn_token)
-        )
-    else:
-        registry_catalog = ErmrestCatalog(
-            scheme,
-            HOSTNAME,
-            "registry",
-            caching=False
-        )
-    
     # Need to get the submission ID by using the catalog_id
-    r_builder = registry_catalog.getPathBuilder()
-    dp_path = r_builder.CFDE.datapackage
-    dp_path = dp_path.filter(dp_path.review_summary_url.regexp('catalogId=%s$' % (catalog_id,)))
+    dp = _find_datapackage(catalog_id, DEFAULT_HEADERS if dev_mode else pass_headers())
     submission_id = ''
     
-    if dev_mode:
-       res = dp_path.entities().fetch()
-    else:
-       res = dp_path.entities().fetch(headers=pass_headers())
-    
-    if res:
-        submission_id = res[0]['id']
+    if dp is not None:
+        submission_id = dp['id']
+
+    key = None
+    if result_cache is not None and submission_id:
+        scope = "public" if str(catalog_id) in _datapackage_index() else _identity_key()
+        key = "fair %s %s" % (scope, submission_id)
+        cached = result_cache.get(key, str(catalog_id), 'fair_metrics')
+        if cached is not None:
+            return json.loads(cached[0])
     
     if dev_mode:
-        data = get_datapackage_measurements(registry_catalog, submission_id)
+        data = _cfde_metrics().get_datapackage_measurements(registry_catalog, submission_id)
     else:
         # sending headers because we're not instantiating the ermrest catalog with a user credential
-        data = get_datapackage_measurements(registry_catalog, submission_id, headers=pass_headers())
+        data = _cfde_metrics().get_datapackage_measurements(registry_catalog, submission_id, headers=pass_headers())
 
     fair = []
     for metric_dict in data:
@@ -1302,8 +2196,366 @@ def fair_metrics(catalog_id):
         }
         fair.append(metric)
 
-    return json.dumps(fair)
+    if key is not None:
+        result_cache.put(key, str(catalog_id), 'fair_metrics', json.dumps(fair).encode('utf-8'), 'application/json')
+    return fair
+
+# Computes (and so caches) the FAIR metrics of every datapackage the registry shows anonymously
+def precompute_fair_metrics():
+    with app.test_request_context(base_url=_get_scheme() + "://" + HOSTNAME):
+        for catalog_id in sorted(_datapackage_index(), key=int):
+            try:
+                _fair_metrics(int(catalog_id))
+            except Exception as e:
+                app.logger.warning("FAIR metrics precomputation for catalog %s failed: %s", catalog_id, e)
+
+# Runs precompute_fair_metrics() on a background thread unless it is already running
+def _start_fair_precompute():
+    if result_cache is None or not fair_precompute_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            precompute_fair_metrics()
+        except Exception as e:
+            app.logger.warning("FAIR metrics precomputation failed: %s", e)
+        finally:
+            fair_precompute_lock.release()
+
+    threading.Thread(target=run, name='dashboard-fair-precompute', daemon=True).start()
+
+# Immutable per-catalog data loaded by preload(); see PRELOAD in dashboard_config.py.
+#  dccs: tuple of DCC rows as tuples of DCC_FIELDS
+#  vocabularies: table name -> tuple of (nid, id, name) term tuples
+#  project_children: project nid -> tuple of child project display names
+#  counts: DCC nid (None for the whole catalog) -> _get_dcc_entity_counts(..., None) result
+Preload = collections.namedtuple('Preload', ['snaptime', 'dccs', 'vocabularies', 'project_children', 'counts'])
+
+DCC_FIELDS = ('id', 'nid', 'dcc_name', 'dcc_description', 'dcc_url', 'contact_name',
+              'contact_email', 'dcc_abbreviation', 'project_nid')
+
+# Returns preloaded data for the helper's catalog if it is current for this request, else None.
+# Without a pinned snaptime the poller's last answer is used; none yet means no preloaded data.
+def _preloaded(helper):
+    catalog_id = helper.catalog.catalog_id
+    pre = preloaded.get(catalog_id)
+    if pre is None:
+        return None
+    snaptime = g.get('snaptime') if has_request_context() else None
+    if snaptime is None:
+        snaptime = snaptime_poller.snaptime(catalog_id, watch=False)
+    return pre if pre.snaptime == snaptime else None
+
+def _preload_catalog(helper):
+    snaptime = _current_snaptime(helper)
+    dccs = tuple(tuple(dcc[f] for f in DCC_FIELDS) for dcc in _all_dccs(helper))
+
+    vocabularies = {}
+    for tname in [t for t in SQ2_DIMENSION_MAP if t != 'dcc'] + ['compound']:
+        if tname not in helper.builder.CFDE.tables:
+            continue
+        tbl = helper.builder.CFDE.tables[tname]
+        cols = tbl.column_definitions
+        rows = tbl.path.attributes(*[cols[c] for c in ('nid', 'id', 'name') if c in cols]).fetch(headers=pass_headers())
+        vocabularies[tname] = tuple((row.get('nid'), row.get('id'), row.get('name')) for row in rows)
+
+    pip = helper.builder.CFDE.project_in_project.alias('pip')
+    p = helper.builder.CFDE.project.alias('p')
+    path = pip.link(p, on=(pip.child_project == p.nid))
+    children = {}
+    for row in path.attributes(pip.parent_project, p.name, p.abbreviation, p.description, p.id).fetch(headers=pass_headers()):
+        children.setdefault(row['parent_project'], []).append(_project_display_name(row))
+    project_children = { k: tuple(v) for k, v in children.items() }
+
+    counts = {}
+    if app.config["PRELOAD_STATS"]:
+        for dcc_nid in [None] + [dcc[DCC_FIELDS.index('nid')] for dcc in dccs]:
+            counts[dcc_nid] = _get_dcc_entity_counts(helper, dcc_nid, None)
+
+    return Preload(snaptime, dccs, vocabularies, project_children, counts)
+
+def _preload(catalog_id):
+    # preloaded data is read anonymously and served to every caller
+    if catalog_id not in public_catalog_ids and PASS_HEADERS:
+        app.logger.warning("not preloading catalog %s: not in PUBLIC_CATALOG_IDS", catalog_id)
+        return
+    with app.test_request_context(base_url=_get_scheme() + "://" + HOSTNAME):
+        helper = _get_helper(catalog_id)
+        if isinstance(helper, wrappers.Response):
+            app.logger.warning("preload of catalog %s failed: %s", catalog_id, helper.get_data(as_text=True))
+            return
+        try:
+            preloaded[catalog_id] = _preload_catalog(helper)
+        except Exception as e:
+            app.logger.warning("preload of catalog %s failed: %s", catalog_id, e)
+
+def preload():
+    """Load immutable per-catalog data, optionally freezing it for sharing with forked workers"""
+    if snaptime_poller is None:
+        raise ValueError("PRELOAD requires SNAPTIME_POLL_INTERVAL")
+    for catalog_id in [DEFAULT_CATALOG_ID] + [str(c) for c in app.config["PRELOAD_CATALOG_IDS"]]:
+        _preload(catalog_id)
+
+    if app.config["PRELOAD_GC_FREEZE"]:
+        # move everything allocated so far out of the collector's reach, so that collections in
+        # forked workers don't write to (and so un-share) these pages; reloads are not frozen
+        gc.collect()
+        gc.freeze()
+
+# /metrics
+# Request, upstream and cache metrics for all API processes on this host, in Prometheus text format.
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    res = make_response(metrics.render(), 200)
+    res.mimetype = 'text/plain'
+    res.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return res
+
+# /jobs/{jobId}
+# Returns the status of an asynchronous job (202 while it is pending or running), or its result.
+@app.route('/jobs/<string:job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_store.get(job_id) if job_store is not None else None
+    if job is None or job['identity'] not in ("public", _identity_key()):
+        return _error_response("Job '" + job_id + "' not found", 404)
+    return _job_response(job)
+
+# Administrative routes: callers must be in ADMIN_IDENTITIES (see _is_admin()).
+def _admin_error_response():
+    if not _is_admin():
+        return _error_response("Administrative access required", 403)
+    if result_cache is None:
+        return _error_response("Result caching is disabled (CACHE_DB)", 404)
+    return None
+
+def _admin_json_response(data, code=200):
+    res = make_response(json.dumps(data), code)
+    res.mimetype = 'application/json'
+    res.headers['Cache-Control'] = 'no-store'
+    return res
+
+# /admin/cache
+# Lists cached results: per catalog and route (endpoint), the number and size of entries and the
+# hit ratio of lookups, then the newest entries, optionally for one catalog, route or DCC.
+@app.route('/admin/cache', methods=['GET'])
+def admin_cache():
+    err = _admin_error_response()
+    if err is not None:
+        return err
+    catalog_id = request.args.get("catalogId")
+    route = request.args.get("route")
+    limit = request.args.get("limit", 100, type=int)
+    return _admin_json_response({
+        'summary': result_cache.summary(catalog_id, route),
+        'entries': result_cache.entries(catalog_id, route, request.args.get("dcc"), limit),
+    })
+
+# Discards this process's derived data for catalog_id (None for all catalogs)
+def _forget_catalog(catalog_id):
+    for key in list(timeseries_snaptimes):
+        if catalog_id is None or key == catalog_id:
+            timeseries_snaptimes.pop(key, None)
+    global stats_cubes_bytes
+    with stats_cubes_lock:
+        for key in list(stats_cubes):
+            if catalog_id is None or key[0] == catalog_id:
+                stats_cubes_bytes -= stats_cubes.pop(key)[3]
+
+# Discards the derived data of catalog_id (None for all catalogs) in every API process on this host:
+# this one at once, the others before their next request (see apply_invalidations()).
+def _invalidate_catalog(catalog_id):
+    result_cache.invalidate(catalog_id)
+    _forget_catalog(catalog_id)
+
+@app.before_request
+def apply_invalidations():
+    global invalidation_seq
+    if result_cache is None or request.environ.get('dashboard.subrequest'):
+        return
+    for seq, catalog_id in result_cache.invalidations(invalidation_seq):
+        _forget_catalog(catalog_id)
+        invalidation_seq = max(invalidation_seq, seq)
+
+# /admin/cache (DELETE)
+# Purges cached results (including those kept to serve stale), for one catalog, route (endpoint)
+# or DCC, or all of them if none is given, and has every API process on this host discard what it
+# derived from the catalog (e.g., stats cubes).
+@app.route('/admin/cache', methods=['DELETE'])
+def admin_purge_cache():
+    err = _admin_error_response()
+    if err is not None:
+        return err
+    catalog_id = request.args.get("catalogId")
+    purged = result_cache.purge(catalog_id, request.args.get("route"), request.args.get("dcc"))
+    _invalidate_catalog(catalog_id)
+    app.logger.info("purged %d cached results (%s)", purged, request.query_string.decode('utf-8', 'replace'))
+    return _admin_json_response({ 'purged': purged })
+
+# /admin/warmup
+# Starts a warm-up (see WARMUP in dashboard_config.py) of the process serving the request.
+@app.route('/admin/warmup', methods=['POST'])
+def admin_warm_up():
+    err = _admin_error_response()
+    if err is not None:
+        return err
+    started = _start_warm_up()
+    return _admin_json_response(dict(warmup_status, started_now=started), 202)
+
+# /admin/catalog_published
+# Webhook for the release pipeline, called once a datapackage catalog has been published: purges
+# the catalog's cached results (all results if no catalogId is given) and every API process's
+# derived data for it, has the snaptime poller see the new content at once, and starts a warm-up
+# of the process serving the request (the results it caches are shared by all processes). Callers
+# send RELEASE_WEBHOOK_TOKEN as a bearer token, or are administrators.
+@app.route('/admin/catalog_published', methods=['POST'])
+def admin_catalog_published():
+    token = app.config["RELEASE_WEBHOOK_TOKEN"]
+    auth = request.headers.get('Authorization', '')
+    if not (token and hmac.compare_digest(auth.encode('utf-8'), ("Bearer " + token).encode('utf-8'))):
+        err = _admin_error_response()
+        if err is not None:
+            return err
+    if result_cache is None:
+        return _error_response("Result caching is disabled (CACHE_DB)", 404)
+
+    body = request.get_json(silent=True) or {}
+    catalog_id = request.args.get("catalogId") or body.get("catalogId")
+    if catalog_id is not None:
+        catalog_id = str(catalog_id)
+    purged = result_cache.purge(catalog_id)
+    _invalidate_catalog(catalog_id)
+
+    snaptime = None
+    if catalog_id is not None:
+        if snaptime_poller is not None:
+            try:
+                snaptime = snaptime_poller.refresh(catalog_id)
+            except Exception as e:
+                app.logger.warning("snaptime check of published catalog %s failed: %s", catalog_id, e)
+
+    app.logger.info("catalog %s published: purged %d cached results", catalog_id, purged)
+    return _admin_json_response({
+        'catalogId': catalog_id,
+        'purged': purged,
+        'snaptime': snaptime,
+        'warmup_started': _start_warm_up(),
+    }, 202)
+
+# /health
+# Reports whether this process has finished warming up and is ready to serve traffic.
+@app.route('/health', methods=['GET'])
+def health():
+    res = make_response(json.dumps(warmup_status), 200 if warmup_status['ready'] else 503)
+    res.mimetype = 'application/json'
+    return res
+
+def warm_up():
+    """Prepare this process to serve traffic
+
+    Builds helpers (and so loads catalog models) for the default
+    catalog and WARMUP_CATALOG_IDS, binds the registry, primes the DCC
+    directory and requests each of WARMUP_QUERIES, then marks the
+    process as ready.  Failures are recorded in warmup_status but do
+    not prevent the process from becoming ready, since the affected
+    routes will simply do the work on their first request.
+
+    """
+    warmup_status['started'] = datetime.datetime.now().isoformat()
+    warmup_status['finished'] = None
+    warmup_status['errors'] = []
+    base_url = _get_scheme() + "://" + HOSTNAME
+
+    def record_error(what, err):
+        warmup_status['errors'].append("%s: %s" % (what, err))
+        app.logger.warning("warm-up of %s failed: %s", what, err)
+
+    with app.test_request_context(base_url=base_url):
+        for catalog_id in [DEFAULT_CATALOG_ID] + [str(c) for c in app.config["WARMUP_CATALOG_IDS"]]:
+            try:
+                helper = _get_helper(catalog_id)
+                if isinstance(helper, wrappers.Response):
+                    record_error("catalog " + catalog_id, helper.get_data(as_text=True))
+                    continue
+                _all_dccs(helper)
+            except Exception as e:
+                record_error("catalog " + catalog_id, e)
+        try:
+            _get_catalog('registry')
+        except Exception as e:
+            record_error("registry", e)
+
+    client = app.test_client()
+    for path in app.config["WARMUP_QUERIES"]:
+        try:
+            res = client.get(path, base_url=base_url)
+            if res.status_code != 200:
+                record_error(path, "status " + str(res.status_code))
+        except Exception as e:
+            record_error(path, e)
+
+    warmup_status['finished'] = datetime.datetime.now().isoformat()
+    warmup_status['ready'] = True
+
+# Runs warm_up() on a background thread unless one is already running; returns whether it started
+def _start_warm_up():
+    if not warmup_lock.acquire(blocking=False):
+        return False
 
+    def run():
+        try:
+            warm_up()
+        finally:
+            warmup_lock.release()
+
+    threading.Thread(target=run, name='dashboard-warmup', daemon=True).start()
+    return True
+
+# Returns the current snaptime of catalog_id (or "registry") from ERMrest, for the snaptime poller
+def _fetch_snaptime(catalog_id):
+    with app.app_context():
+        if catalog_id == 'registry':
+            catalog = _get_catalog('registry')[0]
+        else:
+            helper = _get_catalog_helper(catalog_id)
+            if isinstance(helper, wrappers.Response):
+                raise Exception(helper.get_data(as_text=True))
+            catalog = helper.catalog
+        return catalog.get('/').json()['snaptime']
+
+# Called by the snaptime poller when a catalog's content changes: drop this process's data for
+# the old snaptime and reload the catalog's preloaded data, if any
+def _catalog_changed(catalog_id, old_snaptime, new_snaptime):
+    app.logger.info("catalog %s changed (snaptime %s -> %s)", catalog_id, old_snaptime, new_snaptime)
+    metrics.inc('dashboard_catalog_changes_total', { 'catalog': catalog_id })
+    _forget_catalog(catalog_id)
+    if catalog_id in preloaded:
+        _preload(catalog_id)
+    if catalog_id == 'registry' and app.config["FAIR_PRECOMPUTE"]:
+        _start_fair_precompute()
+
+snaptime_store = None
+snaptime_poller = None
+if app.config["SNAPTIME_POLL_INTERVAL"]:
+    if app.config["CACHE_DB"]:
+        snaptime_store = cache.SnaptimeStore(app.config["CACHE_DB"])
+    snaptime_poller = snaptimes.SnaptimePoller(_fetch_snaptime, app.config["SNAPTIME_POLL_INTERVAL"],
+                                               snaptime_store, app.logger)
+    snaptime_poller.on_change(_catalog_changed)
+    for catalog_id in [DEFAULT_CATALOG_ID, 'registry'] + [str(c) for c in app.config["PRELOAD_CATALOG_IDS"]]:
+        snaptime_poller.watch(catalog_id)
+
+if app.config["PRELOAD"]:
+    preload()
+
+if app.config["FAIR_PRECOMPUTE"]:
+    _start_fair_precompute()
+
+if app.config["WARMUP"]:
+    if app.config["WARMUP_IN_BACKGROUND"]:
+        _start_warm_up()
+    else:
+        with warmup_lock:
+            warm_up()
 
 if __name__ == '__main__':
     app.run(threaded=True)
@@ -6,6 +6,11 @@ PASS_HEADERS = True
 # When developing on a stack without deriva, use "app-dev.nih-cfde.org"
 DERIVA_SERVERNAME = "localhost"
 DERIVA_DEFAULT_CATALOGID = "1"
+# "http" or "https"; None uses http for "localhost" and https otherwise
+DERIVA_SCHEME = None
+
+# Settings may be overridden in ~/dashboard.conf, or in the file named by the DASHBOARD_CONFIG
+# environment variable.
 
 # Note: This prop is used for local testing to where the chaise navbar is not part of the stack
 # When testing locally, there won't be an auth token which is passed through the API to cfde-deriva
@@ -15,3 +20,195 @@ DERIVA_DEFAULT_CATALOGID = "1"
 # 3) Drop it in as string value for DEV_TOKEN (below)
 # DO NOT push a DEV prop file with a token value to the repo
 DEV_TOKEN = ""
+
+# Snapshot pinning: a request may pass ?snaptime=<ERMrest snaptime> to run all of its catalog
+# queries against that snapshot; such responses are immutable and are cached in CACHE_DB.
+# Set PIN_SNAPTIME to pin requests without a snaptime parameter to the catalog's current snaptime,
+# so that all aggregates within a request are computed over consistent content.
+PIN_SNAPTIME = False
+# Cached results (pinned snapshots, stale fallbacks, asynchronous jobs) are kept per caller
+# identity (bearer token or webauthn session cookie), since catalog content is read with the
+# caller's credentials. Results from the catalogs
+# in PUBLIC_CATALOG_IDS, whose content every caller sees in full (e.g., released catalogs with
+# public read access and no row-level policies), are shared by all callers instead, except for
+# paths matching IDENTITY_SCOPED_ROUTES (routes whose results depend on the caller, or are read
+# from the registry). With PASS_HEADERS = False all catalog results are shared.
+PUBLIC_CATALOG_IDS = []
+IDENTITY_SCOPED_ROUTES = [r'^/user/', r'^/fair(/|$)']
+# Maximum number of per-snapshot DashboardQueryHelpers kept per process
+SNAPSHOT_HELPERS_MAX = 8
+
+# Catalog change detection: if set (e.g. 30), every SNAPTIME_POLL_INTERVAL seconds a background
+# thread in each API process checks the snaptimes of the catalogs in use and the registry, sharing
+# them through CACHE_DB so that one process per host asks ERMrest. Current-snaptime lookups
+# (PIN_SNAPTIME, PRELOAD freshness) then read them from memory, and may lag a catalog change by up
+# to the interval; a catalog's preloaded data is reloaded when it changes. None (the default)
+# disables polling, and current snaptimes are then asked of ERMrest when needed.
+SNAPTIME_POLL_INTERVAL = None
+
+# sqlite database shared by all API processes on a host for cached results, e.g.
+# "/var/tmp/dashboard-api/cache.sqlite" (its directory is created, readable only by the API's user).
+# It also holds stale responses, asynchronous jobs and polled snaptimes. None (the default)
+# disables caching and those features.
+CACHE_DB = None
+CACHE_MAX_ENTRIES = 10000
+
+# Warm-up: when the module is loaded (mod_wsgi preloads it at daemon startup, see
+# wsgi_dashboard_api.conf), build the DashboardQueryHelpers for the default catalog and
+# WARMUP_CATALOG_IDS and the registry binding, loading their models and priming the DCC
+# directory, then request each of WARMUP_QUERIES (e.g. "/dcc_info", "/stats/files/dcc").
+# /health reports 503 until warm-up has finished.
+WARMUP = False
+WARMUP_IN_BACKGROUND = False
+WARMUP_CATALOG_IDS = []
+WARMUP_QUERIES = []
+
+# Preload: when the module is loaded, read immutable per-catalog data (vocabulary term tables,
+# the DCC directory, the project hierarchy and, with PRELOAD_STATS, the entity counts for the
+# catalog and each DCC) for the default catalog and PRELOAD_CATALOG_IDS into compact structures,
+# saving those queries on each request. Preloaded data is read anonymously and served to all
+# callers, so only catalogs in PUBLIC_CATALOG_IDS are preloaded (any, with PASS_HEADERS = False).
+# It is used while the catalog's snaptime, as last checked by the poller, is unchanged, so PRELOAD
+# requires SNAPTIME_POLL_INTERVAL (the module fails to load without it).
+# Sharing the preloaded data's memory between worker processes needs a server that imports the
+# application once and then forks its workers (e.g. gunicorn --preload); with PRELOAD_GC_FREEZE the
+# data is gc.freeze()d so that the workers' collections leave those pages shared copy-on-write.
+# The mod_wsgi daemon processes of wsgi_dashboard_api.conf are forked before the application is
+# loaded, so there every process reads and keeps its own copy: preloading saves queries, not memory,
+# and PRELOAD_GC_FREEZE shares nothing.
+PRELOAD = False
+PRELOAD_CATALOG_IDS = []
+PRELOAD_STATS = True
+PRELOAD_GC_FREEZE = False
+
+# Stats cubes: each API process keeps the grouped counts of its most recently used StatsQuery2
+# queries (per catalog snaptime, caller scope, entity, set of groupings and measure), at most
+# STATS_CUBE_CACHE_MAX of them and STATS_CUBE_CACHE_BYTES (estimated) in all, so that /stats
+# requests for the same dimensions (e.g. a drill-down filtering on a dimension its page grouped by,
+# ?dcc=... after includeDCC=true) and the /dcc/{dccId} stats routes are answered without querying
+# ERMrest again. Larger results are not kept, and none are kept for requests whose catalog snaptime
+# isn't known without asking ERMrest (i.e. not pinned, see PIN_SNAPTIME, nor polled, see
+# SNAPTIME_POLL_INTERVAL). 0 disables them.
+STATS_CUBE_CACHE_MAX = 32
+STATS_CUBE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Directory where each API process periodically writes its metrics (at most every
+# METRICS_FLUSH_INTERVAL seconds) so that /metrics can report totals for all processes on
+# the host, e.g. "/var/tmp/dashboard-api/metrics". None (the default) limits /metrics to the
+# process serving the scrape.
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 5
+
+# Slow-query log: upstream (ERMrest/authn) calls taking at least SLOW_QUERY_THRESHOLD_MS are
+# logged as JSON lines (route, ERMrest URL, rows, bytes, elapsed time) to SLOW_QUERY_LOG, which is
+# rotated at SLOW_QUERY_LOG_MAX_BYTES. The path may contain {pid} to give each process its own file.
+# None disables the log.
+SLOW_QUERY_LOG = None
+SLOW_QUERY_THRESHOLD_MS = 1000
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 5
+
+# Admission control: ADMISSION_ROUTES assigns request paths (first matching regular expression)
+# to the named budgets in ADMISSION_BUDGETS, each allowing (concurrent requests, queued requests)
+# across all API processes on the host. A request that finds its budget's queue full, or waits
+# more than ADMISSION_QUEUE_TIMEOUT seconds in the queue, is answered with 503 and a Retry-After
+# of ADMISSION_RETRY_AFTER seconds. Paths matching no rule are always admitted. A queued request
+# occupies its API process (thread) while it waits, so keep queues short. Subrequests (e.g. the
+# points of a time series) are admitted by their own paths. For example:
+#   ADMISSION_BUDGETS = { 'linkcount': (2, 4), 'heavy_stats': (2, 8) }
+#   ADMISSION_ROUTES = [ (r'^/dcc/[^/]+/linkcount$', 'linkcount'),
+#                        (r'^/(dcc/[^/]+/)?stats/.*/(gene|protein|compound)(/|$)', 'heavy_stats') ]
+ADMISSION_BUDGETS = {}
+ADMISSION_ROUTES = []
+ADMISSION_QUEUE_TIMEOUT = 10
+ADMISSION_RETRY_AFTER = 5
+# Directory shared by all API processes for the budgets' slot lock files
+ADMISSION_DIR = "/var/tmp/dashboard-api/admission"
+
+# Deadlines: each request must finish within REQUEST_DEADLINE seconds, or the seconds given by the
+# first entry of ROUTE_DEADLINES (regular expression, seconds) matching its path. Upstream calls
+# time out, and stop retrying, at the deadline; the request then gets 504 (or a stale response, see
+# SERVE_STALE). None (the default) means no deadline: upstream calls use deriva-py's default
+# timeouts and retries, as before. To enable, set e.g. REQUEST_DEADLINE = 120, with longer
+# ROUTE_DEADLINES for routes whose queries legitimately take longer, e.g.
+#   ROUTE_DEADLINES = [ (r'^/(dcc/[^/]+/)?stats/.*/(gene|protein|compound)(/|$)', 600) ]
+REQUEST_DEADLINE = None
+ROUTE_DEADLINES = []
+# Circuit breakers: when, within the last CIRCUIT_WINDOW seconds, at least CIRCUIT_MIN_CALLS calls
+# were made to an upstream (catalog, registry or authn) and at least CIRCUIT_FAILURE_RATE of them
+# failed (server or connection error, or took CIRCUIT_SLOW_CALL_MS or longer), the API process
+# stops calling it for CIRCUIT_OPEN_SECONDS; requests needing it get 503 (or a stale response, see
+# SERVE_STALE) with an X-CFDE-Circuit-Open header. A single probe call then decides whether to resume.
+# Off by default; set CIRCUIT_BREAKER = True to enable them with the settings below.
+CIRCUIT_BREAKER = False
+CIRCUIT_WINDOW = 60
+CIRCUIT_MIN_CALLS = 20
+CIRCUIT_FAILURE_RATE = 0.5
+CIRCUIT_SLOW_CALL_MS = 10000
+CIRCUIT_OPEN_SECONDS = 30
+
+# Keep the last successful response to each URL (per identity) in CACHE_DB, and serve it, marked
+# with "X-CFDE-Stale: true", when a later request for the URL runs out of time, finds an upstream's
+# circuit breaker open, or gets an upstream server error. Responses to IDENTITY_SCOPED_ROUTES are
+# never kept. At most STALE_MAX_ENTRIES responses are kept, each for STALE_MAX_AGE seconds, apart
+# from the CACHE_MAX_ENTRIES cached results.
+SERVE_STALE = False
+STALE_MAX_ENTRIES = 1000
+STALE_MAX_AGE = 86400
+
+# Threads per API process for running independent catalog subqueries (e.g. the DCC entity counts)
+# in parallel; 0 runs them one after another.
+SUBQUERY_THREADS = 0
+
+# Asynchronous jobs: a request with async=true for a path matching ASYNC_JOB_ROUTES gets 202 and a
+# job id at once, and is run on one of ASYNC_JOB_THREADS background threads of the API process
+# with a deadline of ASYNC_JOB_DEADLINE seconds; /jobs/<id> reports its status and, once done, its
+# result. At most ASYNC_JOB_MAX_QUEUED jobs per process may be unfinished. Jobs are kept in CACHE_DB
+# (which must be set) for ASYNC_JOB_MAX_AGE seconds.
+ASYNC_JOBS = True
+ASYNC_JOB_ROUTES = [r'^/(dcc/[^/]+/)?stats/']
+ASYNC_JOB_THREADS = 2
+ASYNC_JOB_MAX_QUEUED = 20
+ASYNC_JOB_DEADLINE = 1800
+ASYNC_JOB_MAX_AGE = 86400
+# Retry-After (seconds) sent with 202 responses for unfinished jobs
+ASYNC_JOB_POLL_INTERVAL = 2
+
+# Time series: /timeseries/<path>?catalogIds=... returns the result of /<path> for each of up to
+# TIMESERIES_MAX_CATALOGS catalogs, requested on TIMESERIES_THREADS threads per API process. Only
+# paths matching TIMESERIES_ROUTES are allowed. Each catalog's snaptime (which selects its cached
+# snapshot results) is rechecked at most every TIMESERIES_SNAPTIME_MAX_AGE seconds, unless the
+# snaptime poller already watches the catalog.
+TIMESERIES_ROUTES = [r'^/(dcc/[^/]+/)?stats/', r'^/dcc_info$', r'^/dcc/[^/]+$']
+TIMESERIES_THREADS = 4
+TIMESERIES_MAX_CATALOGS = 50
+TIMESERIES_SNAPTIME_MAX_AGE = 60
+
+# /dcc/{dccId} and /fair find catalogs' datapackages in an index of those the registry shows
+# anonymously, rebuilt when the snaptime poller sees the registry change or, when it doesn't
+# know the registry's snaptime, at most every DATAPACKAGE_INDEX_MAX_AGE seconds. A datapackage
+# added in between is still found by a registry query of its own.
+DATAPACKAGE_INDEX_MAX_AGE = 300
+
+# Rows fetched from ERMrest per request while streaming /user/saved_queries and
+# /user/personal_collections (when the client does not pass a limit)
+USER_LIST_PAGE_SIZE = 1000
+
+# FAIR metrics are cached in CACHE_DB per datapackage submission. With FAIR_PRECOMPUTE, each API
+# process computes those of every datapackage the registry shows anonymously in the background
+# at startup and whenever the registry changes (see SNAPTIME_POLL_INTERVAL).
+FAIR_PRECOMPUTE = False
+# Maximum number of catalogs in one /fair?catalogId=... request
+FAIR_MAX_CATALOGS = 50
+
+# webauthn client ids or attribute (group) ids allowed to use administrative features
+ADMIN_IDENTITIES = []
+# Bearer token with which the release pipeline may call /admin/catalog_published (None: only
+# administrators may call it). Set it in ~/dashboard.conf, not here.
+RELEASE_WEBHOOK_TOKEN = None
+
+# Profiling: when enabled, an administrator can send an "X-CFDE-Profile: inline" or
+# "X-CFDE-Profile: store" request header to run that request under cProfile; stored profiles
+# are written to PROFILE_DIR.
+PROFILING = False
+PROFILE_DIR = "/var/tmp/dashboard-api/profiles"
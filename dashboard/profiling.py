@@ -0,0 +1,80 @@
+#
+# Per-request profiling support for the dashboard API.
+#
+# The API runs a request under cProfile when an administrator asks for it (see
+# PROFILING in dashboard_config.py); this module turns the collected statistics into a
+# breakdown of where the request's time went. cProfile and pstats are only imported once a
+# request is profiled.
+#
+import os
+import json
+
+# function names (as reported by cProfile) for each part of the breakdown
+JSON_ENCODING = ('dumps',)
+MERGE = ('_merge_within_groups_global', '_merge_within_groups_local', '_merge_groups')
+PIVOT = ('_grouped_stats_aux',)
+UPSTREAM = ('_timed',)
+
+def _is_builtin(key):
+    return key[0] == '~'
+
+def _sum_cumulative(stats, names, module=None):
+    total = 0.0
+    for key, (cc, nc, tt, ct, callers) in stats.items():
+        if key[2] in names and not _is_builtin(key) and (module is None or key[0].endswith(module)):
+            # skip recursive entries so nested calls are not counted twice
+            if not any(caller[2] in names for caller in callers):
+                total += ct
+    return total
+
+def _pivot_time(stats):
+    # time spent in the pivot loop itself (including the builtins it calls), i.e. the cumulative
+    # time of _grouped_stats_aux minus that of the Python functions it calls, such as the
+    # StatsQuery2 fetch
+    total = 0.0
+    for key, (cc, nc, tt, ct, callers) in stats.items():
+        if key[2] in PIVOT and not _is_builtin(key):
+            total += ct
+            for callee, callee_stats in stats.items():
+                edge = callee_stats[4].get(key)
+                if edge is not None and not _is_builtin(callee):
+                    total -= edge[3]
+    return max(total, 0.0)
+
+def breakdown(profiler, total, top=25):
+    """Summarize a cProfile.Profile for one request taking total seconds
+
+    Returns a dict with the request's total time and the time
+    spent in upstream calls, JSON encoding, stats pivoting and group
+    merging (all in milliseconds), plus the top functions by cumulative
+    time.
+
+    """
+    import pstats
+    stats = pstats.Stats(profiler).stats
+    parts = {
+        'upstream_wait': _sum_cumulative(stats, UPSTREAM, os.path.join('dashboard', 'upstream.py')),
+        'json_encoding': _sum_cumulative(stats, JSON_ENCODING, os.path.join('json', '__init__.py')),
+        'grouped_stats_pivot': _pivot_time(stats),
+        'merge': _sum_cumulative(stats, MERGE),
+    }
+    parts['other'] = max(total - sum(parts.values()), 0.0)
+
+    functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:top]
+    return {
+        'total_ms': round(total * 1000, 3),
+        'breakdown_ms': { k: round(v * 1000, 3) for k, v in parts.items() },
+        'top_functions': [{
+            'function': pstats.func_std_string(key),
+            'calls': nc,
+            'tottime_ms': round(tt * 1000, 3),
+            'cumtime_ms': round(ct * 1000, 3),
+        } for key, (cc, nc, tt, ct, callers) in functions],
+    }
+
+def store(profiler, summary, directory, profile_id):
+    """Write the raw profile (pstats format) and its summary (JSON) to directory"""
+    os.makedirs(directory, exist_ok=True)
+    profiler.dump_stats(os.path.join(directory, profile_id + '.prof'))
+    with open(os.path.join(directory, profile_id + '.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
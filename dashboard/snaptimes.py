@@ -0,0 +1,147 @@
+#
+# Catalog change detection for the dashboard API.
+#
+# A background thread in each API process tracks the snaptimes of the catalogs in use (and the
+# registry), so that code needing a catalog's current snaptime reads it from memory instead of
+# asking ERMrest on every request. Snaptimes are shared through a cache.SnaptimeStore, so that on
+# each host only one process per polling interval asks ERMrest; the others pick up its answer.
+# Caches and warmers can register callbacks to run when a catalog changes.
+#
+import os
+import time
+import logging
+import threading
+
+class SnaptimePoller(object):
+    """Tracks the snaptimes of watched catalogs
+
+    fetch(catalog_id) returns a catalog's current snaptime from
+    ERMrest.  Every interval seconds the poller's thread checks each
+    watched catalog (through store, a cache.SnaptimeStore, or on its
+    own when store is None) and calls the on_change() callbacks with
+    (catalog_id, old snaptime, new snaptime) for each change it sees.
+
+    """
+    def __init__(self, fetch, interval, store=None, logger=None):
+        self.fetch = fetch
+        self.interval = interval
+        self.store = store
+        self.logger = logger or logging.getLogger(__name__)
+        # catalog id -> (snaptime, time it was checked)
+        self._known = {}
+        self._watched = set()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._thread = None
+        self._stopped = False
+
+    def watch(self, catalog_id):
+        """Track catalog_id's snaptime from now on"""
+        if catalog_id not in self._watched:
+            with self._lock:
+                self._watched.add(catalog_id)
+            self._wake.set()
+        self.start()
+
+    def on_change(self, callback):
+        """Call callback(catalog_id, old snaptime, new snaptime) on the poller's thread when a catalog changes"""
+        self._callbacks.append(callback)
+
+    def snaptime(self, catalog_id, watch=True):
+        """Return catalog_id's snaptime, or None if it is not known or is out of date
+
+        A known snaptime was checked at most a few polling intervals
+        ago; None (e.g., for a catalog not watched until now, or
+        while ERMrest can't be reached) means the caller should ask
+        ERMrest itself.  Unless watch is False, catalog_id is watched
+        from now on.
+
+        """
+        if watch:
+            self.watch(catalog_id)
+        known = self._known.get(catalog_id)
+        if known is None or time.time() - known[1] > 3 * self.interval:
+            return None
+        return known[0]
+
+    def refresh(self, catalog_id):
+        """Check catalog_id now (e.g., when told it has changed) and return its snaptime
+
+        The result is shared with the other processes, which run
+        their change callbacks when they next poll.
+
+        """
+        self.watch(catalog_id)
+        snaptime = self.fetch(catalog_id)
+        checked = time.time()
+        if self.store is not None:
+            self.store.put(catalog_id, snaptime, checked)
+        self._update(catalog_id, snaptime, checked)
+        return snaptime
+
+    def start(self):
+        """Start the poller's thread in this process, if it isn't running (e.g., after a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='dashboard-snaptime-poller', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop polling (e.g., before the store is closed at exit), waiting up to timeout seconds for a poll in progress"""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None and self._pid == os.getpid() and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.clear()
+            try:
+                self.poll()
+            except Exception:
+                if not self._stopped:
+                    self.logger.exception("snaptime poll failed")
+            self._wake.wait(self.interval)
+
+    def poll(self):
+        """Check each watched catalog once"""
+        with self._lock:
+            watched = sorted(self._watched)
+        shared = self.store.get_all() if self.store is not None else {}
+        for catalog_id in watched:
+            if self._stopped:
+                return
+            snaptime, checked = shared.get(catalog_id, (None, 0.0))
+            if time.time() - checked >= self.interval and \
+               (self.store is None or self.store.claim(catalog_id, self.interval)):
+                try:
+                    snaptime = self.fetch(catalog_id)
+                except Exception as e:
+                    self.logger.warning("snaptime check of catalog %s failed: %s", catalog_id, e)
+                    continue
+                checked = time.time()
+                if self.store is not None:
+                    self.store.put(catalog_id, snaptime, checked)
+            if snaptime is not None:
+                self._update(catalog_id, snaptime, checked)
+
+    def _update(self, catalog_id, snaptime, checked):
+        with self._lock:
+            old = self._known.get(catalog_id)
+            if old is not None and checked < old[1]:
+                # e.g., a poll that read the store before a refresh()
+                return
+            self._known[catalog_id] = (snaptime, checked)
+        if old is None or old[0] == snaptime:
+            return
+        for callback in list(self._callbacks):
+            try:
+                callback(catalog_id, old[0], snaptime)
+            except Exception:
+                self.logger.exception("catalog change callback failed for catalog %s", catalog_id)
@@ -0,0 +1,204 @@
+#
+# Request and upstream metrics for the dashboard API, exposed in Prometheus text format.
+#
+# Each process keeps its own counters and histograms and periodically writes them to a
+# per-process JSON file in a shared directory; rendering merges the files of all processes
+# (live or exited) so that the totals cover every mod_wsgi daemon process on the host.
+#
+import os
+import json
+import time
+import threading
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    'dashboard_requests_total': ('counter', "API requests served, by route and status code."),
+    'dashboard_request_duration_seconds': ('histogram', "API request latency, by route."),
+    'dashboard_upstream_calls_total': ('counter', "Calls made to upstream services (ERMrest catalog, registry, authn)."),
+    'dashboard_upstream_errors_total': ('counter', "Upstream calls that failed."),
+    'dashboard_upstream_duration_seconds': ('histogram', "Upstream call latency, by upstream."),
+    'dashboard_cache_requests_total': ('counter', "Cache lookups, by cache and result (hit or miss)."),
+    'dashboard_circuit_transitions_total': ('counter', "Circuit breaker state changes, by upstream and new state."),
+    'dashboard_circuit_rejections_total': ('counter', "Upstream calls refused by an open circuit breaker, by upstream."),
+    'dashboard_catalog_changes_total': ('counter', "Catalog content changes (new snaptimes) seen by the snaptime poller, by catalog."),
+    'dashboard_admission_total': ('counter', "Requests subject to admission control, by budget and result "
+                                             "(admitted, queued, shed or timeout)."),
+    'dashboard_admission_wait_seconds': ('histogram', "Time queued requests waited for admission, by budget."),
+}
+
+ARCHIVE_FILE = 'metrics-archive.json'
+
+def _labels_key(labels):
+    return json.dumps(sorted(labels.items()))
+
+class Metrics(object):
+    def __init__(self):
+        self.directory = None
+        self.flush_interval = 5.0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def configure(self, directory, flush_interval):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._file = 'metrics-%d-%d.json' % (self._pid, int(time.time() * 1000))
+        self._last_flush = 0
+        self.counters = {}
+        self.histograms = {}
+
+    def _check_fork(self):
+        # a forked child must not report (or overwrite) its parent's counts
+        if self._pid != os.getpid():
+            self._reset()
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._check_fork()
+            key = (name, _labels_key(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            self._check_fork()
+            key = (name, _labels_key(labels))
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += value
+            hist[-1] += 1
+
+    def _snapshot(self):
+        return {
+            'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+            'histograms': [[name, labels, hist] for (name, labels), hist in self.histograms.items()],
+        }
+
+    def flush(self, force=False):
+        """Write this process's metrics to the shared directory, at most every flush_interval seconds"""
+        if not self.directory:
+            return
+        now = time.time()
+        with self._lock:
+            self._check_fork()
+            if not force and now - self._last_flush < self.flush_interval:
+                return
+            self._last_flush = now
+            doc = self._snapshot()
+        path = os.path.join(self.directory, self._file)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(doc, f)
+        os.replace(path + '.tmp', path)
+
+    def _read_others(self):
+        # return the metrics of the other processes (live, then exited ones as archived), folding
+        # the files of exited processes into the archive so the directory doesn't grow with every
+        # worker recycle; all under the lock, so that another process compacting meanwhile can't
+        # have a file counted both on its own and in the archive
+        import fcntl
+        with open(os.path.join(self.directory, 'metrics.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+            archive = _read(archive_path) or { 'counters': [], 'histograms': [] }
+            docs = []
+            dead = []
+            for fname in os.listdir(self.directory):
+                if not (fname.startswith('metrics-') and fname.endswith('.json')) or fname in (ARCHIVE_FILE, self._file):
+                    continue
+                doc = _read(os.path.join(self.directory, fname))
+                if pid_alive(int(fname.split('-')[1])):
+                    if doc is not None:
+                        docs.append(doc)
+                    continue
+                if doc is not None:
+                    archive = _merge([archive, doc])
+                dead.append(fname)
+            if dead:
+                with open(archive_path + '.tmp', 'w') as f:
+                    json.dump(archive, f)
+                os.replace(archive_path + '.tmp', archive_path)
+                for fname in dead:
+                    os.unlink(os.path.join(self.directory, fname))
+            return docs + [archive]
+
+    def render(self):
+        """Return all processes' metrics in Prometheus text exposition format"""
+        with self._lock:
+            self._check_fork()
+            docs = [self._snapshot()]
+        if self.directory:
+            docs.extend(self._read_others())
+        merged = _merge(docs)
+
+        by_name = {}
+        for name, labels, value in merged['counters']:
+            by_name.setdefault(name, []).append((labels, value))
+        for name, labels, hist in merged['histograms']:
+            by_name.setdefault(name, []).append((labels, hist))
+
+        lines = []
+        for name in sorted(by_name):
+            mtype, text = HELP.get(name, ('untyped', name))
+            lines.append('# HELP %s %s' % (name, text))
+            lines.append('# TYPE %s %s' % (name, mtype))
+            for labels, value in sorted(by_name[name]):
+                labels = json.loads(labels)
+                if mtype == 'histogram':
+                    for i, bound in enumerate(LATENCY_BUCKETS):
+                        lines.append('%s_bucket%s %d' % (name, _format_labels(labels + [['le', repr(bound)]]), value[i]))
+                    lines.append('%s_bucket%s %d' % (name, _format_labels(labels + [['le', '+Inf']]), value[-1]))
+                    lines.append('%s_sum%s %s' % (name, _format_labels(labels), repr(float(value[-2]))))
+                    lines.append('%s_count%s %d' % (name, _format_labels(labels), value[-1]))
+                else:
+                    lines.append('%s%s %s' % (name, _format_labels(labels), repr(float(value))))
+        return '\n'.join(lines) + '\n'
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def pid_alive(pid):
+    """Whether a process with this id exists (on this host)"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _merge(docs):
+    counters = {}
+    histograms = {}
+    for doc in docs:
+        for name, labels, value in doc['counters']:
+            counters[(name, labels)] = counters.get((name, labels), 0) + value
+        for name, labels, hist in doc['histograms']:
+            if (name, labels) in histograms:
+                histograms[(name, labels)] = [a + b for a, b in zip(histograms[(name, labels)], hist)]
+            else:
+                histograms[(name, labels)] = list(hist)
+    return {
+        'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+        'histograms': [[name, labels, hist] for (name, labels), hist in histograms.items()],
+    }
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for k, v in labels) + '}'
+
+# the process-wide metrics registry
+metrics = Metrics()
@@ -0,0 +1,409 @@
+#
+# Upstream (ERMrest/authn) call layer for the dashboard API.
+#
+# Every request the API issues to DERIVA while serving a route goes through call(),
+# either via a catalog wrapped by instrument_catalog() or via get() for plain HTTP
+# requests such as the authn session lookup.
+#
+# A request may have a deadline (set_deadline()); upstream calls then time out, and are not
+# retried, beyond it, and raise DeadlineExceeded once it has passed.
+#
+# Each upstream also has a circuit breaker (configure_circuit_breakers()): when too many recent
+# calls to it failed or were slow, further calls fail fast with CircuitOpen until a probe call
+# succeeds.
+#
+import os
+import json
+import time
+import logging
+import logging.handlers
+import datetime
+import contextlib
+import threading
+import contextvars
+import collections
+import requests
+from urllib3.util.retry import Retry
+from flask import g, has_app_context, has_request_context, request
+from deriva.core import DEFAULT_HEADERS
+from deriva.core.utils.core_utils import DEFAULT_REQUESTS_TIMEOUT, TimeoutHTTPAdapter
+from dashboard.telemetry import metrics
+
+slow_query_log = logging.getLogger('dashboard.slow_queries')
+slow_query_log.propagate = False
+slow_query_threshold = None
+
+def configure_slow_query_log(path, threshold_ms, max_bytes, backup_count):
+    """Log upstream calls taking at least threshold_ms to path as JSON lines
+
+    path may contain {pid}, so that each process writes (and rotates)
+    its own file.
+
+    """
+    global slow_query_threshold
+    path = path.format(pid=os.getpid())
+    dirname = os.path.dirname(path)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    slow_query_log.addHandler(handler)
+    slow_query_log.setLevel(logging.INFO)
+    slow_query_threshold = threshold_ms / 1000.0
+
+# absolute time.monotonic() deadline of the current request, or None; a context variable so that
+# subqueries run on other threads (in a copy of the request's context) see it too
+_deadline = contextvars.ContextVar('dashboard_upstream_deadline', default=None)
+
+class DeadlineExceeded(Exception):
+    """The current request's deadline passed before an upstream call could complete"""
+    pass
+
+def set_deadline(seconds):
+    """Give the current request (context) a deadline seconds from now; None for no deadline"""
+    _deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+def remaining():
+    """Seconds left before the current deadline, or None if there is none"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+def check_deadline():
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+
+def _bounded_timeout(timeout):
+    # cap a requests timeout ((connect, read) or a number) at the time left before the deadline
+    left = remaining()
+    if left is None:
+        return timeout
+    left = max(left, 0.001)
+    if isinstance(timeout, (tuple, list)):
+        return tuple(left if t is None else min(t, left) for t in timeout)
+    return left if timeout is None else min(timeout, left)
+
+class DeadlineRetry(Retry):
+    """urllib3 Retry that gives up once the request deadline has passed"""
+    def is_exhausted(self):
+        left = remaining()
+        return super(DeadlineRetry, self).is_exhausted() or (left is not None and left <= 0)
+
+    def get_backoff_time(self):
+        backoff = super(DeadlineRetry, self).get_backoff_time()
+        left = remaining()
+        return backoff if left is None else min(backoff, max(left, 0))
+
+    def get_retry_after(self, response):
+        retry_after = super(DeadlineRetry, self).get_retry_after(response)
+        left = remaining()
+        return retry_after if retry_after is None or left is None else min(retry_after, max(left, 0))
+
+class DeadlineHTTPAdapter(TimeoutHTTPAdapter):
+    """deriva's TimeoutHTTPAdapter with its timeouts capped at the request deadline"""
+    def send(self, request, **kwargs):
+        check_deadline()
+        kwargs['timeout'] = _bounded_timeout(kwargs.get('timeout') or self.timeout)
+        return super(DeadlineHTTPAdapter, self).send(request, **kwargs)
+
+def _bound_session(session, session_config):
+    # the same adapter configuration as deriva.core.utils.core_utils.get_new_requests_session()
+    retries = DeadlineRetry(connect=session_config['retry_connect'],
+                            read=session_config['retry_read'],
+                            backoff_factor=session_config['retry_backoff_factor'],
+                            status_forcelist=session_config['retry_status_forcelist'],
+                            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS if
+                            not session_config.get("allow_retry_on_all_methods", False) else False,
+                            raise_on_status=True)
+    adapter = DeadlineHTTPAdapter(timeout=session_config.get("timeout", DEFAULT_REQUESTS_TIMEOUT), max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+class CircuitOpen(Exception):
+    """Calls to an upstream are being refused because its circuit breaker is open"""
+    def __init__(self, upstream, retry_after):
+        super(CircuitOpen, self).__init__("%s is unavailable (circuit breaker open)" % upstream)
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+class CircuitBreaker(object):
+    """Per-process circuit breaker for one upstream
+
+    Closed: calls go through and their outcomes are kept for window
+    seconds; once at least min_calls outcomes are kept and the share
+    of failed (server error, transport error or slower than slow_call
+    seconds) calls reaches failure_rate, the breaker opens.  Open:
+    calls raise CircuitOpen for open_seconds, then the breaker is
+    half-open.  Half-open: a single probe call goes through; its
+    success closes the breaker, its failure opens it again.
+
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, upstream, window=60, min_calls=20, failure_rate=0.5, slow_call=10.0, open_seconds=30):
+        self.upstream = upstream
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._outcomes = collections.deque()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        self.state = state
+        metrics.inc('dashboard_circuit_transitions_total', { 'upstream': self.upstream, 'state': state })
+
+    def _open(self, now):
+        self._transition(self.OPEN)
+        self._opened_at = now
+        self._outcomes.clear()
+        self._failures = 0
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may be made now"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN:
+                if now - self._opened_at < self.open_seconds:
+                    metrics.inc('dashboard_circuit_rejections_total', { 'upstream': self.upstream })
+                    raise CircuitOpen(self.upstream, self.open_seconds - (now - self._opened_at))
+                self._transition(self.HALF_OPEN)
+                self._probing = False
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    metrics.inc('dashboard_circuit_rejections_total', { 'upstream': self.upstream })
+                    raise CircuitOpen(self.upstream, 1)
+                self._probing = True
+
+    def record(self, failed, elapsed):
+        """Record the outcome of a call allowed by before_call()"""
+        failed = failed or elapsed >= self.slow_call
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open(now)
+                else:
+                    self._transition(self.CLOSED)
+                return
+            if self.state != self.CLOSED:
+                return
+
+            self._outcomes.append((now, failed))
+            self._failures += failed
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._failures -= self._outcomes.popleft()[1]
+            if len(self._outcomes) >= self.min_calls and self._failures >= self.failure_rate * len(self._outcomes):
+                self._open(now)
+
+breaker_settings = None
+breakers = {}
+_breakers_lock = threading.Lock()
+
+def configure_circuit_breakers(window, min_calls, failure_rate, slow_call_ms, open_seconds):
+    """Enable a circuit breaker, with these settings, for each upstream"""
+    global breaker_settings
+    breaker_settings = dict(window=window, min_calls=min_calls, failure_rate=failure_rate,
+                            slow_call=slow_call_ms / 1000.0, open_seconds=open_seconds)
+    breakers.clear()
+
+def breaker(upstream):
+    """The circuit breaker for upstream, or None if circuit breakers are not enabled"""
+    if breaker_settings is None:
+        return None
+    with _breakers_lock:
+        if upstream not in breakers:
+            breakers[upstream] = CircuitBreaker(upstream, **breaker_settings)
+        return breakers[upstream]
+
+def _is_failure(res, exc):
+    # server errors and transport errors count against an upstream; client errors (e.g. 404 for an
+    # unknown catalog, 401) mean it is responding normally.  Calls cut short by the caller's own
+    # deadline are not passed here: they only count if they were slow (see _timed()).
+    if exc is not None:
+        if isinstance(exc, requests.exceptions.HTTPError):
+            return exc.response is None or exc.response.status_code >= 500
+        return isinstance(exc, requests.exceptions.RequestException)
+    return isinstance(res, requests.Response) and res.status_code >= 500
+
+# per-request upstream state, kept on flask.g and shared with the request's subquery threads
+# (see _fetch_all() in dashboard_api.py), so lock guards memo, memo_hits and timings
+class _RequestState(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.memo = {}
+        self.memo_hits = 0
+        self.memoize = True
+        # upstream -> [number of calls, total seconds]
+        self.timings = {}
+
+_state_lock = threading.Lock()
+
+def _state():
+    if not has_app_context():
+        return None
+    if 'upstream_state' not in g:
+        with _state_lock:
+            if 'upstream_state' not in g:
+                g.upstream_state = _RequestState()
+    return g.upstream_state
+
+def _headers_key(headers):
+    return tuple(sorted((str(k).lower(), str(v)) for k, v in (headers or {}).items()))
+
+def call(upstream, url, headers, fn):
+    """Perform an upstream call, memoized within the current Flask request
+
+    Identical calls (same URL and headers) made while serving one
+    request return the first call's response instead of going back
+    to the server.  Outside of a request context fn() is always
+    invoked.  Every call that goes upstream is timed and counted.
+
+    """
+    state = _state()
+    if state is None or not state.memoize:
+        return _timed(state, upstream, url, fn)
+
+    key = (url, _headers_key(headers))
+    with state.lock:
+        hit = key in state.memo
+        if hit:
+            state.memo_hits += 1
+            res = state.memo[key]
+    if hit:
+        metrics.inc('dashboard_cache_requests_total', { 'cache': 'memo', 'result': 'hit' })
+        return res
+
+    # not locked while the call is made, so that subqueries run concurrently
+    metrics.inc('dashboard_cache_requests_total', { 'cache': 'memo', 'result': 'miss' })
+    res = _timed(state, upstream, url, fn)
+    with state.lock:
+        state.memo[key] = res
+    return res
+
+def _timed(state, upstream, url, fn):
+    check_deadline()
+    circuit = breaker(upstream)
+    if circuit is not None:
+        circuit.before_call()
+    start = time.perf_counter()
+    res = None
+    exc = None
+    cut_short = False
+    try:
+        res = fn()
+        return res
+    except requests.exceptions.RequestException as e:
+        exc = e
+        metrics.inc('dashboard_upstream_errors_total', { 'upstream': upstream })
+        left = remaining()
+        if left is not None and left <= 0:
+            # timed out (or stopped retrying) because of the deadline
+            cut_short = True
+            raise DeadlineExceeded("request deadline exceeded waiting for %s" % (url,)) from e
+        raise
+    except Exception as e:
+        exc = e
+        cut_short = isinstance(e, DeadlineExceeded)
+        metrics.inc('dashboard_upstream_errors_total', { 'upstream': upstream })
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if circuit is not None:
+            # a call cut short by the caller's deadline (e.g., a tight ROUTE_DEADLINES entry) says
+            # nothing about the upstream's health beyond how long it took
+            circuit.record(not cut_short and _is_failure(res, exc), elapsed)
+        if slow_query_threshold is not None and elapsed >= slow_query_threshold:
+            _log_slow_query(upstream, url, res, elapsed)
+        metrics.inc('dashboard_upstream_calls_total', { 'upstream': upstream })
+        metrics.observe('dashboard_upstream_duration_seconds', { 'upstream': upstream }, elapsed)
+        if state is not None:
+            with state.lock:
+                timing = state.timings.setdefault(upstream, [0, 0.0])
+                timing[0] += 1
+                timing[1] += elapsed
+
+@contextlib.contextmanager
+def unmemoized():
+    """Don't memoize upstream calls made within this block (e.g., pages of a streamed response)"""
+    state = _state()
+    if state is None:
+        yield
+        return
+    saved = state.memoize
+    state.memoize = False
+    try:
+        yield
+    finally:
+        state.memoize = saved
+
+def memo_hits():
+    """Number of upstream calls saved by memoization in the current request"""
+    state = _state()
+    return 0 if state is None else state.memo_hits
+
+def _log_slow_query(upstream, url, res, elapsed):
+    entry = {
+        'time': datetime.datetime.now().isoformat(),
+        'route': None,
+        'path': None,
+        'upstream': upstream,
+        'url': url,
+        'status': None,
+        'rows': None,
+        'bytes': None,
+        'elapsed_ms': round(elapsed * 1000, 1),
+    }
+    if has_request_context():
+        entry['route'] = request.url_rule.rule if request.url_rule is not None else None
+        entry['path'] = request.full_path
+    if isinstance(res, requests.Response):
+        entry['status'] = res.status_code
+        entry['bytes'] = len(res.content)
+        try:
+            doc = res.json()
+            if isinstance(doc, list):
+                entry['rows'] = len(doc)
+        except ValueError:
+            pass
+    slow_query_log.info(json.dumps(entry))
+
+def timings():
+    """{upstream: (number of calls, total seconds)} for the current request"""
+    state = _state()
+    if state is None:
+        return {}
+    with state.lock:
+        return { k: tuple(v) for k, v in state.timings.items() }
+
+def get(upstream, url, headers=DEFAULT_HEADERS):
+    return call(upstream, url, headers,
+                lambda: requests.get(url=url, headers=headers, timeout=_bounded_timeout(DEFAULT_REQUESTS_TIMEOUT)))
+
+def instrument_catalog(catalog, upstream):
+    """Route GET requests issued through catalog (an ErmrestCatalog) via call()
+
+    This covers both direct catalog.get() calls and datapath fetches,
+    which use the catalog's get() under the hood.  The catalog's
+    session is also bounded by the request deadline.
+
+    """
+    _bound_session(catalog._session, catalog.session_config)
+    catalog_get = catalog.get
+
+    def memo_get(path, headers=DEFAULT_HEADERS, raise_not_modified=False, stream=False):
+        if stream:
+            return catalog_get(path, headers=headers, raise_not_modified=raise_not_modified, stream=stream)
+        return call(upstream,
+                    catalog.get_server_uri() + path,
+                    headers,
+                    lambda: catalog_get(path, headers=headers, raise_not_modified=raise_not_modified))
+
+    catalog.get = memo_get
+    return catalog
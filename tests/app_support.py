@@ -0,0 +1,51 @@
+#
+# The dashboard API loaded once for the route tests, configured against the ERMrest/authn
+# stand-in of benchmarks/fake_ermrest.py.
+#
+# The portal catalog routes need cfde_deriva (DashboardQueryHelper, StatsQuery2); tests of those
+# routes are skipped when it isn't installed.
+#
+import importlib.util
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import fake_ermrest
+import bench_routes
+
+HAS_CFDE_DERIVA = importlib.util.find_spec('cfde_deriva') is not None
+
+ADMIN = 'https://auth.globus.org/admin'
+RELEASE_TOKEN = 'release-token'
+
+# the webauthn session the stand-in reports for every caller; empty means anonymous
+session = {}
+
+server, catalogs = fake_ermrest.start(rows=20, session=session)
+app = bench_routes.load_app(server, {
+    'ADMIN_IDENTITIES': [ADMIN],
+    'RELEASE_WEBHOOK_TOKEN': RELEASE_TOKEN,
+    'ASYNC_JOBS': True,
+    'CIRCUIT_BREAKER': False,
+    'REQUEST_DEADLINE': 2,
+    'SNAPTIME_POLL_INTERVAL': None,
+    'USER_LIST_PAGE_SIZE': 4,
+})
+
+from dashboard import dashboard_api as api
+
+def log_in(user_id):
+    """Have the stand-in report user_id as the caller (None: anonymous)"""
+    session.clear()
+    if user_id is not None:
+        session.update({ 'client': { 'id': user_id }, 'attributes': [{ 'id': user_id }] })
+
+def reset():
+    """Anonymous caller, no injected failures, and no cached results or per-process state"""
+    log_in(None)
+    catalogs.error_rate = 0
+    catalogs.reset()
+    if api.result_cache is not None:
+        api.result_cache.purge(None)
+    api._forget_catalog(None)
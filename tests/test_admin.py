@@ -0,0 +1,86 @@
+#
+# Tests of the administrative routes (/admin/...).
+#
+import unittest
+from unittest import mock
+
+import app_support
+from app_support import api
+
+class AdminRoutesTest(unittest.TestCase):
+
+    def setUp(self):
+        app_support.reset()
+        self.client = api.app.test_client()
+        for catalog_id, route in (('1', 'dcc_grouped_stats'), ('1', 'all_dcc_info'), ('2', 'all_dcc_info')):
+            key = '%s@2WG-7RJ8-8F8P public /%s?' % (catalog_id, route)
+            api.result_cache.put(key, catalog_id, route, b'{}', 'application/json')
+        # warm-ups aren't run by these tests
+        patcher = mock.patch.object(api, '_start_warm_up', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_administrators_only(self):
+        app_support.log_in('https://auth.globus.org/user-a')
+        for res in (self.client.get('/admin/cache'), self.client.delete('/admin/cache'),
+                    self.client.post('/admin/warmup'), self.client.post('/admin/catalog_published')):
+            self.assertEqual(res.status_code, 403)
+            self.assertEqual(res.headers['X-CFDE-Error'], "Administrative access required")
+        self.assertEqual(len(api.result_cache.entries()), 3)
+
+    def test_list(self):
+        app_support.log_in(app_support.ADMIN)
+        doc = self.client.get('/admin/cache?catalogId=1').get_json()
+        self.assertEqual([(e['catalog_id'], e['route'], e['entries']) for e in doc['summary']],
+                         [('1', 'all_dcc_info', 1), ('1', 'dcc_grouped_stats', 1)])
+        self.assertEqual(sorted(e['route'] for e in doc['entries']), ['all_dcc_info', 'dcc_grouped_stats'])
+        self.assertEqual(len(self.client.get('/admin/cache?limit=1').get_json()['entries']), 1)
+
+    def test_purge(self):
+        app_support.log_in(app_support.ADMIN)
+        self.assertEqual(self.client.delete('/admin/cache?route=all_dcc_info').get_json(), { 'purged': 2 })
+        self.assertEqual([e['route'] for e in api.result_cache.entries()], ['dcc_grouped_stats'])
+        self.assertEqual(self.client.delete('/admin/cache').get_json(), { 'purged': 1 })
+
+    def test_warm_up(self):
+        app_support.log_in(app_support.ADMIN)
+        res = self.client.post('/admin/warmup')
+        self.assertEqual(res.status_code, 202)
+        self.assertTrue(res.get_json()['started_now'])
+
+    def test_catalog_published(self):
+        res = self.client.post('/admin/catalog_published', json={ 'catalogId': 1 },
+                               headers={ 'Authorization': 'Bearer ' + app_support.RELEASE_TOKEN })
+        self.assertEqual(res.status_code, 202)
+        self.assertEqual(res.get_json(), { 'catalogId': '1', 'purged': 2, 'snaptime': None, 'warmup_started': True })
+        self.assertEqual([e['catalog_id'] for e in api.result_cache.entries()], ['2'])
+
+    def test_catalog_published_token(self):
+        for auth in ('Bearer wrong-token', app_support.RELEASE_TOKEN, ''):
+            res = self.client.post('/admin/catalog_published?catalogId=1', headers={ 'Authorization': auth })
+            self.assertEqual(res.status_code, 403)
+        self.assertEqual(len(api.result_cache.entries()), 3)
+
+class InvalidationTest(unittest.TestCase):
+
+    def setUp(self):
+        app_support.reset()
+        self.client = api.app.test_client()
+
+    def test_purge_by_another_process_is_applied_before_the_next_request(self):
+        api.timeseries_snaptimes.update({ '1': ('2WG-7RJ8-8F8P', 0.0), '2': ('2WG-7RJ8-8F8P', 0.0) })
+        # as published by the process that served DELETE /admin/cache?catalogId=1
+        api.result_cache.invalidate('1')
+        self.assertEqual(sorted(api.timeseries_snaptimes), ['1', '2'])
+        self.client.get('/health')
+        self.assertEqual(sorted(api.timeseries_snaptimes), ['2'])
+
+    def test_purge_is_published(self):
+        app_support.log_in(app_support.ADMIN)
+        seen = api.result_cache.last_invalidation()
+        res = self.client.delete('/admin/cache?catalogId=1')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([catalog_id for seq, catalog_id in api.result_cache.invalidations(seen)], ['1'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#
+# Tests of the cross-process result cache (dashboard/cache.py).
+#
+import os
+import tempfile
+import unittest
+
+from dashboard import cache
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix='dashboard-test-')
+        self.cache = cache.ResultCache(os.path.join(directory, 'cache.sqlite'), max_entries=3,
+                                       stale_max_entries=2, stale_max_age=3600)
+        self.cache.TRIM_EVERY = 1
+
+    def tearDown(self):
+        self.cache.close()
+
+    def test_last_good_responses_do_not_displace_results(self):
+        for i in range(3):
+            self.cache.put('result %d' % i, '1', 'route', b'result', 'application/json')
+        for i in range(5):
+            self.cache.put_last_good('last-good %d' % i, '1', 'route', b'stale', 'application/json')
+        for i in range(3):
+            self.assertEqual(self.cache.get('result %d' % i), (b'result', 'application/json'))
+        self.assertIsNone(self.cache.get_last_good('last-good 0'))
+        self.assertEqual(self.cache.get_last_good('last-good 4'), (b'stale', 'application/json'))
+        self.assertIsNone(self.cache.get('last-good 4'))
+
+    def test_last_good_responses_expire(self):
+        self.cache.put_last_good('last-good', '1', 'route', b'stale', 'application/json')
+        self.cache.stale_max_age = 0
+        self.assertIsNone(self.cache.get_last_good('last-good'))
+
+    def test_lookups_are_counted(self):
+        self.cache.put('result', '1', 'route', b'result', 'application/json')
+        self.cache.get('result', '1', 'route')
+        self.cache.get('missing', '1', 'route')
+        summary = self.cache.summary()
+        self.assertEqual([(e['entries'], e['hits'], e['misses']) for e in summary], [(1, 1, 1)])
+        self.assertEqual([e['hits'] for e in self.cache.entries()], [1])
+
+    def test_purge_includes_last_good_responses(self):
+        self.cache.put('1@X public /dcc/a/stats?', '1', 'route', b'result', 'application/json')
+        self.cache.put_last_good('last-good public /dcc/a/stats?', '1', 'route', b'stale', 'application/json')
+        self.cache.put_last_good('last-good public /dcc/b/stats?', '1', 'route', b'stale', 'application/json')
+        self.assertEqual(self.cache.purge(dcc_id='a'), 2)
+        self.assertEqual([e['kind'] for e in self.cache.entries()], ['last_good'])
+
+    def test_invalidations_are_seen_by_other_processes(self):
+        other = cache.ResultCache(self.cache.path)
+        self.addCleanup(other.close)
+        seen = other.last_invalidation()
+        first = self.cache.invalidate('1')
+        second = self.cache.invalidate(None)
+        self.assertEqual(other.invalidations(seen), [(first, '1'), (second, None)])
+        self.assertEqual(other.invalidations(second), [])
+        self.assertEqual(other.last_invalidation(), second)
+
+if __name__ == '__main__':
+    unittest.main()
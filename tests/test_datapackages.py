@@ -0,0 +1,42 @@
+#
+# Tests of the index of anonymously visible registry datapackages (_datapackage_index()).
+#
+import unittest
+from unittest import mock
+
+import app_support
+from app_support import api, catalogs
+
+class DatapackageIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        app_support.reset()
+        api.datapackage_index = (None, 0.0, {})
+        api._get_catalog('registry')
+        catalogs.reset()
+
+    def index(self):
+        with api.app.test_request_context():
+            return api._datapackage_index()
+
+    def test_index_is_reused_without_snaptime_lookups(self):
+        self.assertEqual(self.index()['3']['review_summary_url'], 'https://app.nih-cfde.org/dcc_review.html?catalogId=3')
+        self.index()
+        self.assertEqual(catalogs.stats(), { 'attribute': 1, 'total': 1 })
+
+    def test_index_is_rebuilt_once_too_old(self):
+        with mock.patch.dict(api.app.config, { 'DATAPACKAGE_INDEX_MAX_AGE': 0 }):
+            self.index()
+            self.index()
+        self.assertEqual(catalogs.stats(), { 'attribute': 2, 'total': 2 })
+
+    def test_index_is_read_anonymously_in_dev_mode(self):
+        with mock.patch.object(api, 'webauthn_token', 'dev-token'), mock.patch.dict(api.catalogs, clear=True):
+            self.index()
+            cookies = { key: str(catalog._session.cookies) for key, (catalog, builder) in api.catalogs.items() }
+            self.assertEqual(list(cookies), ['registry anonymous'])
+            self.assertNotIn('dev-token', cookies['registry anonymous'])
+            self.assertIn('dev-token', str(api._get_catalog('registry')[0]._session.cookies))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+#
+# Tests of the streamed statistics export (/export/stats/...).
+#
+import csv
+import io
+import json
+import unittest
+from unittest import mock
+
+import app_support
+from app_support import api, catalogs
+
+@unittest.skipUnless(app_support.HAS_CFDE_DERIVA, "cfde_deriva is not installed")
+class ExportStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        app_support.reset()
+        self.client = api.app.test_client()
+
+    def test_csv_matches_ndjson(self):
+        res = self.client.get('/export/stats/files/anatomy?format=csv')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/csv')
+        self.assertEqual(res.headers['Content-Disposition'], 'attachment; filename="stats-files-anatomy.csv"')
+        rows = list(csv.reader(io.StringIO(res.get_data(as_text=True))))
+        self.assertEqual(rows[0], ['anatomy', 'dcc', 'num_files'])
+
+        res = self.client.get('/export/stats/files/anatomy')
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        records = [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+        self.assertTrue(records)
+        self.assertEqual([[str(record[c]) for c in rows[0]] for record in records], rows[1:])
+
+    def test_dcc_is_not_repeated(self):
+        res = self.client.get('/export/stats/subjects/dcc/anatomy?format=csv')
+        self.assertEqual(res.get_data(as_text=True).splitlines()[0], 'dcc,anatomy,num_subjects')
+        self.assertEqual(res.headers['Content-Disposition'], 'attachment; filename="stats-subjects-dcc-anatomy.csv"')
+
+    def test_upstream_error_is_not_a_truncated_download(self):
+        self.client.get('/export/stats/files/anatomy')
+        catalogs.error_rate = 1
+        # upstream calls are retried until the deadline
+        with mock.patch.dict(api.app.config, { 'REQUEST_DEADLINE': 0.5 }):
+            res = self.client.get('/export/stats/files/anatomy?format=csv')
+        self.assertEqual(res.status_code, 504)
+        self.assertNotEqual(res.mimetype, 'text/csv')
+
+    def test_illegal_requests(self):
+        self.assertEqual(self.client.get('/export/stats/files/anatomy?format=xml').status_code, 400)
+        self.assertEqual(self.client.get('/export/stats/things/anatomy').status_code, 404)
+        self.assertEqual(self.client.get('/export/stats/files/anatomy/anatomy').status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
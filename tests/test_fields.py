@@ -0,0 +1,45 @@
+#
+# Tests of the fields parameter of /dcc_info and /dcc/{dccId}.
+#
+import json
+import unittest
+
+import app_support
+from app_support import api, catalogs
+
+@unittest.skipUnless(app_support.HAS_CFDE_DERIVA, "cfde_deriva is not installed")
+class FieldsTest(unittest.TestCase):
+
+    def setUp(self):
+        app_support.reset()
+        self.client = api.app.test_client()
+        # the catalog binding and model aren't what's being counted
+        self.client.get('/dcc/cfde_dcc:1?fields=id')
+        catalogs.reset()
+
+    def get(self, path):
+        res = self.client.get(path)
+        self.assertEqual(res.status_code, 200)
+        return json.loads(res.get_data())
+
+    def test_dcc_info_fields(self):
+        self.assertEqual(self.get('/dcc_info?fields=catalog_id'), { 'catalog_id': api.DEFAULT_CATALOG_ID })
+        self.assertNotIn('aggregate', catalogs.stats())
+        self.assertEqual(list(self.get('/dcc_info?fields=gene_count,subject_count')), ['subject_count', 'gene_count'])
+        self.assertEqual(list(self.get('/dcc_info')), list(api.CATALOG_INFO_FIELDS))
+
+    def test_dcc_fields(self):
+        self.assertEqual(self.get('/dcc/cfde_dcc:1?fields=description, id'),
+                         { 'id': 'cfde_dcc:1', 'description': 'dcc dcc_description 1' })
+        # no counts, and no registry lookup
+        self.assertEqual(catalogs.stats(), { 'attribute': 1, 'total': 1 })
+        self.assertEqual(list(self.get('/dcc/cfde_dcc:1')), list(api.DCC_INFO_FIELDS))
+
+    def test_illegal_fields(self):
+        for path in ('/dcc_info?fields=catalog_id,RID', '/dcc/cfde_dcc:1?fields=', '/dcc/cfde_dcc:1?fields=name'):
+            res = self.client.get(path)
+            self.assertEqual(res.status_code, 400)
+            self.assertTrue(res.headers['X-CFDE-Error'].startswith("Illegal fields requested"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#
+# Tests of asynchronous jobs (?async=true and /jobs/<id>).
+#
+import json
+import re
+import threading
+import time
+import unittest
+from unittest import mock
+
+import app_support
+from app_support import api
+
+class JobTest(unittest.TestCase):
+
+    def setUp(self):
+        app_support.reset()
+        app_support.log_in('https://auth.globus.org/user-a')
+        self.client = api.app.test_client(use_cookies=False)
+        # jobs don't start until released, so that their requests see them unfinished
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        run_job = api._run_job
+        def held_job(*args):
+            self.release.wait(5)
+            run_job(*args)
+        for patcher in (mock.patch.object(api, 'async_job_routes', [re.compile(r'^/user/saved_queries')]),
+                        mock.patch.object(api, '_run_job', held_job)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self, path, session=None):
+        return self.client.get(path, headers={ 'Cookie': 'webauthn=' + session } if session else {})
+
+    def wait(self, job_id, session):
+        self.release.set()
+        for i in range(100):
+            res = self.get('/jobs/' + job_id, session)
+            if res.headers['X-CFDE-Job-Status'] not in ('pending', 'running'):
+                return res
+            time.sleep(0.05)
+        self.fail("job %s did not finish" % job_id)
+
+    def test_job_result(self):
+        res = self.get('/user/saved_queries?async=true', 'session-a')
+        self.assertEqual(res.status_code, 202)
+        job_id = json.loads(res.get_data())['job_id']
+        self.assertEqual(res.headers['Location'], '/jobs/' + job_id)
+        self.assertEqual(self.get('/jobs/' + job_id, 'session-a').headers['X-CFDE-Job-Status'], 'pending')
+
+        res = self.wait(job_id, 'session-a')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-CFDE-Job-Status'], 'done')
+        self.assertEqual(res.get_json(), self.get('/user/saved_queries', 'session-a').get_json())
+
+    def test_jobs_are_only_visible_to_their_caller(self):
+        job_id = json.loads(self.get('/user/saved_queries?async=true', 'session-a').get_data())['job_id']
+        for session in ('session-b', None):
+            res = self.get('/jobs/' + job_id, session)
+            self.assertEqual(res.status_code, 404)
+            self.assertEqual(res.headers['X-CFDE-Error'], "Job '" + job_id + "' not found")
+        self.assertEqual(self.wait(job_id, 'session-a').status_code, 200)
+
+    def test_identical_requests_share_a_job(self):
+        first = json.loads(self.get('/user/saved_queries?async=true', 'session-a').get_data())['job_id']
+        second = json.loads(self.get('/user/saved_queries?async=true', 'session-a').get_data())['job_id']
+        other = json.loads(self.get('/user/saved_queries?async=true', 'session-b').get_data())['job_id']
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        for job_id, session in ((first, 'session-a'), (other, 'session-b')):
+            self.wait(job_id, session)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#
+# Tests of keyset pagination of the user list routes (_paged_json_response()).
+#
+import re
+import unittest
+
+import app_support
+from app_support import api, catalogs
+
+class PaginationTest(unittest.TestCase):
+
+    def setUp(self):
+        app_support.reset()
+        app_support.log_in('https://auth.globus.org/user-a')
+        self.client = api.app.test_client()
+        # the registry binding and model aren't what's being counted
+        self.client.get('/user/saved_queries?limit=1')
+        catalogs.reset()
+
+    def names(self, res):
+        self.assertEqual(res.status_code, 200)
+        return [row['name'] for row in res.get_json()]
+
+    def test_all_rows_are_streamed_in_pages(self):
+        names = self.names(self.client.get('/user/saved_queries'))
+        self.assertEqual(names, ['saved_query name %d' % (i + 1) for i in range(20)])
+        # 20 rows at USER_LIST_PAGE_SIZE = 4, and an empty page to find there are no more
+        self.assertEqual(catalogs.stats()['entity'], 6)
+
+    def test_limit_and_link_to_next_page(self):
+        pages = []
+        path = '/user/saved_queries?limit=6'
+        while path is not None:
+            res = self.client.get(path)
+            pages.append(self.names(res))
+            m = re.match(r'^<([^>]+)>; rel="next"$', res.headers.get('Link', ''))
+            path = m.group(1) if m else None
+        self.assertEqual([len(page) for page in pages], [6, 6, 6, 2])
+        self.assertEqual(sum(pages, []), self.names(self.client.get('/user/saved_queries')))
+
+    def test_after(self):
+        res = self.client.get('/user/saved_queries?limit=2&after=1-0004')
+        self.assertEqual(self.names(res), ['saved_query name 6', 'saved_query name 7'])
+        self.assertEqual(res.headers['Link'], '</user/saved_queries?limit=2&after=1-0006>; rel="next"')
+
+    def test_invalid_limit(self):
+        for limit in ('0', 'all'):
+            res = self.client.get('/user/saved_queries?limit=' + limit)
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(res.headers['X-CFDE-Error'], "Invalid limit '" + limit + "'")
+
+if __name__ == '__main__':
+    unittest.main()
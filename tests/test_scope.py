@@ -0,0 +1,30 @@
+#
+# Tests of the partition (scope) under which results are cached (_cache_scope(), _identity_key()).
+#
+import unittest
+
+import app_support
+from app_support import api
+
+class IdentityKeyTest(unittest.TestCase):
+
+    def identity_key(self, **headers):
+        with api.app.test_request_context(headers=headers):
+            return api._identity_key()
+
+    def test_anonymous(self):
+        self.assertEqual(self.identity_key(), "anonymous")
+        self.assertEqual(self.identity_key(Cookie='AWSALB=abc'), "anonymous")
+
+    def test_other_cookies_are_ignored(self):
+        key = self.identity_key(Cookie='webauthn=session-1')
+        self.assertNotEqual(key, "anonymous")
+        self.assertEqual(self.identity_key(Cookie='AWSALB=abc; webauthn=session-1; _ga=1'), key)
+        self.assertNotEqual(self.identity_key(Cookie='webauthn=session-2'), key)
+
+    def test_bearer_token(self):
+        key = self.identity_key(Authorization='Bearer token-1')
+        self.assertNotIn(key, ("anonymous", self.identity_key(Authorization='Bearer token-2')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#
+# Tests of catalog change detection (dashboard/snaptimes.py) through a shared cache.SnaptimeStore.
+#
+import os
+import tempfile
+import unittest
+
+from dashboard import cache, snaptimes
+
+class SharedSnaptimeTest(unittest.TestCase):
+    """Two pollers (as in two API processes) sharing one SnaptimeStore"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='dashboard-test-')
+        self.path = os.path.join(self.directory, 'cache.sqlite')
+        self.current = { '1': 'AAA' }
+        self.fetched = []
+        self.stores = [cache.SnaptimeStore(self.path), cache.SnaptimeStore(self.path)]
+        self.pollers = [snaptimes.SnaptimePoller(self.fetch, 60, store) for store in self.stores]
+        for poller in self.pollers:
+            # watched, and marked as running in this process so that no poller thread is
+            # started (it could use a store after tearDown() closes it); the tests call poll()
+            poller._watched.add('1')
+            poller._pid = os.getpid()
+
+    def tearDown(self):
+        for poller in self.pollers:
+            poller.stop()
+        for store in self.stores:
+            store.close()
+
+    def fetch(self, catalog_id):
+        self.fetched.append(catalog_id)
+        return self.current[catalog_id]
+
+    def test_put_updates_the_catalogs_row(self):
+        store = self.stores[0]
+        store.put('1', 'AAA', 100.0)
+        store.put('1', 'BBB', 200.0)
+        self.assertEqual(store.get_all(), { '1': ('BBB', 200.0) })
+
+    def test_one_poller_checks_and_the_other_shares_its_answer(self):
+        first, second = self.pollers
+        first.poll()
+        second.poll()
+        self.assertEqual(self.fetched, ['1'])
+        self.assertEqual(first.snaptime('1'), 'AAA')
+        self.assertEqual(second.snaptime('1'), 'AAA')
+
+    def test_refresh_reaches_the_other_poller(self):
+        first, second = self.pollers
+        first.poll()
+        second.poll()
+        changes = []
+        second.on_change(lambda catalog_id, old, new: changes.append((catalog_id, old, new)))
+
+        self.current['1'] = 'BBB'
+        self.assertEqual(first.refresh('1'), 'BBB')
+        second.poll()
+        self.assertEqual(second.snaptime('1'), 'BBB')
+        self.assertEqual(changes, [('1', 'AAA', 'BBB')])
+        self.assertEqual(self.fetched, ['1', '1'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#
+# Tests of stale responses (SERVE_STALE) served while an upstream is failing.
+#
+import unittest
+from unittest import mock
+
+import requests
+
+import app_support
+from app_support import api, catalogs
+
+OLD_SNAPTIME = '2WG-7RJ8-8F8P'
+NEW_SNAPTIME = '2WG-7RJ8-9ABC'
+
+@unittest.skipUnless(app_support.HAS_CFDE_DERIVA, "cfde_deriva is not installed")
+class StaleResponseTest(unittest.TestCase):
+
+    def setUp(self):
+        app_support.reset()
+        self.client = app_support.app.test_client()
+        for patch in [mock.patch.dict(api.app.config, { 'SERVE_STALE': True }),
+                      mock.patch.object(api, 'PIN_SNAPTIME', True)]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def get(self, path, snaptime):
+        with mock.patch.object(api, '_current_snaptime', return_value=snaptime):
+            return self.client.get(path)
+
+    def test_stale_response_is_not_cached_as_the_new_snapshot(self):
+        self.assertEqual(self.get('/dcc', OLD_SNAPTIME).status_code, 200)
+
+        catalogs.error_rate = 1.0
+        res = self.get('/dcc', NEW_SNAPTIME)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers.get('X-CFDE-Stale'), 'true')
+        self.assertEqual(res.headers.get('Cache-Control'), 'no-store')
+        self.assertIsNone(res.headers.get('X-CFDE-Snaptime'))
+
+        catalogs.error_rate = 0
+        catalogs.reset()
+        res = self.get('/dcc', NEW_SNAPTIME)
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNone(res.headers.get('X-CFDE-Stale'))
+        self.assertEqual(res.headers.get('X-CFDE-Snaptime'), NEW_SNAPTIME)
+        self.assertGreater(catalogs.stats().get('total', 0), 0)
+
+    def test_failed_snaptime_lookup_is_served_stale(self):
+        self.assertEqual(self.get('/dcc', OLD_SNAPTIME).status_code, 200)
+
+        response = requests.Response()
+        response.status_code = 503
+        failure = requests.HTTPError("503 Server Error", response=response)
+        with mock.patch.object(api, '_current_snaptime', side_effect=failure):
+            res = self.client.get('/dcc')
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.headers.get('X-CFDE-Stale'), 'true')
+
+            api.app.config['SERVE_STALE'] = False
+            res = self.client.get('/dcc')
+            self.assertEqual(res.status_code, 503)
+            self.assertEqual(res.headers.get('X-CFDE-Error'), "503 Server Error")
+
+if __name__ == '__main__':
+    unittest.main()
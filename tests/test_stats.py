@@ -0,0 +1,86 @@
+#
+# Tests of the reduction of StatsQuery2 results to grouped counts (_compact_stats() and the
+# stats cube cache).
+#
+import unittest
+
+import app_support
+from app_support import api, catalogs
+
+SNAPTIME = '2WG-7RJ8-8F8P'
+
+def dimension(nid, name):
+    return None if nid is None else { 'nid': nid, 'id': 'term:%d' % nid, 'name': name, 'description': 'x' * 200 }
+
+class RowsQuery(object):
+    """Stands in for a StatsQuery2 whose fetch_flattened() returns rows"""
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetch_flattened(self, headers=None):
+        return iter(self.rows)
+
+class CompactStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [
+            { 'anatomy': dimension(3, 'brain'), 'sex': dimension(2, 'male'), 'num_files': 5 },
+            { 'anatomy': dimension(1, 'heart'), 'sex': None, 'num_files': 7 },
+            { 'anatomy': dimension(3, 'brain'), 'sex': dimension(1, 'female'), 'num_files': None },
+            { 'anatomy': None, 'sex': dimension(2, 'male'), 'num_files': 2 },
+            { 'anatomy': dimension(3, 'brain'), 'sex': dimension(2, 'male'), 'num_files': 1 },
+        ]
+
+    def compact(self, rows, groupings):
+        with api.app.test_request_context():
+            return api._compact_stats(RowsQuery(rows), groupings, 'num_files')
+
+    def test_rows_are_reduced_to_nids_and_summed(self):
+        counts, labels = self.compact(self.rows, ['anatomy', 'sex'])
+        self.assertEqual(list(counts.items()), [((None, 2), 2), ((1, None), 7), ((3, 1), 0), ((3, 2), 6)])
+        self.assertEqual(labels, { 'anatomy': { 3: 'brain', 1: 'heart' }, 'sex': { 2: 'male', 1: 'female' } })
+
+    def test_result_does_not_depend_on_row_order(self):
+        self.assertEqual(list(self.compact(self.rows, ['anatomy', 'sex'])[0].items()),
+                         list(self.compact(self.rows[::-1], ['anatomy', 'sex'])[0].items()))
+
+    def test_reordered_cube_matches_the_query_in_that_order(self):
+        counts, labels = self.compact(self.rows, ['anatomy', 'sex'])
+        reordered, _ = api._reorder_stats(('anatomy', 'sex'), counts, labels, ['sex', 'anatomy'])
+        direct, _ = self.compact(self.rows, ['sex', 'anatomy'])
+        self.assertEqual(list(reordered.items()), list(direct.items()))
+
+@unittest.skipUnless(app_support.HAS_CFDE_DERIVA, "cfde_deriva is not installed")
+class StatsCubeTest(unittest.TestCase):
+
+    def setUp(self):
+        app_support.reset()
+        self.client = app_support.app.test_client()
+
+    def get(self, path):
+        res = self.client.get(path)
+        self.assertEqual(res.status_code, 200)
+        return res.get_json(force=True)
+
+    def test_drill_down_reuses_the_pinned_cube(self):
+        rows = self.get('/stats/files/anatomy?includeDCC=true&snaptime=' + SNAPTIME)
+        dcc = rows[0]['dcc']
+        catalogs.reset()
+        filtered = self.get('/stats/files/anatomy?dcc=%s&snaptime=%s' % (dcc, SNAPTIME))
+        self.assertEqual(catalogs.stats(), {})
+
+        expected = {}
+        for row in rows:
+            if row['dcc'] == dcc:
+                expected[row['anatomy']] = row['num_files']
+        self.assertEqual({ row['anatomy']: row['num_files'] for row in filtered }, expected)
+
+    def test_unpinned_requests_do_not_look_up_the_snaptime(self):
+        self.get('/stats/files/anatomy?includeDCC=true')
+        catalogs.reset()
+        self.get('/stats/files/anatomy?includeDCC=true')
+        self.assertNotIn('catalog', catalogs.stats())
+        self.assertEqual(api.stats_cubes, {})
+
+if __name__ == '__main__':
+    unittest.main()
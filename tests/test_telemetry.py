@@ -0,0 +1,41 @@
+#
+# Tests of the metrics shared by all API processes on a host (dashboard/telemetry.py).
+#
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from dashboard import telemetry
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='dashboard-test-')
+
+    def metrics(self):
+        m = telemetry.Metrics()
+        m.configure(self.directory, 0)
+        return m
+
+    def write(self, pid, value):
+        doc = { 'counters': [['dashboard_requests_total', '[]', value]], 'histograms': [] }
+        with open(os.path.join(self.directory, 'metrics-%d-0.json' % pid), 'w') as f:
+            json.dump(doc, f)
+
+    def test_processes_are_counted_once(self):
+        exited = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                                capture_output=True, text=True).stdout
+        self.write(int(exited), 2)
+        self.write(os.getppid(), 3)
+        m = self.metrics()
+        m.inc('dashboard_requests_total', {})
+        for i in range(2):
+            self.assertIn('dashboard_requests_total 6.0', m.render().splitlines())
+        self.assertEqual(sorted(f for f in os.listdir(self.directory) if f.endswith('.json')),
+                         ['metrics-%d-0.json' % os.getppid(), telemetry.ARCHIVE_FILE])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#
+# Tests of time series across catalogs (/timeseries/...).
+#
+import json
+import unittest
+
+import app_support
+from app_support import api, catalogs
+
+class TimeseriesRequestTest(unittest.TestCase):
+
+    def setUp(self):
+        app_support.reset()
+        self.client = api.app.test_client()
+
+    def test_only_timeseries_routes(self):
+        res = self.client.get('/timeseries/user/saved_queries?catalogIds=1')
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(res.headers['X-CFDE-Error'], "No time series available for '/user/saved_queries'")
+
+    def test_illegal_catalog_ids(self):
+        for catalog_ids in ('', '3-1', '1,x', '1-51'):
+            res = self.client.get('/timeseries/dcc_info?catalogIds=' + catalog_ids)
+            self.assertEqual(res.status_code, 400, catalog_ids)
+
+    def test_parse_catalog_ids(self):
+        self.assertEqual(api._parse_catalog_ids('1, 2,5-7,2', 50), ['1', '2', '5', '6', '7'])
+        self.assertIsNone(api._parse_catalog_ids('1-3', 2))
+
+@unittest.skipUnless(app_support.HAS_CFDE_DERIVA, "cfde_deriva is not installed")
+class TimeseriesTest(unittest.TestCase):
+
+    def setUp(self):
+        app_support.reset()
+        self.client = api.app.test_client()
+
+    def points(self, path):
+        res = self.client.get(path)
+        self.assertEqual(res.status_code, 200)
+        return json.loads(res.get_data())
+
+    def test_points(self):
+        points = self.points('/timeseries/dcc_info?catalogIds=3,1-2&fields=catalog_id')
+        self.assertEqual([(p['catalogId'], p['status'], p['result']) for p in points],
+                         [(3, 200, { 'catalog_id': 3 }), (1, 200, { 'catalog_id': 1 }), (2, 200, { 'catalog_id': 2 })])
+        self.assertEqual(set(p['snaptime'] for p in points), { catalogs.snaptime })
+        self.assertTrue(all(p['timestamp'].startswith('20') for p in points))
+
+    def test_points_are_reused(self):
+        first = self.points('/timeseries/dcc_info?catalogIds=1-3&fields=catalog_id')
+        catalogs.reset()
+        self.assertEqual(self.points('/timeseries/dcc_info?catalogIds=1-3&fields=catalog_id'), first)
+        # snaptimes within TIMESERIES_SNAPTIME_MAX_AGE, and results from the snapshot cache
+        self.assertEqual(catalogs.stats(), {})
+
+    def test_failed_point(self):
+        self.points('/timeseries/dcc_info?catalogIds=1&fields=catalog_id')
+        api._forget_catalog(None)
+        catalogs.error_rate = 1
+        points = self.points('/timeseries/dcc_info?catalogIds=1&fields=catalog_id')
+        self.assertEqual([(p['catalogId'], p['status'], p['snaptime']) for p in points], [(1, 500, None)])
+
+if __name__ == '__main__':
+    unittest.main()
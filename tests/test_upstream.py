@@ -0,0 +1,69 @@
+#
+# Tests of the circuit breakers and per-request memo around upstream calls (dashboard/upstream.py).
+#
+import contextvars
+import threading
+import time
+import unittest
+
+import flask
+import requests
+
+from dashboard import upstream
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        upstream.configure_circuit_breakers(window=60, min_calls=3, failure_rate=0.5, slow_call_ms=10000,
+                                            open_seconds=30)
+
+    def tearDown(self):
+        upstream.set_deadline(None)
+        upstream.breaker_settings = None
+        upstream.breakers.clear()
+
+    def call(self, fn):
+        try:
+            upstream.call('test', 'http://upstream.test/', {}, fn)
+        except (requests.exceptions.RequestException, upstream.DeadlineExceeded):
+            pass
+
+    def test_server_errors_open_the_circuit(self):
+        def fail():
+            raise requests.exceptions.ConnectionError("connection refused")
+        for i in range(3):
+            self.call(fail)
+        self.assertEqual(upstream.breaker('test').state, upstream.CircuitBreaker.OPEN)
+        with self.assertRaises(upstream.CircuitOpen):
+            upstream.call('test', 'http://upstream.test/', {}, fail)
+
+    def test_calls_cut_short_by_the_deadline_do_not_open_the_circuit(self):
+        def read_timeout():
+            time.sleep(0.02)
+            raise requests.exceptions.ReadTimeout("read timed out")
+        for i in range(3):
+            upstream.set_deadline(0.01)
+            self.call(read_timeout)
+        self.assertEqual(upstream.breaker('test').state, upstream.CircuitBreaker.CLOSED)
+
+class MemoTest(unittest.TestCase):
+
+    def test_memo_is_shared_with_subquery_threads(self):
+        app = flask.Flask(__name__)
+        with app.app_context():
+            def subquery(i):
+                for j in range(50):
+                    upstream.call('test', 'http://upstream.test/%d/%d' % (i, j), {}, lambda: j)
+                    upstream.call('test', 'http://upstream.test/%d/%d' % (i, j), {}, lambda: None)
+            # as _fetch_all() in dashboard_api.py runs subqueries
+            threads = [threading.Thread(target=contextvars.copy_context().run, args=(subquery, i)) for i in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(upstream.timings()['test'][0], 400)
+            self.assertEqual(upstream.memo_hits(), 400)
+            self.assertEqual(upstream.call('test', 'http://upstream.test/7/49', {}, lambda: None), 49)
+
+if __name__ == '__main__':
+    unittest.main()